@@ -1,5 +1,12 @@
 from .datatable import *
 from .dataframe import *
+from .columnar import *
+from .ringbuffer import *
+from .mapped import *
+from .snapshot import *
+from .filters import *
+from .aggregates import *
+from .lookups import *
 from .columns import *
 from .common import *
 
@@ -8,5 +15,13 @@ DataTable
 DataTableColumn
 DataTableDivider
 DataTableText
+DataTableCursor
 DataTableDataFrame
+ColumnarDataFrame
+RingBufferDataFrame
+MappedDataFrame
+FilterExpression
+Field
+Aggregate
+Lookup
 """.split()
@@ -0,0 +1,258 @@
+import logging
+logger = logging.getLogger("panwid.datatable")
+import copy
+import math
+import numbers
+from collections import Counter
+
+
+class Aggregate(object):
+
+    # Footer aggregate that is kept up to date as rows are added, changed and
+    # removed.  The value each row contributed is remembered, so a change only
+    # has to take the old value out and put the new one in.
+
+    SCOPES = ["all", "filtered"]
+
+    def __init__(self, scope="all"):
+        if scope not in self.SCOPES:
+            raise ValueError("unknown aggregate scope: %s" %(scope))
+        self.scope = scope
+        self.values = {}
+        self.reset()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} ({self.scope}): {self.value!r}>"
+
+    def __call__(self, column, values):
+        # also usable as a plain footer_fn
+        aggregate = self.copy()
+        for value in values:
+            aggregate.add(value)
+        return aggregate.value
+
+    def copy(self):
+        other = copy.copy(self)
+        other.values = {}
+        other.reset()
+        return other
+
+    def accepts(self, value):
+        return value is not None
+
+    def reset(self):
+        pass
+
+    def add(self, value):
+        raise NotImplementedError
+
+    def remove(self, value):
+        raise NotImplementedError
+
+    @property
+    def value(self):
+        raise NotImplementedError
+
+    def clear(self):
+        self.values.clear()
+        self.reset()
+
+    def set(self, index, value):
+        if not self.accepts(value):
+            self.discard(index)
+            return
+        if index in self.values:
+            old = self.values[index]
+            if old == value and type(old) is type(value):
+                return
+            self.remove(old)
+        self.values[index] = value
+        self.add(value)
+
+    def discard(self, index):
+        if index in self.values:
+            self.remove(self.values.pop(index))
+
+
+class Count(Aggregate):
+
+    def add(self, value):
+        pass
+
+    def remove(self, value):
+        pass
+
+    @property
+    def value(self):
+        return len(self.values)
+
+
+class Sum(Aggregate):
+
+    def accepts(self, value):
+        return isinstance(value, numbers.Number)
+
+    def reset(self):
+        self.total = 0
+
+    def add(self, value):
+        self.total += value
+
+    def remove(self, value):
+        self.total -= value
+
+    @property
+    def value(self):
+        return self.total
+
+
+class Mean(Sum):
+
+    @property
+    def value(self):
+        if not self.values:
+            return None
+        return self.total / len(self.values)
+
+
+class Distinct(Aggregate):
+
+    def accepts(self, value):
+        if value is None:
+            return False
+        try:
+            hash(value)
+        except TypeError:
+            return False
+        return True
+
+    def reset(self):
+        self.counts = Counter()
+
+    def add(self, value):
+        self.counts[value] += 1
+
+    def remove(self, value):
+        self.counts[value] -= 1
+        if not self.counts[value]:
+            del self.counts[value]
+
+    @property
+    def value(self):
+        return len(self.counts)
+
+
+class Min(Distinct):
+
+    # the extreme is cached and only searched for again when the row holding
+    # it goes away
+
+    def extreme(self, values):
+        return min(values)
+
+    def reset(self):
+        super().reset()
+        self.result = None
+
+    def add(self, value):
+        super().add(value)
+        if self.result is not None:
+            self.result = self.extreme([self.result, value])
+
+    def remove(self, value):
+        super().remove(value)
+        if value == self.result and value not in self.counts:
+            self.result = None
+
+    @property
+    def value(self):
+        if self.result is None and self.counts:
+            self.result = self.extreme(self.counts)
+        return self.result
+
+
+class Max(Min):
+
+    def extreme(self, values):
+        return max(values)
+
+
+class Percentile(Aggregate):
+
+    # Log-bucketed sketch: each value is counted in a bucket whose bounds are
+    # within the given relative accuracy, so values can be removed again and
+    # the size only depends on the range of the data.
+
+    def __init__(self, q=50, accuracy=0.01, scope="all"):
+        if not 0 <= q <= 100:
+            raise ValueError("percentile must be between 0 and 100")
+        self.q = q
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        super().__init__(scope=scope)
+
+    def accepts(self, value):
+        return (isinstance(value, numbers.Real)
+                and not (isinstance(value, float) and math.isnan(value)))
+
+    def reset(self):
+        self.buckets = Counter()
+
+    def bucket(self, value):
+        if value == 0:
+            return (0, 0)
+        k = math.ceil(math.log(abs(value)) / self.log_gamma)
+        return (1, k) if value > 0 else (-1, -k)
+
+    def bucket_value(self, bucket):
+        sign, k = bucket
+        if not sign:
+            return 0
+        k = k if sign > 0 else -k
+        return sign * 2 * self.gamma ** k / (self.gamma + 1)
+
+    def add(self, value):
+        self.buckets[self.bucket(value)] += 1
+
+    def remove(self, value):
+        bucket = self.bucket(value)
+        self.buckets[bucket] -= 1
+        if not self.buckets[bucket]:
+            del self.buckets[bucket]
+
+    @property
+    def value(self):
+        if not self.values:
+            return None
+        rank = self.q / 100 * (len(self.values) - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                return self.bucket_value(bucket)
+
+
+AGGREGATES = {
+    "count": Count,
+    "sum": Sum,
+    "mean": Mean,
+    "min": Min,
+    "max": Max,
+    "distinct": Distinct,
+    "median": Percentile
+}
+
+
+def make_aggregate(spec):
+    if isinstance(spec, Aggregate):
+        return spec.copy()
+    try:
+        return AGGREGATES[spec]()
+    except KeyError:
+        raise ValueError("unknown aggregate: %s" %(spec))
+
+
+__all__ = [
+    "Aggregate", "Count", "Sum", "Mean", "Min", "Max", "Distinct", "Percentile"
+]
@@ -75,7 +75,7 @@ class DataTableCell(urwid.WidgetWrap):
 
     @property
     def value(self):
-        if self.column.value_fn:
+        if self.column.value_fn and not self.column.calculated:
             row = self.table.get_dataframe_row_object(self.row.index)
             val = self.column.value_fn(self.table, row)
         else:
@@ -85,6 +85,7 @@ class DataTableCell(urwid.WidgetWrap):
     @value.setter
     def value(self, value):
         self.table.df[self.row.index, self.column.name] = value
+        self.table.cells_changed([self.row.index], self.column.name)
 
     @property
     def formatted_value(self):
@@ -229,6 +230,10 @@ class DataTableBodyCell(DataTableCell):
 
     ATTR = "table_row_body"
 
+    @property
+    def formatted_value(self):
+        return self.table.format_cell(self.column, self.row.index, self.width, self.padding)
+
     def update_contents(self):
 
         self.inner = self.table.decorate(
@@ -413,7 +418,13 @@ class DataTableFooterCell(DataTableCell):
     ATTR = "table_row_footer"
 
     def update_contents(self):
-        if self.column.footer_fn and len(self.table.df):
+        if self.column.footer_aggregate:
+            self.contents = self.table.decorate(
+                self.row,
+                self.column,
+                self.column._format(self.table.get_aggregate(self.column).value)
+            )
+        elif self.column.footer_fn and len(self.table.df):
             # self.table.df.log_dump()
             if self.column.footer_arg == "values":
                 footer_arg = self.table.df[self.column.name].to_list()
@@ -0,0 +1,523 @@
+import logging
+logger = logging.getLogger("panwid.datatable")
+from itertools import compress
+from bisect import bisect_left
+
+import raccoon as rc
+from raccoon.sort_utils import sorted_list_indexes
+
+try:
+    import numpy as np
+    HAVE_NUMPY=True
+except ImportError:
+    HAVE_NUMPY=False
+
+from .dataframe import DataTableDataFrame, IndexList
+
+
+def value_kind(v):
+    # bool is a subclass of int, so it has to be checked first
+    t = type(v)
+    if t is bool or (HAVE_NUMPY and isinstance(v, np.bool_)):
+        return "b"
+    elif t is int or (HAVE_NUMPY and isinstance(v, np.integer)):
+        return "i"
+    elif t is float or (HAVE_NUMPY and isinstance(v, np.floating)):
+        return "f"
+    return None
+
+
+class ArrayColumn(object):
+
+    KINDS = {
+        "b": "bool",
+        "i": "int64",
+        "f": "float64"
+    }
+
+    MIN_CAPACITY = 16
+
+    def __init__(self, kind, values=None):
+        self.kind = kind
+        self.dtype = np.dtype(self.KINDS[kind])
+        values = list(values) if values is not None else []
+        arr, mask = self._convert(values)
+        self._length = len(values)
+        self._values = np.zeros(max(self._length, self.MIN_CAPACITY), dtype=self.dtype)
+        self._mask = np.ones(len(self._values), dtype=bool)
+        self._values[:self._length] = arr
+        self._mask[:self._length] = mask
+
+    @classmethod
+    def from_arrays(cls, kind, values, mask):
+        col = cls(kind)
+        col._length = len(values)
+        col._values = np.array(values, dtype=col.dtype)
+        col._mask = np.array(mask, dtype=bool)
+        return col
+
+    @staticmethod
+    def infer(values):
+        # Returns the array kind for a sequence of values, None if every value
+        # is None, or False if the values can't be stored in a typed array.
+        kind = None
+        for v in values:
+            if v is None:
+                continue
+            k = value_kind(v)
+            if not k or (kind and k != kind):
+                return False
+            kind = k
+        return kind
+
+    def accepts(self, value):
+        return value is None or value_kind(value) == self.kind
+
+    def _check(self, value):
+        if not self.accepts(value):
+            raise TypeError("%s not compatible with %s column" %(type(value), self.dtype))
+        if value is not None:
+            try:
+                self.dtype.type(value)
+            except OverflowError:
+                raise TypeError("%r out of range for %s column" %(value, self.dtype))
+
+    def _convert(self, values):
+        if not all(self.accepts(v) for v in values):
+            raise TypeError("values not compatible with %s column" %(self.dtype))
+        mask = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        try:
+            arr = np.array([0 if v is None else v for v in values], dtype=self.dtype)
+        except OverflowError:
+            raise TypeError("values out of range for %s column" %(self.dtype))
+        return arr, mask
+
+    def _reserve(self, length):
+        if length <= len(self._values):
+            return
+        capacity = max(length, len(self._values)*2, self.MIN_CAPACITY)
+        values = np.zeros(capacity, dtype=self.dtype)
+        mask = np.ones(capacity, dtype=bool)
+        values[:self._length] = self._values[:self._length]
+        mask[:self._length] = self._mask[:self._length]
+        self._values, self._mask = values, mask
+
+    def _position(self, i):
+        if i < 0:
+            i += self._length
+        if i < 0 or i >= self._length:
+            raise IndexError("column index out of range")
+        return i
+
+    @property
+    def values(self):
+        return self._values[:self._length]
+
+    @property
+    def mask(self):
+        return self._mask[:self._length]
+
+    @property
+    def nbytes(self):
+        return self._values.nbytes + self._mask.nbytes
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.dtype}: {self.tolist()}>"
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            values = self.values[key].tolist()
+            for i in np.flatnonzero(self.mask[key]):
+                values[i] = None
+            return values
+        i = self._position(key)
+        if self._mask[i]:
+            return None
+        return self._values[i].item()
+
+    def __setitem__(self, key, value):
+        i = self._position(key)
+        self._check(value)
+        if value is None:
+            self._mask[i] = True
+        else:
+            self._values[i] = value
+            self._mask[i] = False
+
+    def __delitem__(self, key):
+        if isinstance(key, slice) and key == slice(None):
+            self.clear()
+            return
+        keep = np.ones(self._length, dtype=bool)
+        keep[key] = False
+        self.compress(keep)
+
+    def tolist(self):
+        values = self.values.tolist()
+        for i in np.flatnonzero(self.mask):
+            values[i] = None
+        return values
+
+    def copy(self):
+        return self.from_arrays(self.kind, self.values, self.mask)
+
+    def clear(self):
+        self._length = 0
+        self._mask[:] = True
+
+    def append(self, value):
+        self.extend([value])
+
+    def extend(self, values):
+        values = list(values)
+        arr, mask = self._convert(values)
+        self._reserve(self._length + len(values))
+        self._values[self._length:self._length+len(values)] = arr
+        self._mask[self._length:self._length+len(values)] = mask
+        self._length += len(values)
+
+    def insert(self, i, value):
+        self._check(value)
+        if i < 0:
+            i = max(0, i + self._length)
+        i = min(i, self._length)
+        self._reserve(self._length + 1)
+        self._values[i+1:self._length+1] = self._values[i:self._length]
+        self._mask[i+1:self._length+1] = self._mask[i:self._length]
+        self._length += 1
+        self[i] = value
+
+    def put(self, positions, values):
+        arr, mask = self._convert(list(values))
+        positions = np.asarray(positions, dtype=np.intp)
+        self._values[positions] = arr
+        self._mask[positions] = mask
+
+    def take(self, positions):
+        positions = np.asarray(positions, dtype=np.intp)
+        return self.from_arrays(self.kind, self.values[positions], self.mask[positions])
+
+    def compress(self, keep):
+        keep = np.asarray(keep, dtype=bool)
+        self._values = self.values[keep]
+        self._mask = self.mask[keep]
+        self._length = len(self._values)
+
+    def argsort(self, reverse=False):
+        # None sorts after every value, and ties keep their original order in
+        # both directions, like sorted() with a (x is None, x) key.
+        if reverse:
+            order = np.lexsort((self.values[::-1], self.mask[::-1]))
+            return (self._length - 1 - order[::-1]).tolist()
+        return np.lexsort((self.values, self.mask)).tolist()
+
+
+class ColumnarDataFrame(DataTableDataFrame):
+
+    def __init__(self, *args, typed=True, **kwargs):
+        self.typed = typed and HAVE_NUMPY
+        # columns that haven't held a value yet, so their type is unknown
+        self._untyped = set()
+        super().__init__(*args, **kwargs)
+        self._index = IndexList(self._index)
+        self._data = [
+            self._make_column(name, values)
+            for name, values in zip(self._columns, self._data)
+        ]
+
+    @property
+    def index(self):
+        return self._index
+
+    @index.setter
+    def index(self, index_list):
+        self._validate_index(index_list)
+        self._index = IndexList(index_list)
+
+    @property
+    def data(self):
+        return [
+            c.tolist() if isinstance(c, ArrayColumn) else c
+            for c in self._data
+        ]
+
+    def _check_list(self, x):
+        return (
+            isinstance(x, (list, ArrayColumn))
+            or (HAVE_NUMPY and isinstance(x, np.ndarray))
+            or super()._check_list(x)
+        )
+
+    def _make_column(self, name, values):
+        if isinstance(values, ArrayColumn):
+            return values
+        if HAVE_NUMPY and isinstance(values, np.ndarray):
+            values = values.tolist()
+        kind = ArrayColumn.infer(values)
+        if kind is None:
+            self._untyped.add(name)
+        elif kind and self.typed:
+            try:
+                return ArrayColumn(kind, values)
+            except TypeError:
+                pass
+        return list(values) if type(values) is not list else values
+
+    def _retype(self, c):
+        name = self._columns[c]
+        kind = ArrayColumn.infer(self._data[c])
+        if kind is None:
+            return
+        self._untyped.discard(name)
+        if kind and self.typed:
+            try:
+                self._data[c] = ArrayColumn(kind, self._data[c])
+            except TypeError:
+                pass
+
+    def _demote(self, c):
+        self._data[c] = self._data[c].tolist()
+        return self._data[c]
+
+    def _write(self, c, i, value):
+        col = self._data[c]
+        try:
+            col[i] = value
+        except TypeError:
+            self._demote(c)[i] = value
+        if value is not None and self._columns[c] in self._untyped:
+            self._retype(c)
+
+    def _index_map(self):
+        return self._index.positions
+
+    def _read_many(self, c, positions):
+        col = self._data[c]
+        if isinstance(col, ArrayColumn):
+            return col.take(positions).tolist()
+        return [col[i] for i in positions]
+
+    def _write_many(self, c, positions, values):
+        if not len(positions):
+            return
+        col = self._data[c]
+        if isinstance(col, ArrayColumn):
+            try:
+                col.put(positions, values)
+                return
+            except TypeError:
+                col = self._demote(c)
+        for i, v in zip(positions, values):
+            col[i] = v
+        if self._columns[c] in self._untyped:
+            self._retype(c)
+
+    def _extend(self, c, values):
+        col = self._data[c]
+        try:
+            col.extend(values)
+        except TypeError:
+            self._demote(c).extend(values)
+        if self._columns[c] in self._untyped:
+            self._retype(c)
+
+    def _locate(self, index, create=False):
+        try:
+            return self._index.index(index)
+        except ValueError:
+            if not create:
+                raise
+        if self._sort:
+            i = bisect_left(self._index, index)
+            self._insert_row(i, index)
+        else:
+            i = len(self._index)
+            self._add_row(index)
+        return i
+
+    def _column_location(self, column):
+        try:
+            return self._columns.index(column)
+        except ValueError:
+            self._add_column(column)
+            return len(self._columns) - 1
+
+    def _add_column(self, column):
+        super()._add_column(column)
+        self._untyped.add(column)
+
+    def _add_missing_rows(self, indexes):
+        new_indexes = list(dict.fromkeys(x for x in indexes if x not in self._index))
+        if not new_indexes:
+            return
+        self._index.extend(new_indexes)
+        for c in range(len(self._columns)):
+            self._data[c].extend([None] * len(new_indexes))
+
+    def _reorder(self, order):
+        self._index = IndexList([self._index[i] for i in order])
+        self._data = [
+            col.take(order) if isinstance(col, ArrayColumn) else [col[i] for i in order]
+            for col in self._data
+        ]
+
+    def get_cell(self, index, column):
+        return self._data[self._columns.index(column)][self._locate(index)]
+
+    def get_rows(self, indexes, column, as_list=False):
+        c = self._columns.index(column)
+        if indexes and isinstance(indexes[0], bool) and all(isinstance(i, bool) for i in indexes):
+            if len(indexes) != len(self._index):
+                raise ValueError("boolean index list must be same size of existing index")
+            data = list(compress(self._data[c], indexes))
+            index = list(compress(self._index, indexes))
+        else:
+            locations = [self._locate(x) for x in indexes]
+            col = self._data[c]
+            data = [col[i] for i in locations]
+            index = [self._index[i] for i in locations]
+        if as_list:
+            return data
+        return rc.DataFrame(
+            data={column: data}, index=index,
+            index_name=self._index_name, sort=self._sort
+        )
+
+    def get_entire_column(self, column, as_list=False):
+        col = self._data[self._columns.index(column)]
+        data = col.tolist() if isinstance(col, ArrayColumn) else col
+        if as_list:
+            return data
+        return rc.DataFrame(
+            data={column: data}, index=list(self._index),
+            index_name=self._index_name, sort=self._sort
+        )
+
+    def set_cell(self, index, column, value):
+        i = self._locate(index, create=True)
+        self._write(self._column_location(column), i, value)
+
+    def set_row(self, index, values):
+        i = self._locate(index, create=True)
+        if not isinstance(values, dict):
+            raise TypeError("cannot handle values of this type.")
+        if not set(values.keys()).issubset(self._columns):
+            raise ValueError("keys of values are not all in existing columns")
+        for c, column in enumerate(self._columns):
+            if column in values:
+                self._write(c, i, values[column])
+
+    def set_column(self, index=None, column=None, values=None):
+        c = self._column_location(column)
+        if index:
+            if isinstance(index[0], bool) and all(isinstance(i, bool) for i in index):
+                if not self._check_list(values):
+                    values = [values for x in index if x]
+                if len(index) != len(self._index):
+                    raise ValueError("boolean index list must be same size of existing index")
+                if len(values) != index.count(True):
+                    raise ValueError("length of values list must equal number of True entries in index list")
+                positions = [i for i, x in enumerate(index) if x]
+            else:
+                if not self._check_list(values):
+                    values = [values for _ in index]
+                if len(values) != len(index):
+                    raise ValueError("length of values and index must be the same.")
+                if self._sort:
+                    self._insert_missing_rows(index)
+                else:
+                    self._add_missing_rows(index)
+                positions = [self._index.index(x) for x in index]
+            self._write_many(c, positions, values)
+        else:
+            if not self._check_list(values):
+                values = [values for _ in self._index]
+            if len(values) != len(self._index):
+                raise ValueError("values list must be at same length as current index length.")
+            self._untyped.discard(column)
+            self._data[c] = self._make_column(column, values)
+
+    def set_location(self, location, values, missing_to_none=False):
+        if missing_to_none:
+            for column in self._columns:
+                if column not in values:
+                    values[column] = None
+        for column in values:
+            self._write(self._columns.index(column), location, values[column])
+
+    def append_row(self, index, values, new_cols=True):
+        if index in self._index:
+            raise IndexError("index already in DataFrame")
+        if new_cols:
+            for col in values:
+                if col not in self._columns:
+                    self._add_column(col)
+        self._index.append(index)
+        for c, col in enumerate(self._columns):
+            self._extend(c, [values.get(col, None)])
+
+    def delete_rows(self, indexes):
+        indexes = [indexes] if not self._check_list(indexes) else indexes
+        if indexes and isinstance(indexes[0], bool) and all(isinstance(i, bool) for i in indexes):
+            if len(indexes) != len(self._index):
+                raise ValueError("boolean indexes list must be same size of existing indexes")
+            keep = [not x for x in indexes]
+        else:
+            keep = [True] * len(self._index)
+            for x in indexes:
+                keep[self._locate(x)] = False
+        if all(keep):
+            return
+        self._index = IndexList(compress(self._index, keep))
+        for c, col in enumerate(self._data):
+            if isinstance(col, ArrayColumn):
+                col.compress(keep)
+            else:
+                self._data[c] = list(compress(col, keep))
+
+    def delete_columns(self, columns):
+        super().delete_columns(columns)
+        self._untyped.intersection_update(self._columns)
+
+    def sort_index(self):
+        self._reorder(sorted_list_indexes(self._index))
+
+    def sort_columns(self, column, key=None, reverse=False):
+        if self._check_list(column):
+            raise TypeError("Can only sort by a single column  ")
+        col = self._data[self._columns.index(column)]
+        if isinstance(col, ArrayColumn) and key is None:
+            order = col.argsort(reverse=reverse)
+        else:
+            order = sorted_list_indexes(list(col), key, reverse)
+        self._reorder(order)
+
+    def iterrows(self, index=True):
+        columns = [
+            c.tolist() if isinstance(c, ArrayColumn) else c
+            for c in self._data
+        ]
+        for i, key in enumerate(self._index):
+            row = {self._index_name: key} if index else dict()
+            for name, values in zip(self._columns, columns):
+                row[name] = values[i]
+            yield row
+
+    def to_dict(self, index=True, ordered=False):
+        result = super().to_dict(index=index, ordered=ordered)
+        for k, v in result.items():
+            if isinstance(v, ArrayColumn):
+                result[k] = v.tolist()
+        return result
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in self._data if isinstance(c, ArrayColumn))
+
+__all__ = ["ColumnarDataFrame", "ArrayColumn", "IndexList"]
@@ -4,6 +4,7 @@ logger = logging.getLogger("panwid.datatable")
 from datetime import datetime, date as datetype
 
 from .common import *
+from .aggregates import Aggregate
 
 class NoSuchColumnException(Exception):
     pass
@@ -91,15 +92,18 @@ class DataTableColumn(DataTableBaseColumn):
     def __init__(self, name,
                  label=None,
                  value=None,
+                 depends_on=None, vectorized=False,
                  align="left", wrap="space",
                  pack=False,
                  no_clip_header = False,
                  truncate=False,
                  format_fn=None,
+                 format_cache=True, format_cache_size=None,
                  decoration_fn=None,
                  sort_key = None, sort_reverse=False,
                  sort_icon = None,
-                 footer_fn = None, footer_arg = "values", **kwargs):
+                 footer_fn = None, footer_arg = "values",
+                 lookup = None, **kwargs):
 
         super().__init__(**kwargs)
         self.name = name
@@ -111,21 +115,43 @@ class DataTableColumn(DataTableBaseColumn):
                 self.value_fn = value
         else:
             self.value_fn = None
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        self.depends_on = list(depends_on) if depends_on is not None else None
+        self.vectorized = vectorized
         self.align = align
         self.pack = pack
         self.wrap = wrap
         self.no_clip_header = no_clip_header
         self.truncate = truncate
         self.format_fn = format_fn
+        self.format_cache = format_cache
+        self.format_cache_size = format_cache_size
         self.decoration_fn = decoration_fn
         self.sort_key = sort_key
         self.sort_reverse = sort_reverse
         self.sort_icon = sort_icon
         self.footer_fn = footer_fn
         self.footer_arg = footer_arg
+        self.lookup = lookup
         logger.debug(f"column {self.name}, width: {self.sizing}, {self.width}")
 
 
+    @property
+    def footer_aggregate(self):
+        # footer_fn can name a built-in aggregate or be an Aggregate, which
+        # the table keeps up to date instead of recomputing
+        return isinstance(self.footer_fn, (str, Aggregate))
+
+    @property
+    def calculated(self):
+        # values that only depend on the row's data are computed once and
+        # stored in the dataframe; other value_fn columns are evaluated
+        # whenever they're displayed
+        return self.value_fn is not None and (
+            self.depends_on is not None or self.vectorized
+        )
+
     @property
     def contents_width(self):
         try:
@@ -134,17 +160,13 @@ class DataTableColumn(DataTableBaseColumn):
                          if getattr(c, "name", None) == self.name)
         except StopIteration:
             raise Exception(self.name, [ c.name for c in self.table.visible_columns])
-        # logger.info(f"len: {len(self.table.body)}")
-
-        l = [
-            (
-             getattr(r.cells[index].value, "min_width", None)
-             or
-             len(str(r.cells[index].formatted_value))
-            ) + self.padding*2
-            for r in (self.table.body)
-        ] + [self.table.header.cells[index].min_width or 0] + [self.min_width or 0]
-        return max(l)
+
+        # measured from the raw dataframe values, so no row widgets get built
+        return max(
+            self.table.content_width(self) + self.padding*2,
+            self.table.header.cells[index].min_width or 0,
+            self.min_width or 0
+        )
 
     @property
     def minimum_width(self):
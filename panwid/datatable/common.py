@@ -1,5 +1,6 @@
 import urwid
 import itertools
+from collections import OrderedDict
 
 DEFAULT_CELL_PADDING = 0
 
@@ -11,6 +12,119 @@ def partition(pred, iterable):
 
 intersperse = lambda e,l: sum([[x, e] for x in l],[])[:-1]
 
+class FormatCache(object):
+
+    MAX_WIDTHS = 4
+
+    def __init__(self, size=None):
+        self.size = size
+        self.entries = OrderedDict() if size else {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, index, version, width):
+        entry = self.entries.get(index)
+        if entry is None or entry[0] != version:
+            return None
+        if self.size:
+            self.entries.move_to_end(index)
+        return entry[1].get(width)
+
+    def put(self, index, version, width, value):
+        entry = self.entries.get(index)
+        if entry is None or entry[0] != version:
+            entry = (version, {})
+            self.entries[index] = entry
+        elif len(entry[1]) >= self.MAX_WIDTHS:
+            # widths left over from earlier column sizes
+            entry[1].clear()
+        entry[1][width] = value
+        if self.size:
+            self.entries.move_to_end(index)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, indexes):
+        for index in indexes:
+            self.entries.pop(index, None)
+
+    def clear(self):
+        self.entries.clear()
+
+class DataTableCursor(object):
+
+    # Keyset pagination cursor: the sort value and index of the row at the
+    # edge of what has been loaded.  The index breaks ties between rows with
+    # the same sort value, so a query can seek with
+    #
+    #   WHERE (sort, index) > (cursor.value, cursor.index)
+    #   ORDER BY sort, index
+    #
+    # using cursor.operator and cursor.descending, instead of an OFFSET.
+    # Backward pages are sought in the opposite order, but are still returned
+    # in table order.
+
+    DIRECTIONS = ["forward", "backward"]
+
+    def __init__(self, column, value, index, reverse=False, direction="forward"):
+        if direction not in self.DIRECTIONS:
+            raise ValueError("unknown cursor direction: %s" %(direction))
+        self.column = column
+        self.value = value
+        self.index = index
+        self.reverse = bool(reverse)
+        self.direction = direction
+
+    def __repr__(self):
+        return (f"<{self.__class__.__name__} {self.direction} "
+                f"{self.column}={self.value!r}, {self.index!r}>")
+
+    def __eq__(self, other):
+        return (isinstance(other, DataTableCursor)
+                and self.key == other.key
+                and (self.column, self.reverse, self.direction)
+                == (other.column, other.reverse, other.direction))
+
+    def __hash__(self):
+        return hash((self.key, self.column, self.reverse, self.direction))
+
+    @property
+    def key(self):
+        return (self.value, self.index)
+
+    @property
+    def descending(self):
+        return self.reverse != (self.direction == "backward")
+
+    @property
+    def operator(self):
+        return "<" if self.descending else ">"
+
+    @staticmethod
+    def sort_key(value, index):
+        return ((value is None, value), index)
+
+    def follows(self, value, index):
+        key = self.sort_key(value, index)
+        edge = self.sort_key(self.value, self.index)
+        return key < edge if self.descending else key > edge
+
+    def seek(self, rows, key, limit=None):
+        # in-memory equivalent of the query above, for lists of rows;
+        # key returns the (sort value, index) of a row
+        rows = sorted(
+            (r for r in rows if self.follows(*key(r))),
+            key=lambda r: self.sort_key(*key(r)),
+            reverse=self.descending
+        )
+        if limit is not None:
+            rows = rows[:limit]
+        if self.direction == "backward":
+            rows.reverse()
+        return rows
+
+
 class DataTableText(urwid.Text):
 
     DEFAULT_END_CHAR = u"\N{HORIZONTAL ELLIPSIS}"
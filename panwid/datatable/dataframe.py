@@ -2,11 +2,150 @@ import logging
 logger = logging.getLogger("panwid.datatable")
 import raccoon as rc
 import collections
+import collections.abc
+import dataclasses
+import operator
+
+class RaggedRowsError(Exception):
+    pass
+
+
+class DataTableRowView(collections.abc.Mapping):
+
+    # Read-only view of one dataframe row.  Values are looked up in the
+    # columns when accessed, so no dict of the row is built.
+
+    __slots__ = ("_df", "_key", "_position")
+
+    def __init__(self, df, key, position=None):
+        self._df = df
+        self._key = key
+        self._position = position
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self._key}>"
+
+    def _locate(self):
+        index = self._df._index
+        p = self._position
+        if p is None or p >= len(index) or index[p] != self._key:
+            # the row moved (sort, delete) since the view was made
+            p = self._position = index.index(self._key)
+        return p
+
+    def __getitem__(self, column):
+        df = self._df
+        try:
+            c = df._columns.index(column)
+        except ValueError:
+            if column == df.index_name:
+                return self._key
+            raise KeyError(column)
+        return df._data[c][self._locate()]
+
+    def __getattr__(self, attr):
+        try:
+            return self[attr]
+        except KeyError:
+            raise AttributeError(attr)
+
+    def __iter__(self):
+        df = self._df
+        if df.index_name not in df._columns:
+            yield df.index_name
+        yield from df._columns
+
+    def __len__(self):
+        df = self._df
+        return len(df._columns) + (df.index_name not in df._columns)
+
+
+class IndexList(list):
+
+    # List of index values that keeps a lazily rebuilt hash map from value to
+    # position, so the index()/in lookups raccoon does on every get and set are
+    # O(1) instead of a scan.
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._positions = None
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            self._positions = {v: i for i, v in enumerate(self)}
+        return self._positions
+
+    def index(self, value, *args):
+        try:
+            return self.positions[value]
+        except (KeyError, TypeError):
+            raise ValueError("%s is not in index" %(value,))
+
+    def __contains__(self, value):
+        try:
+            return value in self.positions
+        except TypeError:
+            return False
+
+    def append(self, value):
+        if self._positions is not None:
+            self._positions[value] = len(self)
+        super().append(value)
+
+    def extend(self, values):
+        values = list(values)
+        if self._positions is not None:
+            self._positions.update(zip(values, range(len(self), len(self) + len(values))))
+        super().extend(values)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def _invalidate(self):
+        self._positions = None
+
+    def insert(self, i, value):
+        self._invalidate()
+        super().insert(i, value)
+
+    def __setitem__(self, key, value):
+        self._invalidate()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._invalidate()
+        super().__delitem__(key)
+
+    def pop(self, *args):
+        self._invalidate()
+        return super().pop(*args)
+
+    def remove(self, value):
+        self._invalidate()
+        super().remove(value)
+
+    def clear(self):
+        self._invalidate()
+        super().clear()
+
+    def sort(self, *args, **kwargs):
+        self._invalidate()
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self._invalidate()
+        super().reverse()
+
 
 class DataTableDataFrame(rc.DataFrame):
 
     DATA_TABLE_COLUMNS = ["_dirty", "_focus_position", "_value_fn", "_cls", "_details", "_rendered_row"]
 
+    _row_fields_cache = {}
+    _extractor_cache = {}
+
     def __init__(self, data=None, columns=None, index=None, index_name="index", sort=None):
 
         self.sidecar_columns = []
@@ -60,8 +199,145 @@ class DataTableDataFrame(rc.DataFrame):
         else:
             return getattr(obj, key, None)
 
+    @classmethod
+    def row_fields(cls, row_cls):
+        # field names shared by every instance of a row class, or None if they
+        # can vary per row (e.g. dicts)
+        try:
+            return cls._row_fields_cache[row_cls]
+        except KeyError:
+            pass
+
+        fields = None
+        if dataclasses.is_dataclass(row_cls):
+            fields = tuple(f.name for f in dataclasses.fields(row_cls))
+        elif isinstance(getattr(row_cls, "model_fields", None), dict):
+            # pydantic 2.x
+            fields = tuple(row_cls.model_fields.keys())
+        elif isinstance(getattr(row_cls, "__fields__", None), dict):
+            # pydantic 1.x
+            fields = tuple(row_cls.__fields__.keys())
+        else:
+            mro = [c for c in row_cls.__mro__ if c is not object]
+            if mro and all("__slots__" in c.__dict__ for c in mro):
+                slots = [
+                    s for c in reversed(mro)
+                    for s in ((c.__slots__,) if isinstance(c.__slots__, str) else c.__slots__)
+                ]
+                if "__dict__" not in slots:
+                    fields = tuple(
+                        s for s in dict.fromkeys(slots) if s != "__weakref__"
+                    )
+
+        cls._row_fields_cache[row_cls] = fields
+        return fields
+
+    @classmethod
+    def row_extractor(cls, row):
+        # returns (class, fields, getter) for a row, where getter returns a
+        # tuple of the row's values for those fields
+        row_cls = type(row)
+        mapping = isinstance(row, collections.abc.MutableMapping)
+        fields = cls.row_fields(row_cls)
+        if fields is None:
+            if not mapping:
+                return None
+            fields = tuple(row.keys())
+        if not fields:
+            return None
+        key = (row_cls, fields, mapping)
+        try:
+            getter = cls._extractor_cache[key]
+        except KeyError:
+            getter = (operator.itemgetter if mapping else operator.attrgetter)(*fields)
+            if len(fields) == 1:
+                getter = (lambda g: lambda r: (g(r),))(getter)
+            cls._extractor_cache[key] = getter
+        return row_cls, fields, getter
+
+    def _transpose_homogeneous(self, rows, with_sidecar = False):
+
+        first = rows[0]
+        if with_sidecar:
+            first, first_sidecar = first
+        data_extractor = self.row_extractor(first)
+        if not data_extractor:
+            raise RaggedRowsError
+        data_cls, data_fields, data_getter = data_extractor
+        # dicts can have different keys per row, so check each row's length
+        check_len = self.row_fields(data_cls) is None
+        num_fields = len(data_fields)
+        mapping = isinstance(first, collections.abc.MutableMapping)
+
+        if with_sidecar:
+            sidecar_extractor = self.row_extractor(first_sidecar)
+            if not sidecar_extractor:
+                raise RaggedRowsError
+            sidecar_cls, sidecar_columns, sidecar_getter = sidecar_extractor
+            sidecar_check_len = self.row_fields(sidecar_cls) is None
+            sidecar_fields = [c for c in sidecar_columns if c not in data_fields]
+        else:
+            sidecar_columns = self.sidecar_columns
+            sidecar_fields = []
+
+        extra_fields = [
+            c for c in self.columns
+            if c not in data_fields
+            and c not in sidecar_columns
+            and c != self.index_name
+            and c not in self.DATA_TABLE_COLUMNS
+        ]
+
+        data_values = [[] for f in data_fields]
+        extra_values = [[] for f in extra_fields]
+        sidecar_values = [[] for f in sidecar_columns]
+        data_appends = [v.append for v in data_values]
+        extra_appends = [
+            (v.append, f) for v, f in zip(extra_values, extra_fields)
+        ]
+        sidecar_appends = [v.append for v in sidecar_values]
+
+        try:
+            for row in rows:
+                if with_sidecar:
+                    row, sidecar = row
+                    if (type(sidecar) is not sidecar_cls
+                        or (sidecar_check_len and len(sidecar) != len(sidecar_columns))):
+                        raise RaggedRowsError
+                    for append, v in zip(sidecar_appends, sidecar_getter(sidecar)):
+                        append(v)
+                if type(row) is not data_cls or (check_len and len(row) != num_fields):
+                    raise RaggedRowsError
+                for append, v in zip(data_appends, data_getter(row)):
+                    append(v)
+                for append, f in extra_appends:
+                    append(row.get(f, None) if mapping else getattr(row, f, None))
+        except (KeyError, AttributeError):
+            raise RaggedRowsError
+
+        data = dict(zip(data_fields, data_values))
+        data.update(zip(extra_fields, extra_values))
+        if "_cls" not in data:
+            data["_cls"] = [None] * len(rows)
+        data.update(
+            (f, v) for f, v in zip(sidecar_columns, sidecar_values)
+            if f in sidecar_fields
+        )
+        if with_sidecar:
+            self.sidecar_columns = list(sidecar_columns)
+        return data
+
     def transpose_data(self, rows, with_sidecar = False):
 
+        if len(rows):
+            try:
+                return self._transpose_homogeneous(rows, with_sidecar = with_sidecar)
+            except RaggedRowsError:
+                pass
+        return self._transpose_data(rows, with_sidecar = with_sidecar)
+
+    def _transpose_data(self, rows, with_sidecar = False):
+
         # raise Exception([ r[self.index_name] for r, s in rows])
 
         if with_sidecar:
@@ -108,54 +384,191 @@ class DataTableDataFrame(rc.DataFrame):
         return data
 
 
+    def column_data(self, column):
+        return self._data[self._columns.index(column)]
+
+    def row_view(self, index):
+        return DataTableRowView(self, index)
+
+    def write_column(self, column, indexes, values):
+        # returns the indexes whose value actually changed
+        if column not in self._columns:
+            self._add_column(column)
+        c = self._columns.index(column)
+        lookup = self._index_map()
+        positions = [lookup[i] for i in indexes]
+        old_values = self._read_many(c, positions)
+        self._write_many(c, positions, values)
+        return [
+            i for i, a, b in zip(indexes, old_values, values)
+            if not self.same_value(a, b)
+        ]
+
+    def _reorder(self, order):
+        order = list(order)
+        if len(order) < 2:
+            take = lambda col: [col[i] for i in order]
+        else:
+            getter = operator.itemgetter(*order)
+            take = lambda col: list(getter(col))
+        self._index = take(self._index)
+        self._data = [take(col) for col in self._data]
+
+    def _move_rows(self, start, positions):
+        # moves the rows from start on to the positions they end up at; the
+        # rows before start stay in order
+        moves = sorted(zip(positions, range(start, len(self._index))))
+        columns = [self._index] + self._data
+        if all(isinstance(col, list) for col in columns):
+            # a few rows moving, so shift them in rather than rebuild
+            for col in columns:
+                tail = col[start:]
+                del col[start:]
+                for p, j in moves:
+                    col.insert(p, tail[j - start])
+            return
+        order = list(range(start))
+        for p, j in moves:
+            order.insert(p, j)
+        self._reorder(order)
+
+    def _index_map(self):
+        # raccoon replaces the index with a plain list in places
+        if not isinstance(self._index, IndexList):
+            self._index = IndexList(self._index)
+        return self._index.positions
+
+    def _read_many(self, c, positions):
+        col = self._data[c]
+        return [col[i] for i in positions]
+
+    def _write_many(self, c, positions, values):
+        col = self._data[c]
+        for i, v in zip(positions, values):
+            col[i] = v
+
+    def _extend(self, c, values):
+        self._data[c].extend(values)
+
+    def pop_evicted(self):
+        # only dataframes with a capacity evict rows
+        return []
+
+    # rows have no _details until something about them changes, so loading
+    # a million rows doesn't make a million dicts; until then a row's
+    # _details is None, which reads as these defaults
+    @staticmethod
+    def default_details():
+        return {"open": False, "disabled": False}
+
+    @staticmethod
+    def same_value(a, b):
+        if a is b:
+            return True
+        try:
+            return type(a) is type(b) and bool(a == b)
+        except Exception:
+            return False
+
+    def upsert_rows(self, data):
+
+        keys = data[self.index_name]
+        lookup = self._index_map()
+        start = len(self._index)
+
+        # split incoming rows into updates of existing rows and new rows
+        pending = {}
+        existing = []
+        positions = []
+        new = []
+        if not start and len(set(keys)) == len(keys):
+            # loading into an empty frame, so every row is new
+            new = range(len(keys))
+        else:
+            for j, key in enumerate(keys):
+                p = lookup.get(key)
+                if p is None:
+                    p = pending.get(key)
+                if p is None:
+                    pending[key] = start + len(new)
+                    new.append(j)
+                else:
+                    existing.append(j)
+                    positions.append(p)
+
+        for c in data.keys():
+            if c not in self._columns:
+                self._add_column(c)
+
+        if new:
+            take = (
+                (lambda values: values) if len(new) == len(keys)
+                else (lambda values: [values[j] for j in new])
+            )
+            self._index.extend(take(keys))
+            for c, name in enumerate(self._columns):
+                if name in data:
+                    self._extend(c, take(data[name]))
+                else:
+                    self._extend(c, [None] * len(new))
+
+        changed = [False] * len(existing)
+        if existing:
+            for name, values in data.items():
+                c = self._columns.index(name)
+                new_values = [values[j] for j in existing]
+                old_values = self._read_many(c, positions)
+                for k, (a, b) in enumerate(zip(old_values, new_values)):
+                    if not changed[k] and not self.same_value(a, b):
+                        changed[k] = True
+                self._write_many(c, positions, new_values)
+
+            if "_dirty" in self._columns:
+                dirty = [p for p, ch in zip(positions, changed) if ch]
+                self._write_many(self._columns.index("_dirty"), dirty, [True] * len(dirty))
+
+        if self._sort:
+            changed_keys = [keys[j] for j, ch in zip(existing, changed) if ch] + [keys[j] for j in new]
+            self.sort_index()
+            lookup = self._index_map()
+            return sorted(set(lookup[k] for k in changed_keys))
+        if not existing:
+            return list(range(start, start + len(new)))
+        return sorted(set(
+            [p for p, ch in zip(positions, changed) if ch]
+            + list(range(start, start + len(new)))
+        ))
+
     def update_rows(self, rows, replace=False, with_sidecar = False):
 
         if not len(rows):
             return []
 
         data = self.transpose_data(rows, with_sidecar = with_sidecar)
-        # data["_details"] = [{"open": False, "disabled": False}] * len(rows)
         data["_cls"] = [type(rows[0][0] if with_sidecar else rows[0])] * len(rows) # all rows assumed to have same class
 
-        # raise Exception(data["_cls"])
-        # if not "_details" in data:
-        #     data["_details"] = [{"open": False, "disabled": False}] * len(rows)
-
         if replace:
-            if len(rows):
-                indexes = [x for x in self.index if x not in data.get(self.index_name, [])]
-                if len(indexes):
-                    self.delete_rows(indexes)
-            else:
-                self.delete_all_rows()
-
-            # logger.info(f"update_rowGs: {self.index}, {data[self.index_name]}")
+            keep = set(data.get(self.index_name, []))
+            indexes = [x for x in self.index if x not in keep]
+            if len(indexes):
+                self.delete_rows(indexes)
 
         if self.index_name not in data:
-            index = list(range(len(self), len(self) + len(rows)))
-            data[self.index_name] = index
-        else:
-            index = data[self.index_name]
+            # rows may have been deleted, so start past the highest index
+            # rather than at the row count
+            start = max(
+                (i + 1 for i in self._index if isinstance(i, int)), default=0
+            )
+            data[self.index_name] = list(range(start, start + len(rows)))
 
-        for c in data.keys():
-            # try:
-                # raise Exception(data[self.index_name], c, data[c])
-                self.set(data[self.index_name], c, data[c])
-            # except ValueError as e:
-            #     logger.error(e)
-            #     logger.info(f"update_rows: {self.index}, {data}")
-            #
-        for idx in data[self.index_name]:
-            if not self.get(idx, "_details"):
-                self.set(idx, "_details", {"open": False, "disabled": False})
-
-        return data.get(self.index_name, [])
+        positions = self.upsert_rows(data)
+        return [self._index[p] for p in positions]
 
     def append_rows(self, rows):
 
         length = len(rows)
         if not length:
-            return
+            return []
 
         colnames = list(self.columns) + [c for c in self.DATA_TABLE_COLUMNS if c not in self.columns]
 
@@ -190,6 +603,7 @@ class DataTableDataFrame(rc.DataFrame):
         except ValueError:
             raise Exception(f"{self.index}, {newdata}")
         # self.log_dump(10, label="after")
+        return newdata.index
 
     # def add_column(self, column, data=None):
     #     self[column] = data
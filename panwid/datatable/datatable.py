@@ -5,10 +5,19 @@ import urwid_utils.palette
 from ..listbox import ScrollingListBox
 from orderedattrdict import AttrDict
 from collections.abc import MutableMapping
+from collections import OrderedDict, Counter
 import itertools
 import copy
 import traceback
 import math
+import random
+import asyncio
+import gc
+import inspect
+import heapq
+import weakref
+import bisect
+import time
 from dataclasses import *
 import typing
 
@@ -27,6 +36,13 @@ except ImportError:
 
 
 from .dataframe import *
+from .filters import *
+from .aggregates import *
+from .aggregates import make_aggregate
+from .lookups import Lookup, make_lookup
+from .ringbuffer import RingBufferDataFrame
+from .mapped import MappedDataFrame, write_mapped, is_mapped_file
+from .snapshot import write_snapshot, read_snapshot, is_snapshot_file
 from .rows import *
 from .columns import *
 from .common import *
@@ -49,11 +65,16 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
 
     ATTR = "table"
 
+    FILTER_BISECT_LIMIT = 32
+    SORT_INSERT_LIMIT = 32
+    ENTITY_BATCH_SIZE = 500
+
     columns = []
 
     data = None
 
     limit = None
+    prefetch = None
     index = "index"
 
     with_header = True
@@ -61,10 +82,25 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
     with_scrollbar = False
     empty_message = "(no data)"
     row_height = None
+    row_cache_size = None
+    canvas_cache_size = 1024
+    row_object_cache_size = 1024
+    row_views = False
+    pack_sample_size = None
+    pack_percentile = 99
     cell_selection = False
+    fast_render = False
+    async_query = False
+    query_executor = None
+    loading_message = "(loading...)"
+    retain_rows = None
+    retain_seconds = None
+    capacity = None
+    ingest_interval = 0.05
 
     sort_by = (None, None)
     query_sort = False
+    query_filters = False
     sort_icons = True
     sort_refocus = False
     no_load_on_init = None
@@ -85,6 +121,10 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
 
     with_sidecar = False
 
+    dataframe_class = DataTableDataFrame
+
+    _row_dataclasses = {}
+
     attr_map = {}
     focus_map = {}
     column_focus_map = {}
@@ -96,12 +136,20 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
                  columns=None,
                  data=None,
                  limit=None,
+                 prefetch=None,
                  index=None,
                  with_header=None, with_footer=None, with_scrollbar=None,
                  empty_message=None,
                  row_height=None,
+                 row_cache_size=None, canvas_cache_size=None,
+                 row_object_cache_size=None, row_views=None,
+                 pack_sample_size=None, pack_percentile=None,
                  cell_selection=None,
-                 sort_by=None, query_sort=None, sort_icons=None,
+                 fast_render=None,
+                 async_query=None, loading_message=None,
+                 retain_rows=None, retain_seconds=None, ingest_interval=None,
+                 capacity=None,
+                 sort_by=None, query_sort=None, query_filters=None, sort_icons=None,
                  sort_refocus=None,
                  no_load_on_init=None,
                  divider=None, padding=None,
@@ -111,7 +159,8 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
                  ui_sort=None,
                  ui_resize=None,
                  row_attr_fn=None,
-                 with_sidecar=None):
+                 with_sidecar=None,
+                 dataframe_class=None):
 
         self._focus = 0
         self.page = 0
@@ -135,8 +184,16 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
             self.data = data
 
         if query_sort: self.query_sort = query_sort
+        if query_filters: self.query_filters = query_filters
 
+        self.sort_spec = []
         if sort_by:
+            if isinstance(sort_by, list):
+                self.sort_spec = [
+                    s if isinstance(s, tuple) else (s, None)
+                    for s in sort_by
+                ]
+                sort_by = self.sort_spec[0]
             if isinstance(sort_by, tuple):
                 column = sort_by[0]
                 reverse = sort_by[1]
@@ -147,7 +204,7 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
 
             self.sort_by = (column, reverse)
 
-        self.initial_sort = self.sort_by
+        self.initial_sort = self.sort_spec if len(self.sort_spec) > 1 else self.sort_by
 
         if sort_icons is not None: self.sort_icons = sort_icons
         if no_load_on_init is not None: self.no_load_on_init = no_load_on_init
@@ -158,8 +215,21 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         if empty_message is not None: self.empty_message = empty_message
 
         if row_height is not None: self.row_height = row_height
+        if row_cache_size is not None: self.row_cache_size = row_cache_size
+        if canvas_cache_size is not None: self.canvas_cache_size = canvas_cache_size
+        if row_object_cache_size is not None: self.row_object_cache_size = row_object_cache_size
+        if row_views is not None: self.row_views = row_views
+        if pack_sample_size is not None: self.pack_sample_size = pack_sample_size
+        if pack_percentile is not None: self.pack_percentile = pack_percentile
 
         if cell_selection is not None: self.cell_selection = cell_selection
+        if fast_render is not None: self.fast_render = fast_render
+        if async_query is not None: self.async_query = async_query
+        if loading_message is not None: self.loading_message = loading_message
+        if retain_rows is not None: self.retain_rows = retain_rows
+        if retain_seconds is not None: self.retain_seconds = retain_seconds
+        if ingest_interval is not None: self.ingest_interval = ingest_interval
+        if capacity is not None: self.capacity = capacity
         if divider is not None: self.divider = divider
         if isinstance(self.divider, str):
             self.divider = DataTableDivider(self.divider)
@@ -188,8 +258,11 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
 
         if with_sidecar is not None: self.with_sidecar = with_sidecar
 
+        if dataframe_class is not None: self.dataframe_class = dataframe_class
+
         if limit:
             self.limit = limit
+        if prefetch is not None: self.prefetch = prefetch
 
         self.sort_column = None
         self._width = None
@@ -197,8 +270,34 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         self._initialized = False
         self._message_showing = False
         self.pagination_cursor = None
+        self.pagination_start = None
         self.filters = None
+        self._aggregates = {}
+        self._lookups = {}
+        self._lookup_specs = {}
         self.filtered_rows = list()
+        self._sort_keys = {}
+        self._sorted_spec = None
+        self._row_cache = OrderedDict()
+        self._canvas_cache = OrderedDict()
+        self._row_objects = OrderedDict()
+        self.query_generation = 0
+        self._query_task = None
+        self.query_exhausted = False
+        self._ingested = OrderedDict()
+        self._pending_rows = []
+        self._flush_handle = None
+        self._entities = (0, {})
+        self.width_generation = 0
+        self._content_widths = {}
+        self._format_caches = {}
+        self._row_versions = {}
+        self._row_version_counter = itertools.count(1)
+        self._calculated_versions = {}
+        self._estimated_widths = set()
+        # weak, so rows dropped from the row cache can still be collected
+        self.painted_rows = weakref.WeakSet()
+        self._body_column_widths = {}
 
         if self.divider:
             self._columns = list(intersperse_divider(self._columns, self.divider))
@@ -215,16 +314,13 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
             # sorted=True,
         )
 
-        self.df = DataTableDataFrame(
-            columns = self.column_names,
-            sort=False,
-            index_name = self.index or None
-        )
+        self.df = self.new_dataframe()
         self.pile = urwid.Pile([])
         self.listbox = ScrollingListBox(
             self, infinite=self.limit,
             with_scrollbar = self.with_scrollbar,
-            row_count_fn = self.row_count
+            row_count_fn = self.row_count,
+            prefetch = self.prefetch_rows
         )
         urwid.connect_signal(
             self.listbox, "drag_start",
@@ -244,6 +340,7 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
 
         if self.limit:
             urwid.connect_signal(self.listbox, "load_more", self.load_more)
+            urwid.connect_signal(self.listbox, "prefetch", self.prefetch_page)
             # self.offset = 0
 
         self.header = DataTableHeaderRow(
@@ -582,7 +679,7 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         else:
             try:
                 # raise Exception(position)
-                i = self.position_to_index(self.filtered_rows[position])
+                i = self.position_to_index(position)
                 self.delete_rows(i)
             except IndexError:
                 logger.error(traceback.format_exc())
@@ -662,7 +759,7 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         # else:
         #     return key
 
-    def decorate(self, row, column, value):
+    def decorate_markup(self, column, value):
         if column.decoration_fn:
             value = column.decoration_fn(value)
         if not isinstance(value, urwid.Widget):
@@ -670,7 +767,11 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
                 value = (value[0], str(value[1]))
             else:
                 value = str(value)
+        return value
 
+    def decorate(self, row, column, value):
+        value = self.decorate_markup(column, value)
+        if not isinstance(value, urwid.Widget):
             # value = DataTableText(value, wrap=column.wrap)
             value = urwid.Text(value)
         return value
@@ -690,19 +791,95 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         # self.listbox.focus_position = value
         self.listbox._invalidate()
 
+    @property
+    def filtered_rows(self):
+        return self._filtered_rows
+
+    @filtered_rows.setter
+    def filtered_rows(self, rows):
+        old = getattr(self, "_filtered_positions", {})
+        self._filtered_rows = list(rows)
+        self._filtered_positions = {}
+        self._filtered_offset = 0
+        self._reindex_filtered_rows()
+        if any(a.scope == "filtered" for a in self._aggregates.values()):
+            new = self._filtered_positions
+            self.update_aggregates(
+                [i for i in old if i not in new] + [i for i in new if i not in old],
+                scope="filtered"
+            )
+
+    def _reindex_filtered_rows(self, start=0):
+        rows = self._filtered_rows
+        positions = self._filtered_positions
+        # positions are stored offset so rows can come off the front without
+        # renumbering the rest
+        offset = self._filtered_offset
+        for i in range(start, len(rows)):
+            positions[rows[i]] = i + offset
+
+    def _remove_filtered_rows(self, indexes):
+        offset = self._filtered_offset
+        removed = set(
+            self._filtered_positions.pop(i) - offset
+            for i in indexes if i in self._filtered_positions
+        )
+        if not removed:
+            return
+        if max(removed) == len(removed) - 1:
+            # a run off the front only moves the offset
+            del self._filtered_rows[:len(removed)]
+            self._filtered_offset += len(removed)
+        else:
+            start = min(removed)
+            self._filtered_rows[start:] = [
+                i for p, i in enumerate(self._filtered_rows[start:], start)
+                if p not in removed
+            ]
+            self._reindex_filtered_rows(start)
+        self.update_aggregates(indexes, scope="filtered")
+
+    def _insert_filtered_row(self, index, positions):
+        # filtered rows follow dataframe order, so bisect on dataframe position
+        rows = self._filtered_rows
+        target = positions[index]
+        lo, hi = 0, len(rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if positions[rows[mid]] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        rows.insert(lo, index)
+        self._reindex_filtered_rows(lo)
+        self.update_aggregates([index], scope="filtered")
+
+    def _sync_filtered_rows(self):
+        # keep filtered rows in the same order as the dataframe after a sort
+        if len(self._filtered_rows) == len(self.df):
+            self.filtered_rows = self.df.index
+        else:
+            self.filtered_rows = [
+                i for i in self.df.index if i in self._filtered_positions
+            ]
+
     def position_to_index(self, position):
-        # if not self.query_sort and self.sort_by[1]:
-        #     position = -(position + 1)
-        try:
-            return self.df.index[position]
-        except IndexError as e:
-            # logger.info(f"position_to_index: {position}, {self.df.index}")
-            raise
-            logger.error(traceback.format_exc())
+        return self._filtered_rows[position]
+
     def index_to_position(self, index):
-        # raise Exception(index, self.df.index)
-        # return self.df.index.index(index)
-        return self.filtered_rows.index(index)
+        try:
+            return self._filtered_positions[index] - self._filtered_offset
+        except KeyError:
+            raise ValueError("%s is not in filtered rows" %(index,))
+
+    def get_position(self, index, default=None):
+        position = self._filtered_positions.get(index)
+        if position is None:
+            return default
+        return position - self._filtered_offset
+
+    def has_index(self, index):
+        return index in self._filtered_positions
 
     def get_dataframe_row(self, index):
         try:
@@ -710,10 +887,58 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         except ValueError as e:
             raise Exception(e, index, self.df.head(10))
 
+    @classmethod
+    def row_dataclass(cls, row_cls):
+        try:
+            return cls._row_dataclasses[row_cls]
+        except KeyError:
+            pass
+        klass = make_dataclass(
+            f"DataTableRow_{row_cls.__name__}",
+            [
+                ("_cls", typing.Optional[typing.Any], field(default=None)),
+            ],
+            bases=(row_cls,)
+        )
+        cls._row_dataclasses[row_cls] = klass
+        return klass
+
+    def get_dataframe_row_view(self, index):
+        return self.df.row_view(index)
+
     def get_dataframe_row_object(self, index):
 
+        # objects built from a row class are kept until the row changes
+        version = self.row_version(index)
+        entry = self._row_objects.get(index)
+        if entry is not None and entry[0] == version:
+            self._row_objects.move_to_end(index)
+            return entry[1]
+
+        cls = self.df.get(index, "_cls") if "_cls" in self.df.columns else None
+        if self.row_views and not (
+                cls and (
+                    (HAVE_PYDANTIC and issubclass(cls, pydantic.main.BaseModel))
+                    or hasattr(cls, "__dataclass_fields__")
+                    or (HAVE_PONY and issubclass(cls, pony.orm.core.Entity))
+                )
+        ):
+            # rows that would only become an AttrDict can be read in place
+            return self.get_dataframe_row_view(index)
+
+        obj = self.make_dataframe_row_object(index, cls)
+        if not isinstance(obj, AttrDict) and not (
+                HAVE_PONY and isinstance(obj, pony.orm.core.Entity)
+        ):
+            self._row_objects[index] = (version, obj)
+            if self.row_object_cache_size is not None:
+                while len(self._row_objects) > self.row_object_cache_size:
+                    self._row_objects.popitem(last=False)
+        return obj
+
+    def make_dataframe_row_object(self, index, cls):
+
         d = self.get_dataframe_row(index)
-        cls = d.get("_cls")
         if cls:
             if HAVE_PYDANTIC and issubclass(cls, pydantic.main.BaseModel):
                 # import ipdb; ipdb.set_trace()
@@ -726,43 +951,173 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
                 )
             elif hasattr(cls, "__dataclass_fields__"):
                 # Python dataclasses
-                # klass = type(f"DataTableRow_{cls.__name__}", [cls],
-                klass = make_dataclass(
-                    f"DataTableRow_{cls.__name__}",
-                    [
-                        ("_cls", typing.Optional[typing.Any], field(default=None)),
-                    ],
-                    bases=(cls,)
-                )
-                k = klass(
+                return self.row_dataclass(cls)(
                     **{k: d[k]
                        for k in set(
                                cls.__dataclass_fields__.keys())
                     })
-                return k
             elif HAVE_PONY and issubclass(cls, pony.orm.core.Entity):
-                keys = {
-                    k.name: d.get(k.name, None)
-                    for k in (cls._pk_ if isinstance(cls._pk_, tuple) else (cls._pk_,))
-                }
-                # raise Exception(keys)
-                with db_session:
-                    return cls.get(**keys)
+                key = tuple(d.get(name) for name in self.entity_key_names(cls))
+                entities = self.entity_cache().get(cls, {})
+                if key not in entities:
+                    # fetch the rows around this one too, since the rest of
+                    # the screen is likely to be rendered next
+                    self.load_entities(self.entity_window(index))
+                    entities = self.entity_cache().get(cls, {})
+                return entities.get(key)
             else:
                 return AttrDict(**d)
         else:
             return AttrDict(**d)
 
 
+    @staticmethod
+    def entity_key_names(cls):
+        pk = cls._pk_ if isinstance(cls._pk_, tuple) else (cls._pk_,)
+        return tuple(k.name for k in pk)
+
+    def entity_cache(self):
+        # entities are only reused until the next query
+        generation, entities = self._entities
+        if generation != self.query_generation:
+            entities = {}
+            self._entities = (self.query_generation, entities)
+        return entities
+
+    def entity_window(self, index):
+        position = self.get_position(index)
+        if position is None:
+            return [index]
+        height = max(self._height or 0, 1)
+        return self.filtered_rows[max(position - height, 0):position + height + 1]
+
+    def load_entities(self, indexes):
+
+        # fetch the Pony entities for all of these rows that aren't cached
+        # yet, with one query per entity class and batch of keys
+        if not HAVE_PONY or "_cls" not in self.df.columns:
+            return
+        cache = self.entity_cache()
+        by_class = OrderedDict()
+        for index, cls in zip(indexes, self.column_values("_cls", indexes)):
+            if (cls and isinstance(cls, type)
+                    and issubclass(cls, pony.orm.core.Entity)):
+                by_class.setdefault(cls, []).append(index)
+
+        pending = OrderedDict()
+        for cls, rows in by_class.items():
+            keys = zip(*[
+                self.column_values(name, rows)
+                for name in self.entity_key_names(cls)
+            ])
+            cached = cache.get(cls, {})
+            keys = [k for k in dict.fromkeys(keys) if k not in cached]
+            if keys:
+                pending[cls] = keys
+
+        if not pending:
+            return
+
+        with db_session:
+            for cls, keys in pending.items():
+                entities = cache.setdefault(cls, {})
+                names = self.entity_key_names(cls)
+                if len(names) == 1:
+                    name = names[0]
+                    for i in range(0, len(keys), self.ENTITY_BATCH_SIZE):
+                        batch = [k[0] for k in keys[i:i+self.ENTITY_BATCH_SIZE]]
+                        for entity in cls.select(lambda e: getattr(e, name) in batch):
+                            entities[(getattr(entity, name),)] = entity
+                else:
+                    for key in keys:
+                        entities[key] = cls.get(**dict(zip(names, key)))
+                for key in keys:
+                    # remember misses so they aren't queried again
+                    entities.setdefault(key, None)
+
+    @property
+    def virtualized(self):
+        return self.row_cache_size is not None
+
+    def cached_row(self, index):
+        if not self.virtualized:
+            return self.df.get(index, "_rendered_row")
+        row = self._row_cache.get(index)
+        if row is not None:
+            self._row_cache.move_to_end(index)
+        return row
+
+    def cache_row(self, index, row):
+        if not self.virtualized:
+            self.df.set(index, "_rendered_row", row)
+            return
+        self._row_cache[index] = row
+        self._row_cache.move_to_end(index)
+
+        # never hold fewer rows than fit on screen, or every render would
+        # rebuild the rows it just evicted
+        limit = max(self.row_cache_size, (self._height or 0) + 2)
+        focus_index = self.get_position_index(self._focus)
+        while len(self._row_cache) > limit:
+            evicted, evicted_row = self._row_cache.popitem(last=False)
+            if evicted == focus_index:
+                # the focused row may hold widget state (e.g. the focused
+                # cell) that isn't in the dataframe, so keep it
+                self._row_cache[evicted] = evicted_row
+            else:
+                self._canvas_cache.pop(evicted, None)
+
+    def uncache_rows(self, indexes=None):
+        if indexes is None:
+            self._row_cache.clear()
+            self._canvas_cache.clear()
+            self._row_objects.clear()
+            return
+        for index in indexes:
+            self._row_cache.pop(index, None)
+            self._canvas_cache.pop(index, None)
+            self._row_objects.pop(index, None)
+
+    def cached_canvas(self, index, key, focus):
+        # urwid only holds weak references to canvases and drops them
+        # whenever a row is invalidated or rebuilt, so keep the last canvas
+        # for each focus state of a row until something it was drawn from
+        # changes
+        entry = self._canvas_cache.get(index)
+        if entry is None or entry[0] != key:
+            return None
+        self._canvas_cache.move_to_end(index)
+        return entry[1].get(focus)
+
+    def cache_canvas(self, index, key, focus, canvas):
+        entry = self._canvas_cache.get(index)
+        if entry is None or entry[0] != key:
+            entry = self._canvas_cache[index] = (key, {})
+        entry[1][focus] = canvas
+        self._canvas_cache.move_to_end(index)
+        # bounded on its own, since without a row cache nothing else evicts
+        if self.canvas_cache_size is not None:
+            limit = max(self.canvas_cache_size, (self._height or 0) + 2)
+            while len(self._canvas_cache) > limit:
+                self._canvas_cache.popitem(last=False)
+
+    def get_position_index(self, position):
+        try:
+            return self._filtered_rows[position]
+        except (IndexError, TypeError):
+            return None
+
     def get_row(self, index):
-        row = self.df.get(index, "_rendered_row")
-        details_open = False
-        if self.df.get(index, "_dirty") or row is None:
+        row = self.cached_row(index)
+        dirty = self.df.get(index, "_dirty")
+        if dirty or row is None:
+            if dirty:
+                self._canvas_cache.pop(index, None)
+            details = self.df.get(index, "_details")
+            details_open = bool(details and details.get("open"))
             self.refresh_calculated_fields([index])
             # vals = self[index]
 
-            pos = self.index_to_position(index)
-            vals = self.get_dataframe_row_object(index)
             row = self.render_item(index)
             position = self.index_to_position(index)
             if self.row_attr_fn:
@@ -773,8 +1128,11 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
             if focus is not None:
                 row.set_focus_column(focus)
             if details_open:
+                # the dataframe says the details are open, but this widget
+                # hasn't shown them yet
+                details["open"] = False
                 row.open_details()
-            self.df.set(index, "_rendered_row", row)
+            self.cache_row(index, row)
             self.df.set(index, "_dirty", False)
 
         return row
@@ -788,7 +1146,9 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         return self.df[self.position_to_index(row), column]
 
     def set_value(self, row, column, value):
-        self.df.set(self.position_to_index(row), column, value)
+        index = self.position_to_index(row)
+        self.df.set(index, column, value)
+        self.cells_changed([index], column)
 
     @property
     def selection(self):
@@ -804,25 +1164,172 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         return AttrDict(self.df.get_columns(self.position_to_index(self.focus_position), as_dict=True))
 
     def render_item(self, index):
-        row = DataTableBodyRow(self, index,
-                               row_height= self.row_height,
-                               divider = self.divider,
-                               padding = self.padding,
-                               # index=data[self.index],
-                               cell_selection = self.cell_selection,
-                               style = self.row_style)
-        return row
+        kwargs = dict(row_height= self.row_height,
+                      divider = self.divider,
+                      padding = self.padding,
+                      # index=data[self.index],
+                      cell_selection = self.cell_selection,
+                      style = self.row_style)
+        if self.fast_render and self.row_height and not self.cell_selection:
+            markup = self.row_markup(index)
+            if markup is not None:
+                return DataTableTextBodyRow(self, index, markup, **kwargs)
+        return DataTableBodyRow(self, index, **kwargs)
+
+    def row_markup(self, index):
+        # text markup for each visible column, or None if any cell needs a
+        # real widget and the row has to be built from cells
+        markup = []
+        for col in self.visible_columns:
+            if not isinstance(col, DataTableColumn):
+                markup.append(None)
+                continue
+            value = self.decorate_markup(col, self.format_cell(col, index))
+            if isinstance(value, urwid.Widget):
+                return None
+            markup.append(value)
+        return markup
+
+    def body_column_widths(self, maxcol):
+        key = (maxcol, tuple(
+            (c.sizing, c.width_with_padding(self.padding))
+            for c in self.visible_columns
+        ))
+        widths = self._body_column_widths.get(key)
+        if widths is None:
+            columns = urwid.Columns([])
+            for sizing, width in key[1]:
+                columns.contents.append(
+                    (urwid.Text(""), columns.options(sizing, width))
+                )
+            widths = self._body_column_widths[key] = columns.column_widths((maxcol,))
+        return widths
+
+    def calculated_columns(self, changed=None):
+
+        # value_fn columns, with each one after the columns it depends on.
+        # If changed is given, only the columns affected by changes to those
+        # columns are returned.
+        columns = OrderedDict(
+            (c.name, c) for c in self.data_columns if c.value_fn
+        )
+        order = []
 
-    def refresh_calculated_fields(self, indexes=None):
+        def visit(column, path):
+            if column in order:
+                return
+            if column.name in path:
+                raise ValueError(
+                    "circular dependency in calculated column %s" %(column.name)
+                )
+            for name in column.depends_on or []:
+                if name in columns:
+                    visit(columns[name], path | {column.name})
+            order.append(column)
+
+        for column in columns.values():
+            visit(column, frozenset())
+
+        if changed is None:
+            return order
+        if not isinstance(changed, list):
+            changed = [changed]
+        changed = set(changed)
+        affected = []
+        for column in order:
+            if column.depends_on is None or changed.intersection(column.depends_on):
+                affected.append(column)
+                changed.add(column.name)
+        return affected
+
+    def compute_columns(self, columns, indexes):
+
+        # row objects can be expensive to build (pydantic models, dataclasses,
+        # ORM fetches), so each one is built at most once per pass
+        objects = {}
+        if not all(c.vectorized for c in columns):
+            self.load_entities(indexes)
+        for n, column in enumerate(columns):
+            if column.vectorized:
+                names = column.depends_on
+                if names is None:
+                    names = [self.df.index_name] + [
+                        c for c in self.df.columns
+                        if c not in self.df.DATA_TABLE_COLUMNS
+                    ]
+                values = list(column.value_fn(self, AttrDict(
+                    (name, self.column_values(name, indexes)) for name in names
+                )))
+            else:
+                values = []
+                for index in indexes:
+                    row = objects.get(index)
+                    if row is None:
+                        row = objects[index] = self.get_dataframe_row_object(index)
+                    values.append(column.value_fn(self, row))
+
+            changed = self.df.write_column(column.name, indexes, values)
+            if changed:
+                self.bump_row_versions(changed)
+                self.invalidate_sort_keys(changed, column.name)
+                self.update_content_widths(changed, column.name)
+                self.update_aggregates(changed, column.name)
+                self.update_lookups(changed, column.name)
+
+            if not objects or not any(
+                    c.depends_on is None or column.name in c.depends_on
+                    for c in columns[n+1:]
+            ):
+                continue
+            # later columns read this one, so the row objects must see it
+            for index, value in zip(indexes, values):
+                row = objects.get(index)
+                if isinstance(row, DataTableRowView):
+                    # reads the dataframe, which already has the new value
+                    continue
+                elif isinstance(row, MutableMapping):
+                    row[column.name] = value
+                else:
+                    objects.pop(index, None)
+
+    def refresh_calculated_fields(self, indexes=None, columns=None):
         if not indexes:
             indexes = self.df.index[:]
         if not hasattr(indexes, "__len__"):
             indexes = [indexes]
-        for col in self.data_columns:
-            if not col.value_fn: continue
-            for index in indexes:
-                if self.df[index, "_dirty"]:
-                    self.df.set(index, col.name, col.value_fn(self, self.get_dataframe_row_object(index)))
+
+        calculated = self.calculated_columns(columns)
+        if not calculated:
+            return
+
+        if columns is not None:
+            # changes to some source columns only re-run their dependents
+            self.compute_columns(calculated, indexes)
+            return
+
+        # columns that don't declare what they depend on are recomputed for
+        # dirty rows, the rest for rows whose data changed since their last
+        # pass
+        legacy = [c for c in calculated if not c.calculated]
+        if legacy and "_dirty" in self.df.columns:
+            dirty = [
+                i for i, d in zip(indexes, self.column_values("_dirty", indexes))
+                if d
+            ]
+            if dirty:
+                self.compute_columns(legacy, dirty)
+
+        declared = [c for c in calculated if c.calculated]
+        if not declared:
+            return
+        stale = [
+            i for i in indexes
+            if self._calculated_versions.get(i) != self.row_version(i)
+        ]
+        if stale:
+            self.compute_columns(declared, stale)
+        for i in stale:
+            self._calculated_versions[i] = self.row_version(i)
 
     def visible_data_column_index(self, column_name):
         try:
@@ -838,12 +1345,20 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
 
         column_name = None
         column_number = None
+        secondary = []
+
+        if isinstance(col, list):
+            spec = [c if isinstance(c, tuple) else (c, None) for c in col]
+            (col, reverse), secondary = spec[0], spec[1:]
 
         if isinstance(col, tuple):
             col, reverse = col
 
         elif col is None:
             col = self.sort_column
+            if reverse is None:
+                reverse = self.sort_by[1]
+            secondary = self.sort_spec[1:]
 
 
         if isinstance(col, int):
@@ -860,7 +1375,10 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
                 column_name = col
             except:
 
-                column_name = self.initial_sort[0] or self.visible_data_columns[0].name
+                initial_sort = (self.initial_sort[0]
+                                if isinstance(self.initial_sort, list)
+                                else self.initial_sort)
+                column_name = initial_sort[0] or self.visible_data_columns[0].name
                 if column_name is None:
                     return
                 column_number = self.visible_data_column_index(column_name)
@@ -886,6 +1404,7 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         # if not self.query_sort:
 
         self.sort_by = sort_by
+        self.sort_spec = [sort_by] + [s for s in secondary if s[0] != column_name]
         logger.debug("sort_by: %s (%s), %s" %(column_name, self.sort_column, reverse))
         if self.query_sort:
             self.reset()
@@ -894,7 +1413,7 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         if self.sort_refocus:
             row_index = self[self._focus].data.get(self.index, None)
             logger.debug("row_index: %s" %(row_index))
-        self.sort(column_name, key=column.sort_key)
+        self.sort(self.sort_spec)
 
         if self.with_header:
             self.header.update_sort(self.sort_by)
@@ -903,22 +1422,450 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         if row_index:
             self.focus_position = self.index_to_position(row_index)
 
+    @staticmethod
+    def default_sort_key(value):
+        return (value is None, value)
+
+    def sort_keys(self, column, key=None, indexes=None):
+
+        if not key:
+            key = self.default_sort_key
+        cached_key, keys = self._sort_keys.get(column, (None, None))
+        if keys is None or cached_key is not key:
+            keys = {}
+            self._sort_keys[column] = (key, keys)
+
+        if indexes is not None:
+            missing = [i for i in indexes if i not in keys]
+            if missing:
+                values = (missing if column == self.df.index_name
+                          else self.column_values(column, missing)
+                          or [None] * len(missing))
+                for i, value in zip(missing, values):
+                    keys[i] = key(value)
+            return [keys[i] for i in indexes]
+
+        index = self.df.index
+        values = None
+        result = []
+        for p, i in enumerate(index):
+            if i not in keys:
+                if values is None:
+                    values = (index if column == self.df.index_name
+                              else self.df.column_data(column))
+                keys[i] = key(values[p])
+            result.append(keys[i])
+        return result
+
+    def invalidate_sort_keys(self, indexes=None, columns=None):
+
+        self._sorted_spec = None
+        if columns is None:
+            columns = list(self._sort_keys.keys())
+        elif not isinstance(columns, list):
+            columns = [columns]
+
+        for column in columns:
+            if column not in self._sort_keys:
+                continue
+            if indexes is None:
+                del self._sort_keys[column]
+                continue
+            keys = self._sort_keys[column][1]
+            for i in indexes:
+                keys.pop(i, None)
+
+    def row_version(self, index):
+        return self._row_versions.get(index, 0)
+
+    def bump_row_versions(self, indexes):
+        for index in indexes:
+            self._row_versions[index] = next(self._row_version_counter)
+
+    def get_format_cache(self, column):
+        # values from value_fn columns that don't declare their dependencies
+        # can depend on more than the row's data, so they're only cached if
+        # the column asks for a bounded cache
+        if not column.format_cache or (
+                column.value_fn and not column.calculated
+                and not column.format_cache_size
+        ):
+            return None
+        cache = self._format_caches.get(column.name)
+        if cache is None:
+            cache = self._format_caches[column.name] = FormatCache(column.format_cache_size)
+        return cache
+
+    def clear_format_caches(self):
+        self._format_caches.clear()
+        self._row_versions.clear()
+        self._calculated_versions.clear()
+
+    def invalidate_formats(self, columns=None):
+        # formatted values are only recomputed when a row's data changes, so
+        # a format_fn that reads anything else (a timezone, a unit setting,
+        # the time) needs this called whenever that changes, or its column
+        # created with format_cache=False
+        if columns is None:
+            self._format_caches.clear()
+        else:
+            for name in columns:
+                self._format_caches.pop(name, None)
+        self.invalidate_content_widths()
+        self.invalidate()
+
+    def format_column(self, column, indexes=None, width=None, padding=0):
+
+        if indexes is None:
+            indexes = self.df.index
+        cache = self.get_format_cache(column)
+
+        result = [None] * len(indexes)
+        missing = []
+        for n, index in enumerate(indexes):
+            if cache is not None:
+                result[n] = cache.get(index, self.row_version(index), width)
+            if result[n] is None:
+                missing.append(n)
+        if not missing:
+            return result
+
+        if column.value_fn and not column.calculated:
+            values = [
+                column.value_fn(self, self.get_dataframe_row_object(indexes[n]))
+                for n in missing
+            ]
+        else:
+            values = self.column_values(column.name, [indexes[n] for n in missing])
+
+        for n, value in zip(missing, values):
+            v = column._format(value)
+            if width:
+                v = str(v)[:width-padding*2]
+            result[n] = v
+            if cache is not None and not isinstance(v, urwid.Widget):
+                cache.put(indexes[n], self.row_version(indexes[n]), width, v)
+        return result
+
+    def format_cell(self, column, index, width=None, padding=0):
+        return self.format_column(column, [index], width, padding)[0]
+
+    def value_width(self, value, formatted):
+        width = getattr(value, "min_width", None)
+        if width:
+            return width
+        formatted = str(formatted)
+        return urwid.util.calc_width(formatted, 0, len(formatted))
+
+    def column_widths(self, column, indexes=None):
+        if indexes is None:
+            indexes = self.df.index
+        return [
+            self.value_width(value, formatted)
+            for value, formatted in zip(
+                    self.column_values(column.name, indexes),
+                    self.format_column(column, indexes)
+            )
+        ]
+
+    def column_values(self, name, indexes=None):
+        if name == self.df.index_name:
+            values = self.df.index
+        elif name in self.df.columns:
+            values = self.df.column_data(name)
+        else:
+            return []
+        if indexes is None:
+            return values
+        positions = self.df._index_map()
+        return [values[positions[i]] for i in indexes if i in positions]
+
+    def content_width(self, column):
+
+        if column.name in self._content_widths:
+            return self._content_widths[column.name]
+
+        index = self.df.index
+        if self.pack_sample_size and len(index) > self.pack_sample_size:
+            # estimate from a sample so one outlier can't blow up the column
+            sample = random.sample(index, self.pack_sample_size)
+            widths = sorted(self.column_widths(column, sample))
+            width = widths[(len(widths)-1) * self.pack_percentile // 100]
+            self._estimated_widths.add(column.name)
+        else:
+            width = max(self.column_widths(column, index), default=0)
+        self._content_widths[column.name] = width
+        return width
+
+    def update_content_widths(self, indexes, columns=None):
+
+        if columns is None:
+            columns = list(self._content_widths.keys())
+        elif not isinstance(columns, list):
+            columns = [columns]
+
+        for name in columns:
+            if name not in self._content_widths or name in self._estimated_widths:
+                continue
+            try:
+                column = next(c for c in self.data_columns if c.name == name)
+            except StopIteration:
+                continue
+            self._content_widths[name] = max(
+                [self._content_widths[name]] + self.column_widths(column, indexes)
+            )
+
+    def invalidate_content_widths(self, estimated=False):
+        for name in list(self._content_widths.keys()):
+            if estimated or name not in self._estimated_widths:
+                del self._content_widths[name]
+                self._estimated_widths.discard(name)
+
+    def cells_changed(self, indexes, columns=None):
+        self.bump_row_versions(indexes)
+        self.invalidate_sort_keys(indexes, columns)
+        self.update_content_widths(indexes, columns)
+        self.update_aggregates(indexes, columns)
+        self.update_lookups(indexes, columns)
+        if columns is not None:
+            dependents = [
+                c for c in self.calculated_columns(columns) if c.calculated
+            ]
+            if dependents:
+                self.compute_columns(dependents, indexes)
+
+    def get_aggregate(self, column):
+        aggregate = self._aggregates.get(column.name)
+        if aggregate is None:
+            aggregate = make_aggregate(column.footer_fn)
+            indexes = self.filtered_rows if aggregate.scope == "filtered" else self.df.index
+            for index, value in zip(indexes, self.column_values(column.name, indexes)):
+                aggregate.set(index, value)
+            self._aggregates[column.name] = aggregate
+        return aggregate
+
+    def update_aggregates(self, indexes, columns=None, scope=None):
+
+        if not self._aggregates:
+            return
+        if columns is not None and not isinstance(columns, list):
+            columns = [columns]
+
+        positions = self.df._index_map()
+        present = [i for i in indexes if i in positions]
+        for name, aggregate in self._aggregates.items():
+            if columns is not None and name not in columns:
+                continue
+            if scope is not None and aggregate.scope != scope:
+                continue
+            for index in indexes:
+                if index not in positions:
+                    aggregate.discard(index)
+            values = self.column_values(name, present) or [None] * len(present)
+            for index, value in zip(present, values):
+                if aggregate.scope == "filtered" and index not in self._filtered_positions:
+                    aggregate.discard(index)
+                else:
+                    aggregate.set(index, value)
+
+    def prune_aggregates(self):
+        # drop rows that left the dataframe without going through delete_rows
+        if not self._aggregates:
+            return
+        positions = self.df._index_map()
+        for aggregate in self._aggregates.values():
+            for index in [i for i in aggregate.values if i not in positions]:
+                aggregate.discard(index)
+
+    def create_lookup(self, column, kind="hash"):
+        # kind is "hash" for equality or "sorted" for ranges as well
+        self._lookup_specs[column] = kind
+        self._lookups.pop(column, None)
+        return self.get_lookup(column)
+
+    def drop_lookup(self, column):
+        self._lookup_specs.pop(column, None)
+        self._lookups.pop(column, None)
+
+    def get_lookup(self, name):
+        lookup = self._lookups.get(name)
+        if lookup is None:
+            spec = self._lookup_specs.get(name)
+            if spec is None:
+                spec = next(
+                    (c.lookup for c in self.data_columns if c.name == name), None
+                )
+            if spec is None:
+                return None
+            lookup = make_lookup(spec)
+            indexes = self.df.index
+            values = self.column_values(name) or [None] * len(indexes)
+            for index, value in zip(indexes, values):
+                lookup.set(index, value)
+            self._lookups[name] = lookup
+        return lookup
+
+    def update_lookups(self, indexes, columns=None):
+
+        if not self._lookups:
+            return
+        if columns is not None and not isinstance(columns, list):
+            columns = [columns]
+
+        positions = self.df._index_map()
+        present = [i for i in indexes if i in positions]
+        for name, lookup in self._lookups.items():
+            if columns is not None and name not in columns:
+                continue
+            for index in indexes:
+                if index not in positions:
+                    lookup.discard(index)
+            values = self.column_values(name, present) or [None] * len(present)
+            for index, value in zip(present, values):
+                lookup.set(index, value)
+
+    def prune_lookups(self):
+        if not self._lookups:
+            return
+        positions = self.df._index_map()
+        for lookup in self._lookups.values():
+            for index in [i for i in lookup.values if i not in positions]:
+                lookup.discard(index)
+
+    def lookup_filter(self, expr):
+        # the set of rows matching a filter expression, answered from column
+        # lookups, or None if it can't be
+        if isinstance(expr, And):
+            results = [self.lookup_filter(e) for e in expr.exprs]
+            if not results or any(r is None for r in results):
+                return None
+            if isinstance(expr, Or):
+                return set().union(*results)
+            return set.intersection(*results)
+        if not isinstance(expr, (Compare, In, Between)):
+            return None
+        lookup = self.get_lookup(expr.column)
+        if lookup is None:
+            return None
+        try:
+            if isinstance(expr, In):
+                return set(i for v in expr.values for i in lookup.get(v))
+            elif isinstance(expr, Compare) and expr.op == "==":
+                return set(lookup.get(expr.value))
+            elif not hasattr(lookup, "range"):
+                return None
+            elif isinstance(expr, Between):
+                return set(lookup.range(expr.low, expr.high))
+            elif expr.op == "!=":
+                return None
+            elif expr.value is None:
+                # ordering against null never matches
+                return set()
+            elif expr.op in ("<", "<="):
+                return set(lookup.range(high=expr.value, high_inclusive=expr.op == "<="))
+            else:
+                return set(lookup.range(low=expr.value, low_inclusive=expr.op == ">="))
+        except TypeError:
+            return None
+
+    def find_rows(self, column, value):
+        # indexes of the rows whose column equals value, in dataframe order
+        expr = Field(column) == value
+        matched = self.lookup_filter(expr)
+        if matched is None:
+            return list(itertools.compress(self.df.index, expr.mask(self.df)))
+        positions = self.df._index_map()
+        return sorted(matched, key=positions.__getitem__)
+
+    def find_next(self, column, value, reverse=False):
+        # focus the next visible row after the focused one whose column
+        # equals value, wrapping around; returns its position, or None
+        found = [
+            p for p in (self.get_position(i) for i in self.find_rows(column, value))
+            if p is not None
+        ]
+        if not found:
+            return None
+        found.sort()
+        focus = self._focus or 0
+        if reverse:
+            n = bisect.bisect_left(found, focus)
+            position = found[n-1]
+        else:
+            n = bisect.bisect_right(found, focus)
+            position = found[n % len(found)]
+        self.focus_position = position
+        return position
+
+    def select_value(self, column, value):
+        # focus the first visible row whose column equals value
+        position = next(
+            (p for p in (self.get_position(i) for i in self.find_rows(column, value))
+             if p is not None),
+            None
+        )
+        if position is None:
+            raise ValueError("no row with %s == %r" %(column, value))
+        self.focus_position = position
+
+    def facets(self, column, filtered=False):
+        # count of rows holding each distinct value of the column
+        lookup = self.get_lookup(column)
+        if lookup is not None and not filtered:
+            return lookup.counts()
+        indexes = self.filtered_rows if filtered else self.df.index
+        values = self.column_values(column, indexes) or [None] * len(indexes)
+        return Counter(v for v in values if Lookup.accepts(v))
+
     def sort(self, column, key=None):
         logger.debug(column)
-        if not key:
-            key = lambda x: (x is None, x)
-        self.df.sort_columns(
-            column,
-            key = key,
-            reverse = self.sort_by[1])
+
+        if isinstance(column, list):
+            spec = [(c, bool(r)) for c, r in column]
+        else:
+            spec = [(column, bool(self.sort_by[1]))]
+
+        if spec == self._sorted_spec:
+            order = None
+        elif self._sorted_spec and spec == [(c, not r) for c, r in self._sorted_spec]:
+            # only the direction changed, so the current order just flips
+            order = range(len(self.df)-1, -1, -1)
+        else:
+            order = self.sort_order(spec, key=key)
+
+        if order is not None:
+            self.df._reorder(order)
+        self._sorted_spec = spec
+        self._sync_filtered_rows()
         self._modified()
 
 
-    def set_focus_column(self, index):
-        idx = [i for i, c in enumerate(self.visible_columns)
+    def column_sort_key(self, name):
+        return next(
+            (c.sort_key for c in self.data_columns if c.name == name),
+            None
+        )
+
+    def sort_order(self, spec, key=None, positions=None):
+        order = list(range(len(self.df)) if positions is None else positions)
+        # stable sorts from the least significant column up
+        for name, reverse in reversed(spec):
+            if key and name == spec[0][0]:
+                sort_key = key
+            else:
+                sort_key = self.column_sort_key(name)
+            keys = self.sort_keys(name, sort_key)
+            order.sort(key=keys.__getitem__, reverse=reverse)
+        return order
+
+    def focus_column_position(self, index):
+        return [i for i, c in enumerate(self.visible_columns)
                    if not isinstance(c, DataTableDivider)
         ][index]
 
+    def set_focus_column(self, index):
+        idx = self.focus_column_position(index)
+
         if self.with_header:
             self.header.set_focus_column(idx)
 
@@ -944,6 +1891,8 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
 
     def sort_index(self):
         self.df.sort_index()
+        self._sorted_spec = None
+        self._sync_filtered_rows()
         self._modified()
 
     def add_columns(self, columns, data=None):
@@ -1027,8 +1976,7 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
             raise NotImplementedError
         if self.with_header:
             self.header.update()
-        for r in self:
-            r.update()
+        self.resize_body_rows()
         if self.with_footer:
             self.footer.update()
         #     r.resize_column(index, size)
@@ -1144,8 +2092,16 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
             logger.warning(f"{sum(widths)} != {sum(new_widths)}")
 
     def resize_body_rows(self):
-        for r in self:
-            r.on_resize()
+        # rows check the generation when they're next measured or rendered,
+        # so only the ones that come into view pay for the resize.  Rows
+        # painted since the last resize may have cached canvases, which have
+        # to be dropped for that check to happen.
+        self.width_generation += 1
+        self._body_column_widths.clear()
+        for r in list(self.painted_rows):
+            r._invalidate()
+        self.painted_rows.clear()
+        self._modified()
 
     # def toggle_details(self):
     #     self.selection.toggle_details()
@@ -1188,21 +2144,238 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
 
     def add_row(self, data, sort=True):
 
-        self.df.append_rows([data])
-        if sort:
-            self.sort_by_column()
-        self.apply_filters()
+        focused = None
+        if self.sort_refocus and len(self):
+            focused = self.position_to_index(self._focus)
+        count = len(self.df)
+        indexes = self.df.append_rows([data])
+        count = max(count - len(self.drop_evicted()), 0)
+        self.bump_row_versions(indexes)
+        self.refresh_calculated_fields(indexes)
+        self.update_content_widths(indexes)
+        self.update_aggregates(indexes)
+        self.update_lookups(indexes)
+        if self.sort_column is not None:
+            focus_column = self.focus_column_position(self.sort_column)
+            for index in indexes:
+                self.df.set(index, "_focus_position", focus_column)
+        spec = [(c, bool(r)) for c, r in self.sort_spec] if sort else None
+        if spec and self.sort_by[0]:
+            # the new row goes in where it sorts, rather than re-sorting the
+            # whole table; one that isn't sorted yet gets sorted once
+            self.merge_sorted(spec, count, spec != self._sorted_spec)
+        else:
+            self._sorted_spec = None
+        self.filter_rows(indexes)
+        if focused is not None and self.has_index(focused):
+            self._focus = self.get_position(focused)
+        self.update_empty_message()
+
+    def drop_evicted(self):
+        # rows a capacity-limited dataframe pushed out to make room; their
+        # widths are left alone so a rolling log's columns don't jitter
+        evicted = self.df.pop_evicted()
+        if not evicted:
+            return evicted
+        try:
+            focused = self.position_to_index(self._focus)
+        except IndexError:
+            focused = None
+        self._forget_rows(evicted, widths=False)
+        position = self.get_position(focused)
+        if position is not None:
+            self._focus = position
+        else:
+            self._focus = max(min(self._focus, len(self)-1), 0)
+        return evicted
+
+    def ingest_rows(self, rows):
+
+        # Insert a batch of streamed rows in sorted position, drop whatever the
+        # retention policy no longer keeps, and repaint once.
+        rows = list(rows)
+        if not rows:
+            return []
+        try:
+            focused = self.position_to_index(self._focus)
+        except IndexError:
+            focused = None
+
+        # edits since the last sort clear _sorted_spec, so go by the spec the
+        # table is meant to be sorted by and put it back in order first
+        spec = [(c, bool(r)) for c, r in self.sort_spec]
+        if spec and spec != self._sorted_spec:
+            self.df._reorder(self.sort_order(spec))
+        count = len(self.df)
+        indexes = self.df.update_rows(rows, with_sidecar=self.with_sidecar)
+        # evicted rows came off the front, but some may have been new
+        # ones; a shorter prefix of old rows is still in order
+        count = max(count - len(self.drop_evicted()), 0)
+        self.cells_changed(indexes)
+        self.refresh_calculated_fields(indexes)
+
+        now = time.monotonic()
+        for index in indexes:
+            self._ingested[index] = now
+            self._ingested.move_to_end(index)
+
+        if spec:
+            positions = self.df._index_map()
+            self.merge_sorted(spec, count, any(positions[i] < count for i in indexes))
+
+        expired = self.expired_rows(now)
+        if expired:
+            self._delete_rows(expired)
+        self.filter_rows(indexes)
+
+        if focused is not None and self.has_index(focused):
+            self._focus = self.get_position(focused)
+        else:
+            self._focus = max(min(self._focus, len(self)-1), 0)
+        self.update_empty_message()
+        self._modified()
+        return indexes
+
+    def merge_sorted(self, spec, count, resort=False):
+        # rows from position count on are new; the rest are already in order
+        if len(spec) == 1 and not resort:
+            name, reverse = spec[0]
+            sort_key = self.column_sort_key(name)
+            index = self.df.index
+            new = index[count:]
+            new_keys = self.sort_keys(name, sort_key, new)
+            order = sorted(range(len(new)), key=new_keys.__getitem__, reverse=reverse)
+
+            def position(key):
+                # after any equal keys, as a stable sort would put it; only
+                # the keys the search visits are looked at
+                lo, hi = 0, count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    other = self.sort_keys(name, sort_key, [index[mid]])[0]
+                    if (key > other) if reverse else (key < other):
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                return lo
+
+            if len(new) <= self.SORT_INSERT_LIMIT:
+                positions = [None] * len(new)
+                for n, j in enumerate(order):
+                    positions[j] = position(new_keys[j]) + n
+                if positions != list(range(count, len(index))):
+                    self.df._move_rows(count, positions)
+                order = None
+            elif order == list(range(len(new))):
+                # everything new already sorts after what's there, as in a log
+                last = count and new and self.sort_keys(name, sort_key, [index[count-1]])[0]
+                if not (count and new) or (
+                        new_keys[0] <= last if reverse else new_keys[0] >= last):
+                    order = None
+            if order is not None:
+                keys = self.sort_keys(name, sort_key)
+                self.df._reorder(heapq.merge(
+                    range(count), [count + j for j in order],
+                    key=keys.__getitem__, reverse=reverse
+                ))
+        else:
+            self.df._reorder(self.sort_order(spec))
+            self._sync_filtered_rows()
+        self._sorted_spec = spec
+
+    def expired_rows(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        if self.retain_seconds is not None:
+            cutoff = now - self.retain_seconds
+            while self._ingested and next(iter(self._ingested.values())) < cutoff:
+                expired.append(self._ingested.popitem(last=False)[0])
+        if self.retain_rows is not None:
+            while len(self._ingested) > self.retain_rows:
+                expired.append(self._ingested.popitem(last=False)[0])
+        return expired
+
+    def expire_rows(self):
+        expired = self.expired_rows()
+        if expired:
+            self.delete_rows(expired)
+            self._modified()
+        return expired
+
+    def stream_rows(self, source):
+        # source is an iterator or async iterator of row batches
+        return asyncio.get_event_loop().create_task(self._stream_rows(source))
+
+    async def _stream_rows(self, source):
+        try:
+            if hasattr(source, "__aiter__"):
+                async for batch in source:
+                    self.queue_rows(batch)
+            else:
+                source = iter(source)
+                done = object()
+                while True:
+                    # the iterator may block waiting for input
+                    batch = await asyncio.get_event_loop().run_in_executor(
+                        None, next, source, done
+                    )
+                    if batch is done:
+                        break
+                    self.queue_rows(batch)
+        finally:
+            self.flush_rows()
+
+    def queue_rows(self, rows):
+        # rows queued within one ingest_interval are ingested together
+        self._pending_rows.extend(rows)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_later(
+                self.ingest_interval, self.flush_rows
+            )
+
+    def flush_rows(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        rows, self._pending_rows = self._pending_rows, []
+        return self.ingest_rows(rows)
 
     def delete_rows(self, indexes):
 
-        self.df.delete_rows(indexes)
-        self.apply_filters()
+        if not isinstance(indexes, list):
+            indexes = [indexes]
+        self._delete_rows(indexes)
         if self.focus_position > 0 and self.focus_position >= len(self)-1:
             self.focus_position = len(self)-1
 
+    def _delete_rows(self, indexes):
+        self.df.delete_rows(indexes)
+        self._forget_rows(indexes)
+
+    def _forget_rows(self, indexes, widths=True):
+        # drop everything kept per row for rows no longer in the dataframe
+        self._remove_filtered_rows(indexes)
+        self.uncache_rows(indexes)
+        for cache in self._format_caches.values():
+            cache.discard(indexes)
+        for i in indexes:
+            self._row_versions.pop(i, None)
+            self._calculated_versions.pop(i, None)
+        if widths:
+            self.invalidate_content_widths()
+        self.update_aggregates(indexes)
+        self.update_lookups(indexes)
+        for keys in self._sort_keys.values():
+            for i in indexes:
+                keys[1].pop(i, None)
+        for i in indexes:
+            self._ingested.pop(i, None)
+
 
     def invalidate(self):
         self.df["_dirty"] = True
+        self._canvas_cache.clear()
         if self.with_header:
             self.header.update()
         if self.with_footer:
@@ -1213,10 +2386,9 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
     def invalidate_rows(self, indexes):
         if not isinstance(indexes, list):
             indexes = [indexes]
-        for index in indexes:
-            self.refresh_calculated_fields(index)
-
+        self.cells_changed(indexes)
         self.df[indexes, "_dirty"] = True
+        self.refresh_calculated_fields(indexes)
         self._modified()
         # FIXME: update header / footer if dynamic
 
@@ -1265,25 +2437,98 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         elif not isinstance(filters, list):
             filters = [filters]
 
-        self.filtered_rows = list(
-            row[self.df.index_name]
-            for i, row in enumerate(self.df.iterrows())
-            if not filters or all(
-                    f(row)
-                    for f in filters
+        self.filters = filters
+        if self.query_filters:
+            self.reset()
+            return
+        self._apply_filters(filters)
+
+    def _apply_filters(self, filters):
+
+        indexes = self.df.index
+        expressions, callables = [
+            list(x) for x in partition(
+                lambda f: not isinstance(f, FilterExpression),
+                filters or []
             )
-        )
+        ]
+        if expressions:
+            # narrow to the rows column lookups can answer for, then test
+            # the rest of the expressions on just those rows
+            matched = [(e, self.lookup_filter(e)) for e in expressions]
+            found = [m for e, m in matched if m is not None]
+            if found:
+                positions = self.df._index_map()
+                indexes = sorted(set.intersection(*found), key=positions.__getitem__)
+                callables = [e for e, m in matched if m is None] + callables
+            else:
+                indexes = list(itertools.compress(indexes, And(*expressions).mask(self.df)))
+        self.filtered_rows = self.match_filters(indexes, filters=callables)
         # if self.focus_position > len(self):
         #     self.focus_position = len(self)-1
 
         # logger.debug("filtered: %s" %(self.filtered_rows))
 
-
-        self.filters = filters
         # self.invalidate()
 
+    def match_filters(self, indexes, positions=None, filters=None):
+
+        if filters is None:
+            filters = self.filters
+        if not filters:
+            return list(indexes)
+        if positions is None:
+            positions = self.df._index_map()
+
+        matched = []
+        for index in indexes:
+            row = self.df.get_location(positions[index], as_dict=True)
+            if all(f(row) for f in filters):
+                matched.append(index)
+        return matched
+
+    def filter_rows(self, indexes, prune=False):
+
+        positions = self.df._index_map()
+        if prune:
+            self._remove_filtered_rows(
+                [i for i in self._filtered_rows if i not in positions]
+            )
+
+        indexes = [i for i in dict.fromkeys(indexes) if i in positions]
+        if not indexes:
+            return
+        matched = set(self.match_filters(indexes, positions))
+
+        if len(indexes) > self.FILTER_BISECT_LIMIT:
+            current = self._filtered_positions
+            rows = self._filtered_rows
+            if (not any(i in current for i in indexes)
+                and (not rows
+                     or min(positions[i] for i in indexes) > positions[rows[-1]])):
+                # all past the last filtered row, so they just go on the end
+                start = len(rows)
+                rows.extend(sorted(
+                    (i for i in indexes if i in matched), key=positions.__getitem__
+                ))
+                self._reindex_filtered_rows(start)
+                self.update_aggregates(rows[start:], scope="filtered")
+                return
+            # cheaper to merge in one pass than to insert rows one at a time
+            changed = set(indexes)
+            self.filtered_rows = [
+                i for i in self.df.index
+                if i in matched or (i in current and i not in changed)
+            ]
+            return
+
+        self._remove_filtered_rows([i for i in indexes if i not in matched])
+        for index in indexes:
+            if index in matched and index not in self._filtered_positions:
+                self._insert_filtered_row(index, positions)
+
     def clear_filters(self):
-        self.filtered_rows = list(range(len(self.df)))
+        self.filtered_rows = self.df.index
         self.filters = None
         # self.invalidate()
 
@@ -1297,11 +2542,59 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         self.listbox._invalidate()
 
 
+    def query_row_index(self, row):
+        if self.with_sidecar:
+            row = row[0]
+        return self.df.extract_value(row, self.index) if self.index else None
+
+    @property
+    def query_sort_by(self):
+        return self.sort_by if self.query_sort else (None, False)
+
+    def row_cursor(self, index, direction="forward"):
+        # the cursor has to follow the order the query was asked for, which
+        # is the index unless the query sorts
+        column, reverse = self.query_sort_by
+        if not column:
+            column = self.index
+        if column == self.index:
+            value = index
+        else:
+            value = self.df.get(index, column) if column else None
+        return DataTableCursor(column, value, index, reverse=reverse, direction=direction)
+
+    def load_previous(self):
+        if self.pagination_start is None or self.query_pending:
+            return False
+        return self.requery(direction="backward")
+
+    def prefetch_rows(self):
+        # a blocking query would stall the event loop as badly as one run
+        # from render, so only prefetch when queries run in the background
+        if not self.prefetch or not self.limit or not self.async_query:
+            return 0
+        if isinstance(self.prefetch, tuple):
+            unit, distance = self.prefetch
+            if unit == "pages":
+                return int(distance * self.limit)
+            elif unit == "rows":
+                return distance
+            raise ValueError("unknown prefetch unit: %s" %(unit))
+        return self.prefetch
+
+    def prefetch_page(self, position):
+        if self.query_exhausted:
+            return False
+        return self.load_more(position)
+
     def load_more(self, position):
 
         # logger.debug("load_more")
         if position is not None and position > len(self):
             return False
+        if self.query_pending:
+            # the next page is already on its way
+            return False
         self.page += 1
         # self.page = len(self) // self.limit
         offset = (self.page)*self.limit
@@ -1319,9 +2612,25 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
 
         return updated
 
-    def requery(self, offset=None, limit=None, load_all=False, **kwargs):
-        logger.debug(f"requery: {offset}, {limit}")
-        if (offset is not None) and self.limit:
+    @property
+    def query_pending(self):
+        return self._query_task is not None and not self._query_task.done()
+
+    def cancel_query(self):
+        if self.query_pending:
+            self._query_task.cancel()
+        self._query_task = None
+
+    def requery(self, offset=None, limit=None, load_all=False, callback=None,
+                direction="forward", **kwargs):
+        logger.debug(f"requery: {offset}, {limit}, {direction}")
+        self.query_generation += 1
+        # whatever is still in flight was asked for with the old sort, filters
+        # or page and would be thrown away anyway
+        self.cancel_query()
+        if direction == "backward":
+            limit = self.limit
+        elif (offset is not None) and self.limit:
             self.page = offset // self.limit
             offset = self.page*self.limit
             limit = self.limit
@@ -1331,48 +2640,120 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
             offset = 0
 
         kwargs = {"load_all": load_all}
-        if self.query_sort:
-            kwargs["sort"] = self.sort_by
-        else:
-            kwargs["sort"] = (None, False)
+        kwargs["sort"] = self.query_sort_by
+        if self.query_filters:
+            kwargs["filters"] = self.filters
         limit = limit or self.limit
         if limit:
             kwargs["offset"] = offset
             kwargs["limit"] = limit
 
-        if offset:
+        if direction == "backward":
+            kwargs["cursor"] = self.pagination_start
+        elif offset:
             kwargs["cursor"] = self.pagination_cursor
+        else:
+            # a fresh load rather than the next page
+            direction = None
+
+        if self.data is None and self.async_query:
+            self._query_task = asyncio.get_event_loop().create_task(
+                self.run_query(kwargs, self.query_generation, callback, limit, direction)
+            )
+            if not len(self.df) and self.loading_message:
+                self.show_message(self.loading_message)
+            return None
 
         rows = list(self.query(**kwargs)) if self.data is None else self.data
+        updated = self.apply_query(rows, limit=limit, direction=direction)
+        if callback:
+            callback()
+        return updated
+
+    async def run_query(self, kwargs, generation, callback=None, limit=None,
+                        direction=None):
+
+        try:
+            if inspect.isasyncgenfunction(self.query):
+                rows = [row async for row in self.query(**kwargs)]
+            elif asyncio.iscoroutinefunction(self.query):
+                rows = list(await self.query(**kwargs))
+            else:
+                # blocking query, so keep it off the event loop
+                rows = await asyncio.get_event_loop().run_in_executor(
+                    self.query_executor, lambda: list(self.query(**kwargs))
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("query failed")
+            if generation == self.query_generation:
+                self._query_task = None
+                self.hide_message()
+            raise
+
+        if generation != self.query_generation:
+            return
+        self._query_task = None
+        self.apply_query(rows, limit=limit, direction=direction)
+        if callback:
+            callback()
+
+    def apply_query(self, rows, limit=None, direction=None):
 
-        if len(rows) and self.sort_by[0]:
-            self.pagination_cursor = getattr(rows[-1], self.sort_by[0])
+        # a short page means there's nothing left to prefetch
+        exhausted = self.data is not None or not limit or len(rows) < limit
+        if direction != "backward":
+            self.query_exhausted = exhausted
 
+        count = len(self.df)
         updated = self.df.update_rows(rows, replace=self.limit is None, with_sidecar = self.with_sidecar)
+        count = max(count - len(self.drop_evicted()), 0)
+        # cursors go at the ends of the page fetched, whether or not those
+        # rows changed; rows without an index were all added, so they did
+        ends = [self.query_row_index(r) for r in (rows[0], rows[-1])] if len(rows) else []
+        if None in ends:
+            ends = updated[:1] + updated[-1:]
+        positions = self.df._index_map()
+        if ends and all(i in positions for i in ends):
+            if direction != "backward":
+                self.pagination_cursor = self.row_cursor(ends[-1], "forward")
+            if direction != "forward" or self.pagination_start is None:
+                self.pagination_start = self.row_cursor(ends[0], "backward")
+        self.prune_aggregates()
+        self.prune_lookups()
+        self.cells_changed(updated)
 
         self.df["_focus_position"] = self.sort_column
 
         self.refresh_calculated_fields()
-        self.apply_filters()
+        self.filter_rows(updated, prune=True)
+        if direction == "backward" and len(self.df) > count:
+            try:
+                focused = self.position_to_index(self._focus)
+            except IndexError:
+                focused = None
+            # new rows go in front of what's already loaded
+            self.df._reorder(
+                itertools.chain(range(count, len(self.df)), range(count))
+            )
+            self._sync_filtered_rows()
+            if focused is not None:
+                self.focus_position = self.get_position(focused, 0)
         if not self.query_sort:
             self.sort_by_column(self.initial_sort)
 
 
-        if len(updated):
-            for i in updated:
-                if not i in self.filtered_rows:
-                    continue
-                pos = self.index_to_position(i)
-                self[pos].update()
-            # self.sort_by_column(*self.sort_by)
-
+        # update_rows marks changed rows dirty, so get_row rebuilds only those
+        # the next time they're rendered.
         self._modified()
         self._emit("requery", self.row_count())
 
-        if not len(self) and self.empty_message:
-            self.show_message(self.empty_message)
-        else:
-            self.hide_message()
+        if self.with_footer and any(c.footer_aggregate for c in self.data_columns):
+            # aggregates are already up to date, so this is cheap
+            self.footer.update()
+
+        self.update_empty_message()
         return len(updated)
         # self.invalidate()
 
@@ -1383,7 +2764,6 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         idx = None
         pos = 0
         # limit = len(self)-1
-        self.df.delete_all_rows()
         if reset:
             self.page = 0
             offset = 0
@@ -1396,19 +2776,34 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
                 pos = None
             limit = len(self)
         # del self[:]
-        self.requery(offset=offset, limit=limit)
 
-            # self.sort_by_column(self.sort_by[0], key=column.sort_key)
-        if self._initialized:
-            self.pack_columns()
+        # everything that points at the old rows goes with them, so the table
+        # can render while an async query is still running
+        self.df.delete_all_rows()
+        self._ingested.clear()
+        self._aggregates.clear()
+        self._lookups.clear()
+        self.invalidate_sort_keys()
+        self.invalidate_content_widths(estimated=True)
+        self.clear_format_caches()
+        self.uncache_rows()
+        self.filtered_rows = []
+        self._focus = 0
 
-        if idx:
-            try:
-                pos = self.index_to_position(idx)
-            except:
-                return
-        if pos is not None:
-            self.focus_position = pos
+        def restore_focus():
+            nonlocal pos
+            if self._initialized:
+                self.pack_columns()
+
+            if idx:
+                try:
+                    pos = self.index_to_position(idx)
+                except:
+                    return
+            if pos is not None:
+                self.focus_position = pos
+
+        self.requery(offset=offset, limit=limit, callback=restore_focus)
 
         # self.focus_position = 0
 
@@ -1425,6 +2820,7 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
     def reset(self, reset_sort=False):
 
         self.pagination_cursor = None
+        self.pagination_start = None
         self.refresh(reset=True)
 
         if reset_sort and self.initial_sort is not None:
@@ -1467,6 +2863,12 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         self.resize_body_rows()
 
 
+    def update_empty_message(self):
+        if not len(self) and self.empty_message:
+            self.show_message(self.empty_message)
+        else:
+            self.hide_message()
+
     def show_message(self, message):
 
         if self._message_showing:
@@ -1495,17 +2897,142 @@ class DataTable(urwid.WidgetWrap, urwid.listbox.ListWalker):
         if not self._message_showing:
             return
         self.listbox_placeholder.original_widget = self.listbox
+        self._message_showing = False
+
+    def new_dataframe(self):
+        dataframe_kwargs = {}
+        dataframe_class = self.dataframe_class
+        if self.capacity:
+            if dataframe_class is DataTableDataFrame:
+                dataframe_class = RingBufferDataFrame
+            elif not issubclass(dataframe_class, RingBufferDataFrame):
+                raise ValueError(
+                    "capacity needs a RingBufferDataFrame, not %s" %(dataframe_class.__name__)
+                )
+            dataframe_kwargs["capacity"] = self.capacity
+        return dataframe_class(
+            columns = self.column_names,
+            sort=False,
+            index_name = self.index or None,
+            **dataframe_kwargs
+        )
 
     def load(self, path):
 
+        if is_mapped_file(path):
+            self.load_mapped(path)
+            return
+        elif is_snapshot_file(path):
+            self.load_snapshot(path)
+            return
+
         with open(path, "r") as f:
             json = "\n".join(f.readlines())
-            self.df = DataTableDataFrame.from_json(json)
+            self.df = self.dataframe_class.from_json(json)
         self.reset()
 
-    def save(self, path):
-        # print(path)
-        with open(path, "w") as f:
-            f.write(self.df.to_json())
+    def _loaded(self, resort=True):
+        # rows come from a file rather than a query, so reset everything
+        # derived from the old rows without requerying
+        self._ingested.clear()
+        self._aggregates.clear()
+        self._lookups.clear()
+        self.invalidate_sort_keys()
+        self.invalidate_content_widths(estimated=True)
+        self.clear_format_caches()
+        self.uncache_rows()
+        self.pagination_cursor = None
+        self.pagination_start = None
+        self.query_exhausted = True
+        self.filtered_rows = self.df.index
+        if not resort:
+            return
+        # sorted and filtered here, as there's nothing to query
+        spec = [(c, bool(r)) for c, r in self.sort_spec]
+        if spec:
+            self.sort(spec)
+        if self.filters:
+            self._apply_filters(self.filters)
+
+    def load_mapped(self, path):
+        # rows stay in the file and are read as they're rendered, so there's
+        # no query to run; only the index comes into memory up front
+        if isinstance(self.df, MappedDataFrame):
+            self.df.close()
+        self.df = MappedDataFrame(path)
+        self._loaded()
+        self._modified()
+        if len(self):
+            self.set_focus(0)
+
+    def load_snapshot(self, path):
+        if isinstance(self.df, MappedDataFrame):
+            self.df.close()
+            self.df = self.new_dataframe()
+        else:
+            self.df.delete_all_rows()
+        # collecting while a million rows' worth of new objects are
+        # allocated costs more than reading them
+        collect = gc.isenabled()
+        gc.disable()
+        try:
+            header, data = read_snapshot(path)
+            if data[self.df.index_name]:
+                data["_cls"] = [dict] * len(data[self.df.index_name])
+                self.df.upsert_rows(data)
+            self.df.pop_evicted()
+            # the saved state says how the rows are sorted and filtered
+            self._loaded(resort=False)
+        finally:
+            if collect:
+                gc.enable()
+        self.restore_state(header["state"])
+
+    def snapshot_state(self):
+        expressions = [f for f in self.filters or [] if isinstance(f, FilterExpression)]
+        state = dict(
+            sort_spec=self.sort_spec,
+            sorted_spec=self._sorted_spec,
+            filters=[f.to_dict() for f in expressions],
+            focus=self.position_to_index(self._focus) if len(self) else None
+        )
+        if len(expressions) < len(self.filters or []):
+            # other callables can't be saved, so keep what they matched
+            logger.warning(
+                "filters that aren't filter expressions can't be saved; "
+                "the snapshot keeps the rows they matched, and rows added "
+                "after it's loaded won't match"
+            )
+            state["filtered"] = list(self.filtered_rows)
+        return state
+
+    def restore_state(self, state):
+        if state.get("sorted_spec"):
+            # rows were saved in this order, so there's nothing to re-sort
+            self._sorted_spec = [tuple(s) for s in state["sorted_spec"]]
+        if state.get("sort_spec") and state["sort_spec"][0][0]:
+            self.sort_by_column([tuple(s) for s in state["sort_spec"]])
+        filters = [FilterExpression.from_dict(f) for f in state.get("filters", [])]
+        if "filtered" in state:
+            # stands in for the callables that couldn't be saved
+            filters.append(In(self.df.index_name, state["filtered"]))
+        self.filters = filters or None
+        if filters:
+            self._apply_filters(filters)
+        self._modified()
+        if not len(self):
+            return
+        self.set_focus(self.get_position(state.get("focus"), 0))
+
+    def save(self, path, format="json", compress=False):
+        if format == "snapshot":
+            write_snapshot(path, self.df, state=self.snapshot_state(), compress=compress)
+        elif format == "mapped":
+            write_mapped(path, self.df)
+        elif format == "json":
+            with open(path, "w") as f:
+                f.write(self.df.to_json())
+        else:
+            raise ValueError("unknown format: %s" %(format))
 
 __all__ = ["DataTable", "DataTableColumn"]
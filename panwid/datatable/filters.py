@@ -0,0 +1,539 @@
+import logging
+logger = logging.getLogger("panwid.datatable")
+import re
+import operator
+from functools import reduce
+
+try:
+    import numpy as np
+    HAVE_NUMPY=True
+except ImportError:
+    HAVE_NUMPY=False
+
+from .columnar import ArrayColumn, value_kind
+
+
+def make_mask(values):
+    if HAVE_NUMPY:
+        return np.fromiter(values, dtype=bool)
+    return list(values)
+
+def mask_and(a, b):
+    if HAVE_NUMPY:
+        return a & b
+    return [x and y for x, y in zip(a, b)]
+
+def mask_or(a, b):
+    if HAVE_NUMPY:
+        return a | b
+    return [x or y for x, y in zip(a, b)]
+
+def mask_not(a):
+    if HAVE_NUMPY:
+        return ~a
+    return [not x for x in a]
+
+def quote_column(name):
+    return '"%s"' %(name.replace('"', '""'))
+
+
+class FilterExpression(object):
+
+    def __call__(self, row):
+        raise NotImplementedError
+
+    def mask(self, df):
+        raise NotImplementedError
+
+    # Expressions follow SQL's three-valued logic: a comparison with a null
+    # is neither true nor false but unknown, and so is its negation.  The
+    # expression itself (and mask) only says whether a row is true; these
+    # say whether it's unknown, which Not, And and Or need to combine them.
+
+    def unknown(self, row):
+        return False
+
+    def unknown_mask(self, df):
+        return make_mask(False for i in range(len(df)))
+
+    def to_sql(self):
+        raise NotImplementedError
+
+    def args(self):
+        # constructor arguments, for to_dict
+        raise NotImplementedError
+
+    def to_dict(self):
+        return dict(
+            filter=self.__class__.__name__,
+            args=[a.to_dict() if isinstance(a, FilterExpression) else a
+                  for a in self.args()]
+        )
+
+    @staticmethod
+    def from_dict(d):
+        cls = FILTERS[d["filter"]]
+        return cls(*[
+            FilterExpression.from_dict(a) if isinstance(a, dict) and "filter" in a else a
+            for a in d["args"]
+        ])
+
+    def __and__(self, other):
+        if not isinstance(other, FilterExpression):
+            return NotImplemented
+        return And(self, other)
+
+    def __or__(self, other):
+        if not isinstance(other, FilterExpression):
+            return NotImplemented
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class ColumnFilter(FilterExpression):
+
+    def __init__(self, column):
+        self.column = column
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.column}>"
+
+    def test(self, value):
+        raise NotImplementedError
+
+    def array_mask(self, col):
+        # vectorized mask for a typed column, or None if the filter has to be
+        # evaluated value by value
+        return None
+
+    def tests_null(self):
+        # whether a null value gives a definite answer rather than unknown
+        return False
+
+    def __call__(self, row):
+        return self.test(row.get(self.column))
+
+    def unknown(self, row):
+        return row.get(self.column) is None and not self.tests_null()
+
+    def column_values(self, df):
+        if self.column == df.index_name:
+            return df.index
+        elif self.column in df.columns:
+            return df.column_data(self.column)
+        return [None] * len(df)
+
+    def mask(self, df):
+        col = self.column_values(df)
+        if isinstance(col, ArrayColumn):
+            mask = self.array_mask(col)
+            if mask is not None:
+                return mask
+        return make_mask(self.test(v) for v in col)
+
+    def unknown_mask(self, df):
+        if self.tests_null():
+            return super().unknown_mask(df)
+        col = self.column_values(df)
+        if isinstance(col, ArrayColumn):
+            return col.mask.copy()
+        return make_mask(v is None for v in col)
+
+
+class Compare(ColumnFilter):
+
+    OPS = {
+        "==": operator.eq,
+        "!=": operator.ne,
+        "<": operator.lt,
+        "<=": operator.le,
+        ">": operator.gt,
+        ">=": operator.ge
+    }
+
+    def __init__(self, column, op, value):
+        if op not in self.OPS:
+            raise ValueError("unknown comparison operator: %s" %(op))
+        super().__init__(column)
+        self.op = op
+        self.value = value
+        self.fn = self.OPS[op]
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.column} {self.op} {self.value!r}>"
+
+    def args(self):
+        return (self.column, self.op, self.value)
+
+    def tests_null(self):
+        # == None and != None are IS NULL and IS NOT NULL
+        return self.value is None and self.op in ("==", "!=")
+
+    def unknown(self, row):
+        if self.value is None and not self.tests_null():
+            return True
+        return super().unknown(row)
+
+    def unknown_mask(self, df):
+        if self.value is None and not self.tests_null():
+            return make_mask(True for i in range(len(df)))
+        return super().unknown_mask(df)
+
+    def test(self, value):
+        if self.value is None:
+            if self.op == "==":
+                return value is None
+            elif self.op == "!=":
+                return value is not None
+            return False
+        elif value is None:
+            return False
+        try:
+            return bool(self.fn(value, self.value))
+        except TypeError:
+            return False
+
+    def array_mask(self, col):
+        if self.value is None:
+            if self.op == "==":
+                return col.mask.copy()
+            elif self.op == "!=":
+                return ~col.mask
+            return np.zeros(len(col), dtype=bool)
+        if not value_kind(self.value):
+            return None
+        return self.fn(col.values, self.value) & ~col.mask
+
+    def to_sql(self):
+        column = quote_column(self.column)
+        if self.value is None:
+            if self.op == "==":
+                return (f"{column} IS NULL", [])
+            elif self.op == "!=":
+                return (f"{column} IS NOT NULL", [])
+        op = {"==": "=", "!=": "<>"}.get(self.op, self.op)
+        return (f"{column} {op} ?", [self.value])
+
+
+class In(ColumnFilter):
+
+    def __init__(self, column, values):
+        super().__init__(column)
+        self.values = list(values)
+        try:
+            self.lookup = set(self.values)
+        except TypeError:
+            self.lookup = self.values
+
+    def args(self):
+        return (self.column, self.values)
+
+    def tests_null(self):
+        return None in self.values
+
+    def test(self, value):
+        try:
+            return value in self.lookup
+        except TypeError:
+            return False
+
+    def array_mask(self, col):
+        values = [v for v in self.values if value_kind(v)]
+        mask = np.isin(col.values, values) & ~col.mask
+        if None in self.values:
+            mask |= col.mask
+        return mask
+
+    def to_sql(self):
+        column = quote_column(self.column)
+        values = [v for v in self.values if v is not None]
+        clauses = []
+        if values:
+            clauses.append(
+                "%s IN (%s)" %(column, ", ".join("?" for v in values))
+            )
+        if len(values) < len(self.values):
+            clauses.append(f"{column} IS NULL")
+        if not clauses:
+            return ("0 = 1", [])
+        elif len(clauses) == 1:
+            return (clauses[0], values)
+        return ("(%s)" %(" OR ".join(clauses)), values)
+
+
+class Contains(ColumnFilter):
+
+    def __init__(self, column, text, case=True):
+        super().__init__(column)
+        self.text = text
+        self.case = case
+        self.folded = text if case else text.lower()
+
+    def args(self):
+        return (self.column, self.text, self.case)
+
+    def test(self, value):
+        if not isinstance(value, str):
+            return False
+        if not self.case:
+            value = value.lower()
+        return self.folded in value
+
+    def array_mask(self, col):
+        return np.zeros(len(col), dtype=bool)
+
+    def to_sql(self):
+        column = quote_column(self.column)
+        pattern = "%%%s%%" %(
+            self.folded.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        if not self.case:
+            column = f"lower({column})"
+        return (f"{column} LIKE ? ESCAPE '\\'", [pattern])
+
+
+class Between(ColumnFilter):
+
+    def __init__(self, column, low=None, high=None):
+        super().__init__(column)
+        self.low = low
+        self.high = high
+
+    def args(self):
+        return (self.column, self.low, self.high)
+
+    def tests_null(self):
+        # with no bounds it's IS NOT NULL
+        return self.low is None and self.high is None
+
+    def test(self, value):
+        if value is None:
+            return False
+        try:
+            return ((self.low is None or value >= self.low)
+                    and (self.high is None or value <= self.high))
+        except TypeError:
+            return False
+
+    def array_mask(self, col):
+        if any(v is not None and not value_kind(v) for v in (self.low, self.high)):
+            return None
+        mask = ~col.mask
+        if self.low is not None:
+            mask &= col.values >= self.low
+        if self.high is not None:
+            mask &= col.values <= self.high
+        return mask
+
+    def to_sql(self):
+        column = quote_column(self.column)
+        if self.low is not None and self.high is not None:
+            return (f"{column} BETWEEN ? AND ?", [self.low, self.high])
+        elif self.low is not None:
+            return (f"{column} >= ?", [self.low])
+        elif self.high is not None:
+            return (f"{column} <= ?", [self.high])
+        return (f"{column} IS NOT NULL", [])
+
+
+class Match(ColumnFilter):
+
+    def __init__(self, column, pattern, flags=0):
+        super().__init__(column)
+        self.regex = re.compile(pattern, flags)
+
+    def args(self):
+        return (self.column, self.regex.pattern, self.regex.flags)
+
+    def test(self, value):
+        return isinstance(value, str) and self.regex.search(value) is not None
+
+    def array_mask(self, col):
+        return np.zeros(len(col), dtype=bool)
+
+    def to_sql(self):
+        return (f"{quote_column(self.column)} REGEXP ?", [self.regex.pattern])
+
+
+class And(FilterExpression):
+
+    SQL_OP = "AND"
+
+    def __init__(self, *exprs):
+        self.exprs = []
+        for e in exprs:
+            if not isinstance(e, FilterExpression):
+                raise TypeError("%s is not a filter expression" %(e,))
+            if type(e) is type(self):
+                self.exprs.extend(e.exprs)
+            else:
+                self.exprs.append(e)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.exprs}>"
+
+    def args(self):
+        return self.exprs
+
+    def __call__(self, row):
+        return all(e(row) for e in self.exprs)
+
+    def unknown(self, row):
+        # unknown if nothing is false and something is unknown
+        unknown = False
+        for e in self.exprs:
+            if e.unknown(row):
+                unknown = True
+            elif not e(row):
+                return False
+        return unknown
+
+    def combine(self, a, b):
+        return mask_and(a, b)
+
+    def mask(self, df):
+        if not self.exprs:
+            return make_mask(True for i in range(len(df)))
+        return reduce(self.combine, (e.mask(df) for e in self.exprs))
+
+    def unknown_mask(self, df):
+        if not self.exprs:
+            return super().unknown_mask(df)
+        unknown = [e.unknown_mask(df) for e in self.exprs]
+        false = [
+            mask_not(mask_or(m, u))
+            for m, u in zip((e.mask(df) for e in self.exprs), unknown)
+        ]
+        return mask_and(reduce(mask_or, unknown), mask_not(reduce(mask_or, false)))
+
+    def to_sql(self):
+        if not self.exprs:
+            return ("1 = 1", [])
+        clauses = [e.to_sql() for e in self.exprs]
+        return (
+            "(%s)" %((" %s " %(self.SQL_OP)).join(c[0] for c in clauses)),
+            [p for c in clauses for p in c[1]]
+        )
+
+
+class Or(And):
+
+    SQL_OP = "OR"
+
+    def __call__(self, row):
+        return any(e(row) for e in self.exprs)
+
+    def unknown(self, row):
+        # unknown if nothing is true and something is unknown
+        return not self(row) and any(e.unknown(row) for e in self.exprs)
+
+    def combine(self, a, b):
+        return mask_or(a, b)
+
+    def unknown_mask(self, df):
+        if not self.exprs:
+            return super().unknown_mask(df)
+        unknown = reduce(mask_or, (e.unknown_mask(df) for e in self.exprs))
+        return mask_and(unknown, mask_not(self.mask(df)))
+
+    def mask(self, df):
+        if not self.exprs:
+            return make_mask(False for i in range(len(df)))
+        return super().mask(df)
+
+    def to_sql(self):
+        if not self.exprs:
+            return ("0 = 1", [])
+        return super().to_sql()
+
+
+class Not(FilterExpression):
+
+    def __init__(self, expr):
+        if not isinstance(expr, FilterExpression):
+            raise TypeError("%s is not a filter expression" %(expr,))
+        self.expr = expr
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.expr}>"
+
+    def args(self):
+        return (self.expr,)
+
+    def __call__(self, row):
+        # the negation of unknown is still unknown, so it doesn't match
+        return not self.expr(row) and not self.expr.unknown(row)
+
+    def unknown(self, row):
+        return self.expr.unknown(row)
+
+    def mask(self, df):
+        return mask_not(mask_or(self.expr.mask(df), self.expr.unknown_mask(df)))
+
+    def unknown_mask(self, df):
+        return self.expr.unknown_mask(df)
+
+    def to_sql(self):
+        sql, params = self.expr.to_sql()
+        return (f"NOT ({sql})", params)
+
+
+FILTERS = {
+    cls.__name__: cls
+    for cls in (Compare, In, Contains, Between, Match, And, Or, Not)
+}
+
+
+class Field(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.name}>"
+
+    def __eq__(self, value):
+        return Compare(self.name, "==", value)
+
+    def __ne__(self, value):
+        return Compare(self.name, "!=", value)
+
+    def __lt__(self, value):
+        return Compare(self.name, "<", value)
+
+    def __le__(self, value):
+        return Compare(self.name, "<=", value)
+
+    def __gt__(self, value):
+        return Compare(self.name, ">", value)
+
+    def __ge__(self, value):
+        return Compare(self.name, ">=", value)
+
+    __hash__ = None
+
+    def isin(self, values):
+        return In(self.name, values)
+
+    def contains(self, text, case=True):
+        return Contains(self.name, text, case=case)
+
+    def between(self, low=None, high=None):
+        return Between(self.name, low, high)
+
+    def matches(self, pattern, flags=0):
+        return Match(self.name, pattern, flags)
+
+    def is_null(self):
+        return Compare(self.name, "==", None)
+
+    def not_null(self):
+        return Compare(self.name, "!=", None)
+
+
+__all__ = [
+    "FilterExpression", "Field",
+    "Compare", "In", "Contains", "Between", "Match", "And", "Or", "Not"
+]
@@ -0,0 +1,136 @@
+import logging
+logger = logging.getLogger("panwid.datatable")
+import copy
+from bisect import bisect_left, bisect_right
+
+
+class Lookup(object):
+
+    # Secondary index on a column, mapping each value to the rows that hold
+    # it.  Like aggregates, it remembers the value each row was indexed
+    # under, so a change only moves that one row.  Values that can't be
+    # hashed aren't indexed; they never equal a value that can be.
+
+    def __init__(self):
+        self.values = {}
+        self.rows = {}
+        self.reset()
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {len(self.rows)} values, {len(self.values)} rows>"
+
+    def __len__(self):
+        return len(self.values)
+
+    def copy(self):
+        other = copy.copy(self)
+        other.values = {}
+        other.rows = {}
+        other.reset()
+        return other
+
+    def reset(self):
+        pass
+
+    def clear(self):
+        self.values.clear()
+        self.rows.clear()
+        self.reset()
+
+    @staticmethod
+    def accepts(value):
+        try:
+            hash(value)
+        except TypeError:
+            return False
+        return True
+
+    def set(self, index, value):
+        if index in self.values:
+            old = self.values[index]
+            if old == value and type(old) is type(value):
+                return
+            self.discard(index)
+        if not self.accepts(value):
+            return
+        self.values[index] = value
+        self.rows.setdefault(value, {})[index] = None
+        self.add(index, value)
+
+    def discard(self, index):
+        if index not in self.values:
+            return
+        value = self.values.pop(index)
+        rows = self.rows[value]
+        del rows[index]
+        if not rows:
+            del self.rows[value]
+        self.remove(index, value)
+
+    def add(self, index, value):
+        pass
+
+    def remove(self, index, value):
+        pass
+
+    def get(self, value):
+        # raises TypeError for a value that can't be looked up
+        return list(self.rows.get(value, ()))
+
+    def counts(self):
+        return {value: len(rows) for value, rows in self.rows.items()}
+
+
+class SortedLookup(Lookup):
+
+    # Lookup that also keeps its values in order for range queries.  If the
+    # column holds values that can't be compared with each other, ranges
+    # raise TypeError and callers fall back to scanning.
+
+    def reset(self):
+        self.keys = []
+        self.ordered = True
+
+    def add(self, index, value):
+        # keys holds each distinct value once; rows has the rows for each
+        if value is None or not self.ordered or len(self.rows[value]) > 1:
+            return
+        try:
+            self.keys.insert(bisect_left(self.keys, value), value)
+        except TypeError:
+            self.ordered = False
+            self.keys = []
+
+    def remove(self, index, value):
+        if value is None or not self.ordered or value in self.rows:
+            return
+        self.keys.pop(bisect_left(self.keys, value))
+
+    def range(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        if not self.ordered:
+            raise TypeError("%s holds values that can't be ordered" %(self,))
+        start = 0
+        end = len(self.keys)
+        if low is not None:
+            start = (bisect_left if low_inclusive else bisect_right)(self.keys, low)
+        if high is not None:
+            end = (bisect_right if high_inclusive else bisect_left)(self.keys, high)
+        return [i for value in self.keys[start:end] for i in self.rows[value]]
+
+
+LOOKUPS = {
+    "hash": Lookup,
+    "sorted": SortedLookup
+}
+
+
+def make_lookup(spec):
+    if isinstance(spec, Lookup):
+        return spec.copy()
+    try:
+        return LOOKUPS[spec]()
+    except KeyError:
+        raise ValueError("unknown lookup: %s" %(spec))
+
+
+__all__ = ["Lookup", "SortedLookup"]
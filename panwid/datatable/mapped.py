@@ -0,0 +1,431 @@
+import logging
+logger = logging.getLogger("panwid.datatable")
+import collections.abc
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate, compress
+
+from .dataframe import DataTableDataFrame, IndexList
+
+
+MAGIC = b"PANWIDT1"
+
+# fixed-width kinds and their array/memoryview type codes
+FIXED_KINDS = {
+    "i": "q",
+    "f": "d",
+    "b": "B"
+}
+
+INDEX_COLUMN = "__index__"
+
+
+def column_kind(values):
+    # narrowest kind that holds every non-null value; ints mixed with floats
+    # are left to JSON, which keeps each value's type
+    kinds = set()
+    for v in values:
+        if v is None:
+            continue
+        t = type(v)
+        if t is bool:
+            kinds.add("b")
+        elif t is int and -2**63 <= v < 2**63:
+            kinds.add("i")
+        elif t is float:
+            kinds.add("f")
+        elif t is str:
+            kinds.add("s")
+        else:
+            return "j"
+        if len(kinds) > 1:
+            return "j"
+    return kinds.pop() if kinds else "s"
+
+
+def round_trips(value):
+    # whether json.loads(json.dumps(value)) gives back the same value
+    t = type(value)
+    if value is None or t in (str, int, float, bool):
+        return True
+    elif t is list:
+        return all(round_trips(v) for v in value)
+    elif t is dict:
+        return all(type(k) is str and round_trips(v) for k, v in value.items())
+    return False
+
+
+def is_mapped_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def encode_column(values, name=None):
+    # returns the column's kind, its null mask (None if it has no nulls) and
+    # its sections: the fixed-width values, or string offsets and blob
+    values = list(values)
+    kind = column_kind(values)
+    mask = None
+    if any(v is None for v in values):
+        mask = bytes(v is not None for v in values)
+    if kind in FIXED_KINDS:
+        if mask is not None:
+            values = [0 if v is None else v for v in values]
+        return kind, mask, [array(FIXED_KINDS[kind], values).tobytes()]
+    if kind == "j":
+        lossy = sum(not round_trips(v) for v in values)
+        if lossy:
+            logger.warning(
+                "column %s: %d values can't be stored as JSON exactly; "
+                "tuples will load as lists and other objects as strings" %(name, lossy)
+            )
+        values = [None if v is None else json.dumps(v, default=str) for v in values]
+    encoded = [b"" if v is None else v.encode("utf-8") for v in values]
+    offsets = array("q", [0])
+    offsets.extend(accumulate(len(v) for v in encoded))
+    return kind, mask, [offsets.tobytes(), b"".join(encoded)]
+
+
+def decode_column(kind, rows, mask, sections, swap=False):
+    # inverse of encode_column, decoding the whole column at once
+    if kind in FIXED_KINDS:
+        values = array(FIXED_KINDS[kind])
+        values.frombytes(sections[0])
+        if swap:
+            values.byteswap()
+        values = values.tolist()
+        if kind == "b":
+            values = [bool(v) for v in values]
+    else:
+        offsets = array("q")
+        offsets.frombytes(sections[0])
+        if swap:
+            offsets.byteswap()
+        blob = bytes(sections[1])
+        if blob.isascii():
+            # byte offsets are character offsets, so slice the decoded text
+            text = blob.decode("ascii")
+            values = [text[a:b] for a, b in zip(offsets, offsets[1:])]
+        else:
+            values = [str(blob[a:b], "utf-8") for a, b in zip(offsets, offsets[1:])]
+        if kind == "j":
+            values = [json.loads(v) if v else None for v in values]
+    if mask is not None:
+        values = [v if m else None for v, m in zip(values, mask)]
+    return values
+
+
+def write_mapped(path, df):
+
+    # Layout: magic, offset of the header, then for each column its sections
+    # (null mask, fixed-width values or string offsets and blob), each padded
+    # to 8 bytes, and finally a JSON header describing where they are.
+    #
+    # Columns of bools, ints, floats or strings load back as they were.
+    # Anything else is stored as JSON, so tuples load as lists and values
+    # JSON has no type for (dates, for instance) as their str(); a warning
+    # is logged when that happens.
+
+    columns = [
+        (name, df.column_data(name)) for name in df.columns
+        if name not in df.DATA_TABLE_COLUMNS
+    ]
+    columns.append((INDEX_COLUMN, df.index))
+    rows = len(df.index)
+
+    header = dict(
+        byteorder=sys.byteorder,
+        rows=rows,
+        index_name=df.index_name,
+        columns=[]
+    )
+
+    # written alongside and moved into place, so a table that has the old
+    # file mapped keeps reading it
+    tmp = "%s.tmp" %(path)
+    with open(tmp, "wb") as f:
+
+        def section(data):
+            offset = f.tell()
+            f.write(data)
+            f.write(b"\0" * (-f.tell() % 8))
+            return offset
+
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", 0))
+
+        for name, values in columns:
+            kind, mask, sections = encode_column(values, name)
+            entry = dict(name=name, kind=kind, mask=None)
+            if mask is not None:
+                entry["mask"] = section(mask)
+            if kind in FIXED_KINDS:
+                entry["values"] = section(sections[0])
+            else:
+                entry["offsets"] = section(sections[0])
+                entry["blob"] = section(sections[1])
+            header["columns"].append(entry)
+
+        offset = f.tell()
+        f.write(json.dumps(header).encode("utf-8"))
+        f.seek(len(MAGIC))
+        f.write(struct.pack("<Q", offset))
+    os.replace(tmp, path)
+
+
+class MappedColumn(collections.abc.Sequence):
+
+    # read-only column in a mapped file; values are decoded on access, so
+    # only the pages that are actually read come off the disk
+
+    def __init__(self, buf, rows, kind, values=None, mask=None, offsets=None, blob=None):
+        self.kind = kind
+        self.rows = rows
+        self._mask = buf[mask:mask+rows] if mask is not None else None
+        if kind in FIXED_KINDS:
+            size = struct.calcsize(FIXED_KINDS[kind])
+            self._values = buf[values:values+rows*size].cast(FIXED_KINDS[kind])
+        else:
+            self._offsets = buf[offsets:offsets+(rows+1)*8].cast("q")
+            self._blob = buf[blob:blob+self._offsets[rows]] if rows else buf[0:0]
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.rows))]
+        if i < 0:
+            i += self.rows
+        if not 0 <= i < self.rows:
+            raise IndexError("mapped column index out of range")
+        if self._mask is not None and not self._mask[i]:
+            return None
+        if self.kind in FIXED_KINDS:
+            value = self._values[i]
+            return bool(value) if self.kind == "b" else value
+        value = str(self._blob[self._offsets[i]:self._offsets[i+1]], "utf-8")
+        return json.loads(value) if self.kind == "j" else value
+
+    def release(self):
+        for view in ("_mask", "_values", "_offsets", "_blob"):
+            view = getattr(self, view, None)
+            if view is not None:
+                view.release()
+
+
+class MappedStore(object):
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mmap)
+        if bytes(self._buf[:len(MAGIC)]) != MAGIC:
+            self.close()
+            raise ValueError("not a mapped data table file: %s" %(path))
+        offset = struct.unpack("<Q", self._buf[len(MAGIC):len(MAGIC)+8])[0]
+        header = json.loads(str(self._buf[offset:], "utf-8"))
+        if header["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError("%s was written with %s byte order" %(path, header["byteorder"]))
+        self.rows = header["rows"]
+        self.index_name = header["index_name"]
+        self.columns = {}
+        for entry in header["columns"]:
+            entry = dict(entry)
+            name = entry.pop("name")
+            self.columns[name] = MappedColumn(self._buf, self.rows, **entry)
+
+    def close(self):
+        for column in getattr(self, "columns", {}).values():
+            column.release()
+        self._buf.release()
+        self._mmap.close()
+        self._file.close()
+
+
+class MappedColumnView(collections.abc.MutableSequence):
+
+    # Column of a MappedDataFrame.  Rows are addressed through the frame's
+    # row ids, so sorting or deleting only touches the frame; values written
+    # since the file was opened, and values of added rows, are kept in memory
+    # and take precedence over the file.
+
+    __slots__ = ["frame", "source", "overrides", "default"]
+
+    def __init__(self, frame, source=None, default=None):
+        self.frame = frame
+        self.source = source
+        self.overrides = {}
+        self.default = default
+
+    def __len__(self):
+        return len(self.frame._rows)
+
+    def value(self, row):
+        try:
+            return self.overrides[row]
+        except KeyError:
+            pass
+        if self.source is not None and row < len(self.source):
+            return self.source[row]
+        if callable(self.default):
+            value = self.overrides[row] = self.default()
+            return value
+        return self.default
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.value(r) for r in self.frame._rows[i]]
+        return self.value(self.frame._rows[i])
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            for r, v in zip(self.frame._rows[i], value):
+                self.overrides[r] = v
+            return
+        self.overrides[self.frame._rows[i]] = value
+
+    def __delitem__(self, i):
+        raise TypeError("rows are deleted through the dataframe")
+
+    def insert(self, i, value):
+        if i < len(self):
+            raise TypeError("rows are inserted through the dataframe")
+        self.extend([value])
+
+    def extend(self, values):
+        values = list(values)
+        rows = self.frame._allocate(len(values))
+        for r, v in zip(rows, values):
+            self.overrides[r] = v
+
+    def discard(self, rows):
+        for r in rows:
+            self.overrides.pop(r, None)
+
+    def clear_rows(self):
+        self.overrides.clear()
+
+    def tolist(self):
+        return list(self)
+
+
+class MappedDataFrame(DataTableDataFrame):
+
+    # DataTableDataFrame whose columns are read from a file written by
+    # write_mapped.  The index is loaded up front; everything else stays in
+    # the file until a row is rendered, sorted or filtered on.
+
+    DEFAULTS = {
+        "_cls": dict
+    }
+
+    def __init__(self, path):
+        self.store = MappedStore(path)
+        columns = [c for c in self.store.columns if c != INDEX_COLUMN]
+        super().__init__(columns=columns, index_name=self.store.index_name, sort=False)
+        self._rows = array("q", range(self.store.rows))
+        self._next_row = self.store.rows
+        self._index = IndexList(self.store.columns[INDEX_COLUMN])
+        self._data = [
+            MappedColumnView(self, self.store.columns.get(name), self.DEFAULTS.get(name))
+            for name in self._columns
+        ]
+
+    def close(self):
+        # only lets go of the file; rows that haven't been read can't be
+        # after this
+        self.store.close()
+
+    def detach(self):
+        # reads every column into memory so the frame outlives the file
+        self._data = [list(c) for c in self._data]
+        self.close()
+
+    @property
+    def data(self):
+        return [list(c) for c in self._data]
+
+    def to_json(self):
+        data = self._data
+        self._data = self.data
+        try:
+            return super().to_json()
+        finally:
+            self._data = data
+
+    def _check_list(self, x):
+        return isinstance(x, (list, MappedColumnView)) or super()._check_list(x)
+
+    def _sync_rows(self):
+        # columns are extended one after another for the same new rows, so
+        # row ids are handed out once per row added to the index
+        missing = len(self._index) - len(self._rows)
+        if missing > 0:
+            self._rows.extend(range(self._next_row, self._next_row + missing))
+            self._next_row += missing
+
+    def _allocate(self, count):
+        self._sync_rows()
+        return self._rows[len(self._rows)-count:]
+
+    def _add_column(self, column):
+        self._columns.append(column)
+        self._data.append(MappedColumnView(self, default=self.DEFAULTS.get(column)))
+
+    def _extend(self, c, values):
+        self._data[c].extend(values)
+
+    def _reorder(self, order):
+        self._sync_rows()
+        order = list(order)
+        self._rows = array("q", (self._rows[i] for i in order))
+        self._index = IndexList([self._index[i] for i in order])
+        self._data = [
+            col if isinstance(col, MappedColumnView) else [col[i] for i in order]
+            for col in self._data
+        ]
+
+    def delete_rows(self, indexes):
+        indexes = [indexes] if not self._check_list(indexes) else indexes
+        if indexes and isinstance(indexes[0], bool) and all(isinstance(i, bool) for i in indexes):
+            keep = [not x for x in indexes]
+        else:
+            lookup = self._index_map()
+            keep = [True] * len(self._index)
+            for x in indexes:
+                keep[lookup[x]] = False
+        if all(keep):
+            return
+        self._sync_rows()
+        removed = [r for r, k in zip(self._rows, keep) if not k]
+        self._rows = array("q", compress(self._rows, keep))
+        self._index = IndexList(compress(self._index, keep))
+        for c, col in enumerate(self._data):
+            if isinstance(col, MappedColumnView):
+                col.discard(removed)
+            else:
+                self._data[c] = list(compress(col, keep))
+
+    def delete_all_rows(self):
+        self._rows = array("q")
+        self._index = IndexList()
+        for c, col in enumerate(self._data):
+            if isinstance(col, MappedColumnView):
+                # the file's rows are gone for good
+                col.source = None
+                col.clear_rows()
+            else:
+                del col[:]
+
+
+__all__ = ["MappedDataFrame", "write_mapped", "is_mapped_file"]
@@ -0,0 +1,363 @@
+import logging
+logger = logging.getLogger("panwid.datatable")
+import collections.abc
+from collections import OrderedDict
+from itertools import chain, compress
+
+from .dataframe import DataTableDataFrame
+
+
+class RingList(collections.abc.MutableSequence):
+
+    # List stored in a circular buffer, so removing from either end is O(1)
+    # and the slots freed at the front are reused by appends instead of the
+    # buffer growing.  Anything that changes the middle rebuilds it.
+
+    def __init__(self, values=()):
+        self._reset(values)
+
+    def _reset(self, values):
+        self._items = list(values)
+        self._start = 0
+        self._len = len(self._items)
+
+    def _pos(self, i):
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("ring index out of range")
+        return (self._start + i) % len(self._items)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        end = self._start + self._len
+        n = len(self._items)
+        return chain(self._items[self._start:min(end, n)], self._items[:max(end - n, 0)])
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({list(self)!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, RingList)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._len))]
+        return self._items[self._pos(i)]
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            values = list(self)
+            values[i] = value
+            self._reset(values)
+            return
+        self._items[self._pos(i)] = value
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            values = list(self)
+            del values[i]
+            self._reset(values)
+            return
+        if i < 0:
+            i += self._len
+        if i == 0:
+            self.popleft()
+        elif i == self._len - 1:
+            self.pop()
+        else:
+            values = list(self)
+            del values[i]
+            self._reset(values)
+
+    def insert(self, i, value):
+        if i >= self._len:
+            self.append(value)
+            return
+        values = list(self)
+        values.insert(i, value)
+        self._reset(values)
+
+    def append(self, value):
+        n = len(self._items)
+        if self._len < n:
+            self._items[(self._start + self._len) % n] = value
+        elif self._start == 0:
+            self._items.append(value)
+        else:
+            self._reset(chain(self, [value]))
+            return
+        self._len += 1
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from empty ring")
+        value = self._items[self._start]
+        self._items[self._start] = None
+        self._start = (self._start + 1) % len(self._items)
+        self._len -= 1
+        return value
+
+    def pop(self, i=-1):
+        if i in (-1, self._len - 1):
+            p = self._pos(-1)
+            value = self._items[p]
+            self._items[p] = None
+            self._len -= 1
+            return value
+        value = self[i]
+        del self[i]
+        return value
+
+    def clear(self):
+        self._reset([])
+
+    def tolist(self):
+        return list(self)
+
+
+class RingIndex(RingList):
+
+    # Ring of index values that also maps each value to its position.  Each
+    # value gets a serial number as it's appended, and its position is the
+    # serial less the serial of the first row, so evicting from the front
+    # doesn't renumber anything.
+
+    def _reset(self, values):
+        super()._reset(values)
+        self._base = 0
+        self._serials = {v: i for i, v in enumerate(self._items)}
+
+    def __contains__(self, value):
+        try:
+            return value in self._serials
+        except TypeError:
+            return False
+
+    def index(self, value, *args):
+        try:
+            return self._serials[value] - self._base
+        except (KeyError, TypeError):
+            raise ValueError("%s is not in index" %(value,))
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            super().__setitem__(i, value)
+            return
+        del self._serials[self[i]]
+        super().__setitem__(i, value)
+        self._serials[value] = self._base + (i if i >= 0 else i + self._len)
+
+    def append(self, value):
+        super().append(value)
+        # appending may have rebuilt the ring, so number it afterwards
+        self._serials[value] = self._base + self._len - 1
+
+    def popleft(self):
+        value = super().popleft()
+        del self._serials[value]
+        self._base += 1
+        return value
+
+    def pop(self, i=-1):
+        if i in (-1, self._len - 1):
+            value = super().pop()
+            del self._serials[value]
+            return value
+        return super().pop(i)
+
+    @property
+    def positions(self):
+        return RingPositions(self)
+
+
+class RingPositions(collections.abc.Mapping):
+
+    # read-only value -> position view of a RingIndex
+
+    __slots__ = ["_ring"]
+
+    def __init__(self, ring):
+        self._ring = ring
+
+    def __getitem__(self, value):
+        return self._ring._serials[value] - self._ring._base
+
+    def __contains__(self, value):
+        return value in self._ring
+
+    def __iter__(self):
+        return iter(self._ring)
+
+    def __len__(self):
+        return len(self._ring)
+
+
+class RingBufferDataFrame(DataTableDataFrame):
+
+    # Dataframe that holds at most `capacity` rows.  Adding rows past that
+    # evicts the ones that arrived first; when those are at either end of the
+    # frame, which is the case for an append-only log shown in arrival or
+    # time order, eviction is O(1) per row.  Evicted indexes are collected
+    # for the table to pick up with pop_evicted().
+
+    def __init__(self, *args, capacity=None, **kwargs):
+        if not capacity or capacity < 1:
+            raise ValueError("ring buffer capacity must be a positive number")
+        self.capacity = capacity
+        self._arrivals = OrderedDict()
+        self.evicted = []
+        kwargs["sort"] = False
+        super().__init__(*args, **kwargs)
+        self._rings()
+        self._arrivals.update((i, None) for i in self._index)
+
+    def _rings(self):
+        # raccoon replaces columns with plain lists in a few places, so put
+        # them back in rings before relying on O(1) ends
+        if not isinstance(self._index, RingIndex):
+            self._index = RingIndex(self._index)
+        for c, col in enumerate(self._data):
+            if not isinstance(col, RingList):
+                self._data[c] = RingList(col)
+
+    def _add_column(self, column):
+        super()._add_column(column)
+        self._data[-1] = RingList(self._data[-1])
+
+    def _index_map(self):
+        self._rings()
+        return self._index.positions
+
+    def _reorder(self, order):
+        order = list(order)
+        self._index = RingIndex([self._index[i] for i in order])
+        self._data = [RingList([col[i] for i in order]) for col in self._data]
+
+    def upsert_rows(self, data):
+        keys = data[self.index_name]
+        lookup = self._index_map()
+        new = len(set(k for k in keys if k not in lookup))
+        overflow = len(self._index) + new - self.capacity
+        if overflow > 0:
+            # make room first so appends go into the freed slots, without
+            # evicting rows this batch updates
+            keep = set(keys)
+            self.evict(min(overflow, len(self._index) - len(keep & self._arrivals.keys())), keep)
+        positions = super().upsert_rows(data)
+        for k in keys:
+            if k not in self._arrivals:
+                self._arrivals[k] = None
+        overflow = len(self._index) - self.capacity
+        if overflow > 0:
+            # a batch bigger than the whole buffer only keeps its tail
+            self.evict(overflow)
+            positions = [p - overflow for p in positions if p >= overflow]
+        return positions
+
+    def append_rows(self, rows):
+        # new rows always count as changed, so this returns their indexes
+        return self.update_rows(rows)
+
+    # raccoon's own ways of adding rows go through these, so rows added
+    # with set() or append_row() arrive and evict like any other
+
+    def _add_missing_rows(self, indexes):
+        new = [i for i in dict.fromkeys(indexes) if i not in self._index_map()]
+        if len(new) > self.capacity:
+            raise ValueError("can't add %d rows to a ring buffer of %d" %(len(new), self.capacity))
+        for index in new:
+            super()._add_row(index)
+        self._arrived(new)
+
+    def _add_row(self, index):
+        super()._add_row(index)
+        self._arrived([index])
+
+    def set_cell(self, index, column, value):
+        # raccoon works out where a new row goes before adding it, which
+        # eviction would throw off, so add it first
+        if index not in self._index_map():
+            self._add_row(index)
+        super().set_cell(index, column, value)
+
+    def set_row(self, index, values):
+        if index not in self._index_map():
+            self._add_row(index)
+        super().set_row(index, values)
+
+    def append_row(self, index, values, new_cols=True):
+        super().append_row(index, values, new_cols=new_cols)
+        self._arrived([index])
+
+    def _arrived(self, indexes):
+        for index in indexes:
+            self._arrivals[index] = None
+        overflow = len(self._index) - self.capacity
+        if overflow > 0:
+            self.evict(overflow, set(indexes))
+
+    def evict(self, count, keep=()):
+        self._rings()
+        indexes = []
+        for index in self._arrivals:
+            if len(indexes) >= count:
+                break
+            if index not in keep:
+                indexes.append(index)
+        for index in indexes:
+            del self._arrivals[index]
+        self._remove(indexes)
+        self.evicted.extend(indexes)
+        return indexes
+
+    def pop_evicted(self):
+        evicted, self.evicted = self.evicted, []
+        return evicted
+
+    def _remove(self, indexes):
+        lookup = self._index.positions
+        positions = sorted(lookup[i] for i in indexes)
+        count = len(positions)
+        if positions == list(range(count)):
+            for col in chain([self._index], self._data):
+                for i in range(count):
+                    col.popleft()
+        elif positions == list(range(len(self._index) - count, len(self._index))):
+            for col in chain([self._index], self._data):
+                for i in range(count):
+                    col.pop()
+        else:
+            keep = [True] * len(self._index)
+            for p in positions:
+                keep[p] = False
+            self._index = RingIndex(compress(self._index, keep))
+            self._data = [RingList(compress(col, keep)) for col in self._data]
+
+    def delete_rows(self, indexes):
+        indexes = [indexes] if not self._check_list(indexes) else indexes
+        if indexes and isinstance(indexes[0], bool) and all(isinstance(i, bool) for i in indexes):
+            indexes = list(compress(self._index, indexes))
+        self._rings()
+        indexes = [i for i in dict.fromkeys(indexes) if i in self._index]
+        if not indexes:
+            return
+        for i in indexes:
+            self._arrivals.pop(i, None)
+        self._remove(indexes)
+
+    def delete_all_rows(self):
+        super().delete_all_rows()
+        self._arrivals.clear()
+        self.evicted = []
+
+
+__all__ = ["RingBufferDataFrame", "RingList", "RingIndex"]
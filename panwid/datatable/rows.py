@@ -237,11 +237,52 @@ class DataTableBodyRow(DataTableRow):
 
     DIVIDER_CLASS = DataTableDividerBodyCell
 
+    width_generation = None
 
     @property
     def index(self):
         return self.content
 
+    def check_width_generation(self):
+        generation = self.table.width_generation
+        if self.width_generation == generation:
+            return
+        if self.width_generation is not None:
+            # columns were resized after this row was built
+            self.update()
+        if self.table.width:
+            self.on_resize()
+        self.width_generation = generation
+
+    def rows(self, size, focus=False):
+        self.check_width_generation()
+        return super().rows(size, focus)
+
+    def canvas_key(self, size):
+        # everything besides focus that changes how the row is drawn
+        return (
+            self.table.row_version(self.index),
+            self.table.width_generation,
+            size,
+            self.table.df.get(self.index, "_focus_position"),
+            self.get_attr(),
+            self.cell_selection,
+            self.columns.focus_position if self.cell_selection else None
+        )
+
+    def render(self, size, focus=False):
+        self.check_width_generation()
+        self.table.painted_rows.add(self)
+        if len(self.pile.contents) > 1:
+            # details can change without the row's data changing
+            return super().render(size, focus)
+        key = self.canvas_key(size)
+        canvas = self.table.cached_canvas(self.index, key, focus)
+        if canvas is None:
+            canvas = super().render(size, focus)
+            self.table.cache_canvas(self.index, key, focus, canvas)
+        return canvas
+
     @property
     def data(self):
         return AttrDict(self.table.get_dataframe_row(self.index))
@@ -266,6 +307,8 @@ class DataTableBodyRow(DataTableRow):
 
     def __setitem__(self, column, value):
         self.table.df[self.index, column] = value
+        if column not in self.table.df.DATA_TABLE_COLUMNS:
+            self.table.cells_changed([self.index], column)
         # logger.info(f"__setitem__: {column}, {value}, {self.table.df[self.index, column]}")
 
     def get(self, key, default=None):
@@ -278,11 +321,11 @@ class DataTableBodyRow(DataTableRow):
     def details_open(self):
         # logger.info(f"{self['_details']}")
         # raise Exception(self.get([self.index, "_details"], {}))
-        return self.get("_details", {}).get("open", False)
+        return (self.get("_details") or {}).get("open", False)
 
     @details_open.setter
     def details_open(self, value):
-        details = self["_details"]
+        details = self["_details"] or self.table.df.default_details()
         details["open"] = value
         self["_details"] = details
 
@@ -292,7 +335,7 @@ class DataTableBodyRow(DataTableRow):
 
     @details_disabled.setter
     def details_disabled(self, value):
-        details = self["_details"]
+        details = self["_details"] or self.table.df.default_details()
         details["disabled"] = value
         if value == True:
             self.details_focused = False
@@ -428,19 +471,19 @@ class DataTableBodyRow(DataTableRow):
         focus_map[self.ATTR] = "%s focused" %(self.ATTR)
         self.attrmap.set_focus_map(focus_map)
 
-    def make_cells(self):
+    def column_attr(self, col):
+        if col.attr is None:
+            return None
+        if callable(col.attr):
+            return col.attr(self.data)
+        elif col.attr in self.data:
+            return self.data[col.attr]
+        elif isinstance(col.attr, str):
+            return col.attr
+        else:
+            return None
 
-        def col_to_attr(col):
-            if col.attr is None:
-                return None
-            if callable(col.attr):
-                return col.attr(self.data)
-            elif col.attr in self.data:
-                return self.data[col.attr]
-            elif isinstance(col.attr, str):
-                return col.attr
-            else:
-                return None
+    def make_cells(self):
 
         return [
             DataTableBodyCell(
@@ -448,13 +491,193 @@ class DataTableBodyRow(DataTableRow):
                 col,
                 self,
                 # self.data[col.name] if not col.format_record else self.data,
-                value_attr=col_to_attr(col),
+                value_attr=self.column_attr(col),
                 cell_selection=self.cell_selection
             )
             if isinstance(col, DataTableColumn)
             else DataTableDividerBodyCell(self.table, col, self)
             for i, col in enumerate(self.table.visible_columns)]
 
+def wrap_text(text, width):
+    # the lines urwid.Text would show at this width, with their widths
+    if "\n" not in text:
+        text_width = urwid.util.calc_width(text, 0, len(text))
+        if text_width <= width:
+            return [(text, text_width)]
+    lines = []
+    for line in urwid.text_layout.default_layout.layout(text, max(width, 1), "left", "space"):
+        segments = [seg for seg in line if len(seg) == 3]
+        lines.append((
+            "".join(text[seg[1]:seg[2]] for seg in segments),
+            sum(seg[0] for seg in segments)
+        ))
+    return lines
+
+def fit_text(text, width, align="left", end_char=None, padding=0):
+
+    # returns (left, text, right) for each line of a cell, laid out the way
+    # DataTableBodyCell's widgets would: wrapped text packed and aligned in
+    # the padding, or, when truncating something that won't fit on one
+    # line, wrapped one column narrower with end_char in the last column
+    if end_char:
+        lines = wrap_text(text, width)
+        if len(lines) > 1 and width > 1:
+            ends = [t for t, w in wrap_text(end_char, 1)]
+            lines = wrap_text(text, width - 1)
+            lines += [("", 0)] * (len(ends) - len(lines))
+            ends += [" "] * (len(lines) - len(ends))
+            return [("", t, " " * (width - 1 - w) + e)
+                    for (t, w), e in zip(lines, ends)]
+        return [("", t, " " * (width - w)) for t, w in lines]
+
+    inner = max(width - padding*2, 0)
+    lines = wrap_text(text, inner)
+    block = min(max(w for t, w in lines), inner)
+    if align == "right":
+        left = inner - block
+    elif align == "center":
+        left = (inner - block) // 2
+    else:
+        left = 0
+    left += padding
+    return [(" " * left, t, " " * (width - left - w)) for t, w in lines]
+
+
+class DataTableTextRowContents(urwid.Widget):
+
+    _sizing = frozenset(["box"])
+
+    def __init__(self, row):
+        self.row = row
+        super().__init__()
+
+    def render(self, size, focus=False):
+        return self.row.render_text(size, focus)
+
+
+class DataTableTextBodyRow(DataTableBodyRow):
+
+    # Renders plain text cells straight to a single TextCanvas instead of
+    # building a widget tree for every cell.
+
+    def __init__(self, table, content, markup, *args, **kwargs):
+        self.markup = markup
+        self.focus_column = None
+        super().__init__(table, content, *args, **kwargs)
+
+    def make_contents(self):
+        self.cells = []
+        self.cell_attrs = [
+            self.column_attr(col) if isinstance(col, DataTableColumn) else None
+            for col in self.table.visible_columns
+        ]
+        return DataTableTextRowContents(self)
+
+    def __len__(self):
+        return len(self.table.visible_columns)
+
+    def __iter__(self):
+        return iter([])
+
+    @property
+    def values(self):
+        return AttrDict([
+            (c.name, c.value_fn(self.table, self.data_source)
+             if c.value_fn and not c.calculated else self[c.name])
+            for c in self.table.visible_data_columns
+        ])
+
+    def column_widths(self, size=None):
+        if not size:
+            size = (self.table.width,)
+        return self.table.body_column_widths(size[0])
+
+    def set_focus_column(self, index):
+        if index == self.focus_column:
+            return
+        self.focus_column = index
+        self.contents._invalidate()
+
+    def cell_segments(self, i, col, width, maxrow, focus=False):
+
+        # same attributes the cell's AttrMap would apply
+        attr = self.cell_attrs[i] or DataTableBodyCell.ATTR
+        highlight = i == self.focus_column
+        if highlight:
+            attr = "%s highlight" %(attr)
+        if focus:
+            attr = "%s focused" %(attr)
+        blank = [(attr, " " * width)]
+
+        if not isinstance(col, DataTableColumn):
+            line = (maxrow-1)//2
+            inner = max(width - col.padding_left - col.padding_right, 0)
+            return [
+                [(attr, " " * col.padding_left + col.char * inner + " " * (width - inner - col.padding_left))]
+                if n == line else blank
+                for n in range(maxrow)
+            ]
+
+        markup = self.markup[i]
+        if isinstance(markup, tuple):
+            text_attr, text = markup
+            if highlight:
+                attr_map = self.table.highlight_focus_map if focus else self.table.highlight_map
+                text_attr = attr_map.get(text_attr, text_attr)
+        else:
+            text_attr, text = attr, markup
+
+        if col.truncate:
+            end_char = DataTableText.DEFAULT_END_CHAR if col.truncate is True else col.truncate
+        else:
+            end_char = None
+
+        lines = fit_text(text, width, col.align, end_char, col.padding or 0)
+        top = max((maxrow - len(lines))//2, 0)
+        segments = []
+        for n in range(maxrow):
+            if top <= n < top + len(lines):
+                left, t, right = lines[n-top]
+                segments.append([(attr, left), (text_attr, t), (attr, right)])
+            else:
+                segments.append(blank)
+        return segments
+
+    def render_text(self, size, focus=False):
+
+        maxcol = size[0]
+        maxrow = size[1] if len(size) > 1 else (self.row_height or 1)
+        widths = self.table.body_column_widths(maxcol)
+
+        lines = [[] for n in range(maxrow)]
+        for i, (col, width) in enumerate(zip(self.table.visible_columns, widths)):
+            for line, segments in zip(lines, self.cell_segments(i, col, width, maxrow, focus)):
+                line.extend(segments)
+
+        used = sum(widths)
+        if used < maxcol:
+            for line in lines:
+                line.append((None, " " * (maxcol - used)))
+
+        text, attr, cs = [], [], []
+        for line in lines:
+            line_text, line_attr, line_cs = [], [], []
+            for a, t in line:
+                if not t:
+                    continue
+                b, c = urwid.util.apply_target_encoding(t)
+                line_text.append(b)
+                line_cs.extend(c)
+                if line_attr and line_attr[-1][0] == a:
+                    line_attr[-1] = (a, line_attr[-1][1] + len(b))
+                else:
+                    line_attr.append((a, len(b)))
+            text.append(b"".join(line_text))
+            attr.append(line_attr)
+            cs.append(line_cs)
+        return urwid.TextCanvas(text, attr, cs, maxcol=maxcol)
+
+
 # class DataTableDetailRow(DataTableRow):
 
 #     ATTR = "table_row_detail"
@@ -0,0 +1,125 @@
+import logging
+logger = logging.getLogger("panwid.datatable")
+import json
+import struct
+import sys
+import zlib
+
+from .mapped import encode_column, decode_column, INDEX_COLUMN
+
+
+MAGIC = b"PANWIDS1"
+
+CHUNK_ROWS = 65536
+
+# Layout: magic, a length-prefixed JSON header (columns, state, whether
+# chunks are compressed), then length-prefixed chunks of up to CHUNK_ROWS
+# rows, ending with an empty one.  Each chunk is a length-prefixed JSON
+# description of its columns followed by their null masks and sections as
+# encode_column() produces them, zlib-compressed as a whole if asked for.
+
+
+def is_snapshot_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def write_snapshot(path, df, state=None, compress=False, chunk_rows=CHUNK_ROWS):
+
+    columns = [
+        (name, df.column_data(name)) for name in df.columns
+        if name not in df.DATA_TABLE_COLUMNS
+    ]
+    columns.append((INDEX_COLUMN, df.index))
+    rows = len(df.index)
+
+    header = dict(
+        byteorder=sys.byteorder,
+        rows=rows,
+        index_name=df.index_name,
+        columns=[name for name, values in columns],
+        compress=bool(compress),
+        state=state or {}
+    )
+
+    with open(path, "wb") as f:
+
+        def frame(data, fmt="<Q"):
+            f.write(struct.pack(fmt, len(data)))
+            f.write(data)
+
+        f.write(MAGIC)
+        frame(json.dumps(header, default=str).encode("utf-8"), "<I")
+
+        for start in range(0, rows, chunk_rows):
+            end = min(start + chunk_rows, rows)
+            meta = []
+            parts = []
+            for name, values in columns:
+                kind, mask, sections = encode_column(values[start:end], name)
+                meta.append([kind, mask is not None, [len(s) for s in sections]])
+                if mask is not None:
+                    parts.append(mask)
+                parts.extend(sections)
+            meta = json.dumps(dict(rows=end - start, columns=meta)).encode("utf-8")
+            chunk = b"".join([struct.pack("<I", len(meta)), meta] + parts)
+            if compress:
+                chunk = zlib.compress(chunk, 1)
+            frame(chunk)
+
+        frame(b"")
+
+
+def read_snapshot(path):
+
+    # returns the header and a dict of column values, index included under
+    # the index name, reading one chunk at a time
+
+    with open(path, "rb") as f:
+
+        def frame(fmt="<Q"):
+            size = struct.unpack(fmt, f.read(struct.calcsize(fmt)))[0]
+            data = f.read(size)
+            if len(data) != size:
+                raise ValueError("truncated snapshot: %s" %(path))
+            return data
+
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a data table snapshot: %s" %(path))
+        header = json.loads(frame("<I"))
+        swap = header["byteorder"] != sys.byteorder
+        names = header["columns"]
+        data = {name: [] for name in names}
+
+        while True:
+            chunk = frame()
+            if not chunk:
+                break
+            if header["compress"]:
+                chunk = zlib.decompress(chunk)
+            chunk = memoryview(chunk)
+            size = struct.unpack("<I", chunk[:4])[0]
+            meta = json.loads(str(chunk[4:4+size], "utf-8"))
+            rows = meta["rows"]
+            offset = 4 + size
+            for name, (kind, masked, sizes) in zip(names, meta["columns"]):
+                mask = None
+                if masked:
+                    mask = chunk[offset:offset+rows]
+                    offset += rows
+                sections = []
+                for n in sizes:
+                    sections.append(chunk[offset:offset+n])
+                    offset += n
+                data[name].extend(decode_column(kind, rows, mask, sections, swap=swap))
+
+    index_name = header["index_name"]
+    index = data.pop(INDEX_COLUMN)
+    data[index_name] = index
+    return header, data
+
+
+__all__ = ["write_snapshot", "read_snapshot", "is_snapshot_file"]
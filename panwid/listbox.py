@@ -2,6 +2,8 @@ from __future__ import division
 import logging
 logger = logging.getLogger(__name__.split(".")[0])
 
+import asyncio
+
 import urwid
 from urwid_utils.palette import *
 from .scroll import ScrollBar
@@ -82,7 +84,7 @@ class ScrollingListBox(urwid.WidgetWrap):
 
     signals = ["select",
                "drag_start", "drag_continue", "drag_stop",
-               "load_more"]
+               "load_more", "prefetch"]
 
     scrollbar_class = ScrollBar
 
@@ -90,6 +92,7 @@ class ScrollingListBox(urwid.WidgetWrap):
                  infinite = False,
                  with_scrollbar=False,
                  row_count_fn = None,
+                 prefetch = None,
                  thumb_char=None,
                  trough_char=None,
                  thumb_indicator_top=None,
@@ -98,6 +101,7 @@ class ScrollingListBox(urwid.WidgetWrap):
         self.infinite = infinite
         self.with_scrollbar = with_scrollbar
         self.row_count_fn = row_count_fn
+        self.prefetch = prefetch
 
         self._width = None
         self._height = 0
@@ -109,6 +113,7 @@ class ScrollingListBox(urwid.WidgetWrap):
         self.drag_to = None
         self.load_more = False
         self.page = 0
+        self._prefetch_handle = None
 
         self.queued_keypress = None
         w = self.listbox = urwid.ListBox(body)
@@ -296,8 +301,37 @@ class ScrollingListBox(urwid.WidgetWrap):
             # self.listbox._invalidate()
             # self._invalidate()
 
+        elif self.infinite and self.prefetch and len(self.body):
+            # ask for more before the bottom is reached
+            distance = self.prefetch() if callable(self.prefetch) else self.prefetch
+            try:
+                focus = self.focus_position
+            except IndexError:
+                focus = None
+            if (distance and focus is not None
+                and len(self.body) - focus - 1 <= distance):
+                self.schedule_prefetch(focus)
+
         return super(ScrollingListBox, self).render(size, focus)
 
+    def schedule_prefetch(self, focus):
+        # fetching during render would hold up the screen, so the signal goes
+        # out on the next pass of the event loop; without a running asyncio
+        # loop there's nowhere to put it, and scrolling to the bottom still
+        # loads the next page
+        if self._prefetch_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._prefetch_handle = loop.call_soon(self._emit_prefetch, focus)
+
+    def _emit_prefetch(self, focus):
+        self._prefetch_handle = None
+        urwid.signals.emit_signal(self, "prefetch", focus)
+        self._invalidate()
+
 
     def disable(self):
         self.selectable = lambda: False
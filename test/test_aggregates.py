@@ -0,0 +1,104 @@
+import unittest
+import random
+import statistics
+
+from panwid.datatable import *
+from panwid.datatable.aggregates import *
+
+class TestAggregates(unittest.TestCase):
+
+    def fill(self, aggregate, values):
+        for i, v in enumerate(values):
+            aggregate.set(i, v)
+        return aggregate
+
+    def test_sum_mean_count(self):
+        values = [1, 2, None, 4.5]
+        self.assertEqual(self.fill(Sum(), values).value, 7.5)
+        self.assertEqual(self.fill(Mean(), values).value, 2.5)
+        self.assertEqual(self.fill(Count(), values).value, 3)
+        self.assertIsNone(Mean().value)
+
+    def test_update_and_discard(self):
+        aggregate = self.fill(Sum(), [1, 2, 3])
+        aggregate.set(1, 10)
+        self.assertEqual(aggregate.value, 14)
+        aggregate.discard(0)
+        self.assertEqual(aggregate.value, 13)
+        aggregate.set(2, None)
+        self.assertEqual(aggregate.value, 10)
+
+    def test_min_max(self):
+        low = self.fill(Min(), [3, 1, 1, 5])
+        high = self.fill(Max(), [3, 1, 1, 5])
+        self.assertEqual((low.value, high.value), (1, 5))
+        low.discard(1)
+        self.assertEqual(low.value, 1)
+        low.discard(2)
+        high.discard(3)
+        self.assertEqual((low.value, high.value), (3, 3))
+
+    def test_distinct(self):
+        aggregate = self.fill(Distinct(), ["a", "b", "a", None])
+        self.assertEqual(aggregate.value, 2)
+        aggregate.discard(1)
+        self.assertEqual(aggregate.value, 1)
+
+    def test_percentile(self):
+        values = [random.uniform(-1000, 1000) for i in range(1000)]
+        aggregate = self.fill(Percentile(90, accuracy=0.01), values)
+        expected = sorted(values)[int(0.9 * 999)]
+        self.assertAlmostEqual(aggregate.value, expected, delta=abs(expected) * 0.02 + 1)
+        for i in range(500):
+            aggregate.discard(i)
+        expected = sorted(values[500:])[int(0.9 * 499)]
+        self.assertAlmostEqual(aggregate.value, expected, delta=abs(expected) * 0.02 + 1)
+
+    def test_footer_fn(self):
+        self.assertEqual(Sum()(None, [1, 2, 3]), 6)
+
+
+class TestDataTableAggregates(unittest.TestCase):
+
+    def setUp(self):
+        self.dt = DataTable(
+            [
+                DataTableColumn("a"),
+                DataTableColumn("b", footer_fn="sum"),
+                DataTableColumn("c", footer_fn=Count(scope="filtered"))
+            ],
+            data=[dict(a=i, b=i*2, c="row %d" %(i)) for i in range(10)],
+            index="a", with_footer=True
+        )
+        self.dt.refresh()
+
+    def values(self):
+        return (
+            self.dt.get_aggregate(self.dt.column_named("b")).value,
+            self.dt.get_aggregate(self.dt.column_named("c")).value
+        )
+
+    def test_initial(self):
+        self.assertEqual(self.values(), (90, 10))
+
+    def test_mutations(self):
+        self.values()
+        self.dt.add_row(dict(a=10, b=20, c="row 10"))
+        self.assertEqual(self.values(), (110, 11))
+        self.dt.set_value(0, "b", 100)
+        self.assertEqual(self.values(), (210, 11))
+        self.dt.delete_rows([0, 1])
+        self.assertEqual(self.values(), (108, 9))
+
+    def test_filtered_scope(self):
+        self.values()
+        self.dt.apply_filters(Field("b") >= 10)
+        self.assertEqual(self.values(), (90, 5))
+        self.dt.clear_filters()
+        self.assertEqual(self.values(), (90, 10))
+
+    def test_requery(self):
+        self.values()
+        self.dt.data = [dict(a=i, b=1, c="row") for i in range(4)]
+        self.dt.requery()
+        self.assertEqual(self.values(), (4, 4))
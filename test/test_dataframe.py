@@ -0,0 +1,376 @@
+import unittest
+import functools
+import datetime
+import os
+import tempfile
+from dataclasses import dataclass
+
+from panwid.datatable import *
+from panwid.datatable.columnar import ArrayColumn, HAVE_NUMPY
+from panwid.datatable.ringbuffer import RingList, RingIndex
+from panwid.datatable.mapped import write_mapped
+
+class TestColumnarDataFrame(unittest.TestCase):
+
+    def setUp(self):
+
+        self.data = [
+            dict(a=1, b=2.345, c="foo"),
+            dict(a=2, b=None, c="bar"),
+            dict(a=3, b=-3.19, c="baz")
+        ]
+        self.df = ColumnarDataFrame(columns=["a", "b", "c"], index_name="a", sort=False)
+        self.df.update_rows(self.data)
+
+    @unittest.skipUnless(HAVE_NUMPY, "numpy not installed")
+    def test_typed_columns(self):
+        self.assertIsInstance(self.df._data[self.df.columns.index("b")], ArrayColumn)
+        self.assertNotIsInstance(self.df._data[self.df.columns.index("c")], ArrayColumn)
+
+    def test_get_set(self):
+        self.assertEqual(self.df.get(1, "b"), 2.345)
+        self.assertIsNone(self.df.get(2, "b"))
+        self.df.set(2, "b", 1.5)
+        self.assertEqual(self.df.get(2, "b"), 1.5)
+        self.assertEqual(self.df.get_columns(3, ["b", "c"], as_dict=True),
+                         {"a": 3, "b": -3.19, "c": "baz"})
+
+    def test_value_types_preserved(self):
+        self.assertIs(type(self.df.get(1, "a")), int)
+        self.assertIs(type(self.df.get(1, "b")), float)
+
+    def test_set_incompatible_value(self):
+        self.df.set(1, "b", "n/a")
+        self.assertEqual(self.df.get(1, "b"), "n/a")
+        self.assertEqual(self.df.get(3, "b"), -3.19)
+
+    def test_set_out_of_range_value(self):
+        self.df.set(1, "a", 2**70)
+        self.assertEqual(self.df.get(1, "a"), 2**70)
+        self.assertEqual(self.df.get(3, "a"), 3)
+
+    def test_set_many_out_of_range_values(self):
+        self.df.set([2, 3], "a", [5, -2**70])
+        self.assertEqual(self.df.get_entire_column("a", as_list=True), [1, 5, -2**70])
+
+    def test_delete_rows(self):
+        self.df.delete_rows([1, 3])
+        self.assertEqual(self.df.index, [2])
+        self.assertEqual(self.df.get(2, "c"), "bar")
+        with self.assertRaises(ValueError):
+            self.df.get(3, "c")
+
+    def test_sort_columns(self):
+        self.df.sort_columns("b", key=lambda x: (x is None, x))
+        self.assertEqual(self.df.index, [3, 1, 2])
+        self.df.sort_columns("b", reverse=True)
+        self.assertEqual(self.df.index, [2, 1, 3])
+        self.assertEqual(self.df.get(3, "c"), "baz")
+
+    def test_datatable(self):
+        dt = DataTable(
+            [DataTableColumn("a"), DataTableColumn("b"), DataTableColumn("c")],
+            data=self.data, index="a", dataframe_class=ColumnarDataFrame
+        )
+        dt.refresh()
+        dt.add_row(dict(a=4, b=7.142, c="qux"))
+        self.assertEqual(len(dt), 4)
+        self.assertIsInstance(dt.df, ColumnarDataFrame)
+
+
+class TestUpsertRows(unittest.TestCase):
+
+    dataframe_class = DataTableDataFrame
+
+    def setUp(self):
+        self.df = self.dataframe_class(columns=["a", "b", "c"], index_name="a", sort=False)
+        self.df.update_rows([
+            dict(a=1, b=2.345, c="foo"),
+            dict(a=2, b=4.817, c="bar"),
+            dict(a=3, b=-3.19, c="baz")
+        ])
+
+    def test_insert(self):
+        self.assertEqual(len(self.df), 3)
+        # default details aren't stored until they change
+        self.assertIsNone(self.df.get(2, "_details"))
+
+    def test_changed_positions(self):
+        positions = self.df.upsert_rows({
+            "a": [1, 3, 4],
+            "b": [2.345, 0.5, 1.0],
+            "c": ["foo", "baz", "qux"]
+        })
+        self.assertEqual(positions, [2, 3])
+        self.assertEqual(self.df.get(3, "b"), 0.5)
+        self.assertEqual(self.df.get(4, "c"), "qux")
+        self.assertTrue(self.df.get(3, "_dirty"))
+        self.assertFalse(self.df.get(1, "_dirty"))
+
+    def test_update_rows_returns_changed(self):
+        updated = self.df.update_rows([
+            dict(a=1, b=2.345, c="foo"),
+            dict(a=2, b=4.817, c="changed"),
+        ])
+        self.assertEqual(updated, [2])
+
+    def test_duplicate_new_keys(self):
+        self.df.upsert_rows({"a": [5, 5], "b": [1.0, 2.0], "c": ["x", "y"]})
+        self.assertEqual(self.df.index, [1, 2, 3, 5])
+        self.assertEqual(self.df.get(5, "c"), "y")
+
+    def test_move_rows(self):
+        self.df.update_rows([dict(a=4, b=0.5, c="x"), dict(a=5, b=1.5, c="y")])
+        self.df._move_rows(3, [4, 0])
+        self.assertEqual(list(self.df.index), [5, 1, 2, 3, 4])
+        self.assertEqual(self.df.get_entire_column("c", as_list=True),
+                         ["y", "foo", "bar", "baz", "x"])
+        self.assertEqual(self.df.get(2, "b"), 4.817)
+
+    def test_generated_index_after_delete(self):
+        df = self.dataframe_class(columns=["b"], sort=False)
+        df.update_rows([dict(b=i) for i in range(3)])
+        df.delete_rows([0])
+        df.update_rows([dict(b=10)])
+        self.assertEqual(list(df.index), [1, 2, 3])
+        self.assertEqual(df.get(2, "b"), 2)
+
+
+class TestColumnarUpsertRows(TestUpsertRows):
+
+    dataframe_class = ColumnarDataFrame
+
+
+class TestRingBufferUpsertRows(TestUpsertRows):
+
+    dataframe_class = functools.partial(RingBufferDataFrame, capacity=100)
+
+
+class TestRingList(unittest.TestCase):
+
+    def test_wraparound(self):
+        ring = RingList(range(4))
+        ring.popleft()
+        ring.popleft()
+        ring.extend([4, 5])
+        self.assertEqual(list(ring), [2, 3, 4, 5])
+        self.assertEqual(len(ring._items), 4)
+        self.assertEqual((ring[0], ring[-1], ring[1:3]), (2, 5, [3, 4]))
+        ring[1] = 30
+        del ring[2]
+        self.assertEqual(list(ring), [2, 30, 5])
+
+    def test_index_positions(self):
+        ring = RingIndex("abcd")
+        ring.popleft()
+        ring.append("e")
+        self.assertEqual(ring.index("e"), 3)
+        self.assertEqual(dict(ring.positions), dict(b=0, c=1, d=2, e=3))
+        ring.pop()
+        self.assertNotIn("e", ring)
+        with self.assertRaises(ValueError):
+            ring.index("a")
+
+
+class TestRingBufferDataFrame(unittest.TestCase):
+
+    def setUp(self):
+        self.df = RingBufferDataFrame(columns=["a", "b"], index_name="a", capacity=3)
+
+    def test_evict_oldest(self):
+        self.df.update_rows([dict(a=i, b=i*2) for i in range(5)])
+        self.assertEqual(list(self.df.index), [2, 3, 4])
+        self.assertEqual(self.df.pop_evicted(), [0, 1])
+        self.assertEqual(self.df.pop_evicted(), [])
+        # rows the batch updates aren't evicted to make room for it
+        self.df.update_rows([dict(a=2, b=0), dict(a=5, b=10)])
+        self.assertEqual(list(self.df.index), [2, 4, 5])
+        self.assertEqual(self.df.pop_evicted(), [3])
+        self.assertEqual(self.df.get(5, "b"), 10)
+
+    def test_flat_memory(self):
+        for i in range(1000):
+            self.df.update_rows([dict(a=i, b=i)])
+        self.assertEqual(list(self.df.index), [997, 998, 999])
+        self.assertLessEqual(len(self.df._index._items), 3)
+        self.assertTrue(all(len(col._items) <= 3 for col in self.df._data))
+
+    def test_evict_sorted(self):
+        self.df.update_rows([dict(a=i, b=i) for i in range(3)])
+        self.df._reorder([1, 2, 0])
+        self.df.update_rows([dict(a=3, b=3)])
+        self.assertEqual(list(self.df.index), [1, 2, 3])
+        self.assertEqual(self.df.get(2, "b"), 2)
+
+    def test_raccoon_adds_evict(self):
+        self.df.update_rows([dict(a=i, b=i) for i in range(3)])
+        self.df.set(3, "b", 3)
+        self.df.append_row(4, dict(b=4))
+        self.df.set([5, 6], "b", [5, 6])
+        self.assertEqual(list(self.df.index), [4, 5, 6])
+        self.assertEqual(self.df.pop_evicted(), [0, 1, 2, 3])
+        self.assertEqual(self.df.get(6, "b"), 6)
+        with self.assertRaises(ValueError):
+            self.df.set(list(range(10, 14)), "b", 0)
+        self.assertEqual(list(self.df.index), [4, 5, 6])
+
+
+class TestMappedDataFrame(unittest.TestCase):
+
+    def setUp(self):
+        df = DataTableDataFrame(columns=["a", "b", "c", "d"], index_name="a")
+        df.update_rows([
+            dict(a=i, b="row %d" %(i) if i % 3 else None, c=i * 1.5, d=[i])
+            for i in range(10)
+        ])
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        write_mapped(self.path, df)
+        self.df = MappedDataFrame(self.path)
+
+    def tearDown(self):
+        self.df.close()
+        os.unlink(self.path)
+
+    def test_read(self):
+        self.assertEqual(list(self.df.index), list(range(10)))
+        self.assertEqual(self.df.get(3, "b"), None)
+        self.assertEqual(self.df.get(4, "b"), "row 4")
+        self.assertEqual(self.df.get(4, "c"), 6.0)
+        self.assertEqual(self.df.get(4, "d"), [4])
+        self.assertIsNone(self.df.get(4, "_details"))
+
+    def test_update(self):
+        self.assertEqual(
+            self.df.update_rows([dict(a=3, b="x", c=1.0), dict(a=20, b="new", c=2.0)]),
+            [3, 20]
+        )
+        self.assertEqual(self.df.get(3, "b"), "x")
+        self.assertEqual(self.df.get(20, "b"), "new")
+        self.assertEqual(self.df.get(20, "d"), None)
+        self.assertEqual(len(self.df), 11)
+
+    def test_reorder_and_delete(self):
+        self.df["_dirty"] = True
+        self.df.delete_rows([0, 1])
+        self.df._reorder(list(reversed(range(len(self.df)))))
+        self.assertEqual(list(self.df.index), list(range(9, 1, -1)))
+        self.assertEqual(self.df.get(8, "b"), "row 8")
+        self.assertEqual(len(self.df.column_data("_dirty")), 8)
+        self.df.delete_all_rows()
+        self.assertEqual(len(self.df), 0)
+        self.df.update_rows([dict(a=1, b="again")])
+        self.assertEqual(self.df.get(1, "b"), "again")
+        self.assertEqual(self.df.get(1, "c"), None)
+
+    def test_close(self):
+        self.df.close()
+        with self.assertRaises(ValueError):
+            self.df.get(4, "b")
+
+    def test_detach(self):
+        self.df.set(4, "b", "changed")
+        self.df.detach()
+        self.assertEqual(self.df.get(4, "b"), "changed")
+        self.assertEqual(self.df.get(5, "b"), "row 5")
+
+    def test_value_types(self):
+        df = DataTableDataFrame(columns=["a", "b", "c"], index_name="a")
+        df.update_rows([
+            dict(a=1, b=1, c=(1, 2)),
+            dict(a=2, b=2.5, c=datetime.date(2020, 1, 2))
+        ])
+        with self.assertLogs("panwid.datatable", "WARNING"):
+            write_mapped(self.path, df)
+        other = MappedDataFrame(self.path)
+        try:
+            self.assertIs(type(other.get(1, "b")), int)
+            self.assertIs(type(other.get(2, "b")), float)
+            self.assertEqual(other.get(1, "c"), [1, 2])
+            self.assertEqual(other.get(2, "c"), "2020-01-02")
+        finally:
+            other.close()
+
+
+@dataclass
+class DataClassRow:
+    a: int
+    b: float
+
+    @property
+    def c(self):
+        return "row %d" %(self.a)
+
+class SlotsRow:
+    __slots__ = ("a", "b")
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+class TestTransposeData(unittest.TestCase):
+
+    def setUp(self):
+        self.df = DataTableDataFrame(columns=["a", "b", "c"], index_name="a", sort=False)
+
+    def test_dict_rows(self):
+        rows = [dict(a=1, b=2.0), dict(b=3.0, a=2)]
+        self.assertEqual(self.df.transpose_data(rows), self.df._transpose_data(rows))
+
+    def test_ragged_rows(self):
+        rows = [dict(a=1, b=2.0), dict(a=2)]
+        data = self.df.transpose_data(rows)
+        self.assertEqual(data["b"], [2.0, None])
+        self.assertEqual(data, self.df._transpose_data(rows))
+
+    def test_dataclass_rows(self):
+        rows = [DataClassRow(1, 2.0), DataClassRow(2, 3.0)]
+        data = self.df.transpose_data(rows)
+        self.assertEqual(data["c"], ["row 1", "row 2"])
+        self.assertEqual(data, self.df._transpose_data(rows))
+
+    def test_slots_rows(self):
+        data = self.df.transpose_data([SlotsRow(1, 2.0), SlotsRow(2, 3.0)])
+        self.assertEqual(data["a"], [1, 2])
+        self.assertEqual(data["b"], [2.0, 3.0])
+
+    def test_sidecar_rows(self):
+        rows = [(dict(a=1, b=2.0), dict(z=1)), (dict(a=2, b=3.0), dict(z=2))]
+        data = self.df.transpose_data(rows, with_sidecar=True)
+        self.assertEqual(data["z"], [1, 2])
+        self.assertEqual(self.df.sidecar_columns, ["z"])
+
+
+class TestRowView(unittest.TestCase):
+
+    dataframe_class = DataTableDataFrame
+
+    def setUp(self):
+        self.df = self.dataframe_class(columns=["a", "b", "c"], index_name="a", sort=False)
+        self.df.update_rows([
+            dict(a=1, b=2.5, c="foo"),
+            dict(a=2, b=None, c="bar"),
+            dict(a=3, b=-3.5, c="baz")
+        ])
+
+    def test_access(self):
+        view = self.df.row_view(2)
+        self.assertEqual(view["c"], "bar")
+        self.assertEqual(view.a, 2)
+        self.assertIsNone(view.b)
+        self.assertEqual(view.get("missing", 0), 0)
+        with self.assertRaises(AttributeError):
+            view.missing
+        self.assertEqual(dict(view)["c"], "bar")
+
+    def test_live(self):
+        view = self.df.row_view(3)
+        self.df.set(3, "c", "qux")
+        self.assertEqual(view.c, "qux")
+        self.df.delete_rows([1])
+        self.assertEqual(view.b, -3.5)
+
+
+class TestColumnarRowView(TestRowView):
+
+    dataframe_class = ColumnarDataFrame
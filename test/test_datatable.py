@@ -1,6 +1,16 @@
 import unittest
+import asyncio
+import os
+import gc
+import tempfile
+import urwid
+from dataclasses import dataclass
 
 from panwid.datatable import *
+from panwid.datatable.rows import DataTableTextBodyRow
+from panwid.datatable.datatable import HAVE_PONY
+if HAVE_PONY:
+    import pony.orm
 from orderedattrdict import AttrDict
 
 class TestDataTableWithIndex(unittest.TestCase):
@@ -43,3 +53,1181 @@ class TestDataTableWithIndex(unittest.TestCase):
         dt.refresh()
         dt.add_row(dict(a=4, b=7.142, c="qux"))
         self.assertEqual(len(dt), 4)
+
+    def test_sort_reorders_rows(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        dt.sort_by_column(("b", False))
+        self.assertEqual(dt.filtered_rows, [3, 1, 2])
+        self.assertEqual(dt.position_to_index(0), 3)
+        self.assertEqual(dt.index_to_position(2), 2)
+
+    def test_index_to_position(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        self.assertEqual(dt.index_to_position(3), 2)
+        self.assertEqual(dt.get_position(4), None)
+        self.assertFalse(dt.has_index(4))
+        with self.assertRaises(ValueError):
+            dt.index_to_position(4)
+
+    def test_delete_rows_updates_positions(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        dt.delete_rows(1)
+        self.assertEqual(len(dt), 2)
+        self.assertEqual(dt.index_to_position(3), 1)
+        self.assertFalse(dt.has_index(1))
+
+
+class TestDataTableFilters(unittest.TestCase):
+
+    def setUp(self):
+
+        self.data = [
+            dict(a=1, b=2.345, c="foo"),
+            dict(a=2, b=4.817, c="bar"),
+            dict(a=3, b=-3.19, c="baz")
+        ]
+        self.columns = [
+            DataTableColumn("a"),
+            DataTableColumn("b"),
+            DataTableColumn("c")
+        ]
+        self.calls = []
+
+        def positive(row):
+            self.calls.append(row["a"])
+            return row["b"] > 0
+
+        self.dt = DataTable(self.columns, data=self.data, index="a")
+        self.dt.refresh()
+        self.dt.apply_filters(positive)
+
+    def test_apply_filters(self):
+
+        self.assertEqual(self.dt.filtered_rows, [1, 2])
+        self.assertEqual(sorted(self.calls), [1, 2, 3])
+
+    def test_add_row_filters_new_row_only(self):
+
+        self.calls.clear()
+        self.dt.add_row(dict(a=4, b=7.142, c="qux"))
+        self.dt.add_row(dict(a=5, b=-1.0, c="quux"))
+        self.assertEqual(self.calls, [4, 5])
+        self.assertEqual(self.dt.filtered_rows, [1, 2, 4])
+
+    def test_add_row_sorted(self):
+
+        self.dt.sort_by_column(("b", True))
+        self.dt.add_row(dict(a=4, b=3.0, c="qux"))
+        self.assertEqual(self.dt.filtered_rows, [2, 4, 1])
+        self.assertEqual(self.dt.index_to_position(1), 2)
+
+    def test_add_row_incremental(self):
+
+        self.dt.sort_by_column(("b", True))
+        calls = []
+        for name in ["sort", "sort_order", "set_focus_column",
+                     "_sync_filtered_rows", "_reindex_filtered_rows"]:
+            def wrapper(*args, _name=name, _fn=getattr(self.dt, name), **kwargs):
+                calls.append((_name, args))
+                return _fn(*args, **kwargs)
+            setattr(self.dt, name, wrapper)
+        self.dt.add_row(dict(a=4, b=3.0, c="qux"))
+        self.dt.add_row(dict(a=5, b=9.0, c="quux"))
+        self.assertEqual(self.dt.filtered_rows, [5, 2, 4, 1])
+        # only the filtered rows from each new one on are renumbered
+        self.assertEqual(calls, [
+            ("_reindex_filtered_rows", (1,)), ("_reindex_filtered_rows", (0,))
+        ])
+        self.assertEqual(self.dt.df.get(4, "_focus_position"),
+                         self.dt.df.get(1, "_focus_position"))
+
+    def test_requery_prunes_deleted_rows(self):
+
+        self.dt.data = self.data[1:]
+        self.dt.requery()
+        self.assertEqual(self.dt.filtered_rows, [2])
+
+    def test_clear_filters(self):
+
+        self.dt.clear_filters()
+        self.assertEqual(self.dt.filtered_rows, [1, 2, 3])
+
+
+class TestDataTableSort(unittest.TestCase):
+
+    def setUp(self):
+
+        self.data = [
+            dict(a=1, b="x", c=3),
+            dict(a=2, b="y", c=1),
+            dict(a=3, b="x", c=2),
+            dict(a=4, b="y", c=None)
+        ]
+        self.key_calls = 0
+
+        def sort_key(value):
+            self.key_calls += 1
+            return (value is None, value)
+
+        self.columns = [
+            DataTableColumn("a"),
+            DataTableColumn("b"),
+            DataTableColumn("c", sort_key=sort_key)
+        ]
+
+    def test_multi_column_sort(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        dt.sort_by_column([("b", True), ("c", False)])
+        self.assertEqual(dt.filtered_rows, [2, 4, 3, 1])
+        self.assertEqual(dt.sort_by, ("b", True))
+        dt.add_row(dict(a=5, b="y", c=0))
+        self.assertEqual(dt.filtered_rows, [5, 2, 4, 3, 1])
+
+    def test_toggle_reverses(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        dt.sort_by_column(("c", False))
+        self.assertEqual(dt.filtered_rows, [2, 3, 1, 4])
+        dt.sort_by_column("c", toggle=True)
+        self.assertEqual(dt.filtered_rows, [4, 1, 3, 2])
+        self.assertEqual(self.key_calls, 4)
+
+    def test_sort_keys_invalidated(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        dt.sort_by_column(("c", False))
+        dt.df.set(1, "c", 0)
+        dt.invalidate_rows([1])
+        dt.sort_by_column(("c", False))
+        self.assertEqual(dt.filtered_rows, [1, 2, 3, 4])
+        self.assertEqual(self.key_calls, 5)
+
+
+class TestDataTableRowCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.data = [dict(a=i, b=i*2) for i in range(100)]
+        self.columns = [
+            DataTableColumn("a"),
+            DataTableColumn("b")
+        ]
+
+    def test_row_cache_bounded(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a", row_cache_size=5)
+        dt.refresh()
+        for row in dt:
+            pass
+        self.assertLessEqual(len(dt._row_cache), 5)
+        self.assertEqual(list(dt.df["_rendered_row"].to_list()), [None]*100)
+
+    def test_painted_rows_released(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a", row_cache_size=5)
+        for i in range(0, 100, 10):
+            dt.focus_position = i
+            dt.render((20, 10), focus=True)
+        gc.collect()
+        self.assertLessEqual(len(dt.painted_rows), 15)
+
+    def test_focused_row_kept(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a", row_cache_size=5)
+        dt.refresh()
+        focused = dt[0]
+        for row in dt:
+            pass
+        self.assertIs(dt[0], focused)
+
+    def test_details_restored(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a", row_cache_size=5,
+                       detail_fn=lambda row: DataTableText(str(row.b)))
+        dt.refresh()
+        dt[10].open_details()
+        for row in dt:
+            pass
+        self.assertNotIn(10, dt._row_cache)
+        row = dt[10]
+        self.assertTrue(row.details_open)
+        self.assertEqual(len(row.pile.contents), 2)
+
+    def test_resize_visible_rows_only(self):
+
+        dt = DataTable(
+            [DataTableColumn("a", width=5), DataTableColumn("b", width=5)],
+            data=self.data, index="a"
+        )
+        dt.render((40, 10))
+        dt.resize_column("a", 12)
+        canvas = dt.render((40, 10))
+        self.assertEqual(canvas.text[1].decode().index("0", 1), 13)
+        built = [r for r in dt.df["_rendered_row"].to_list() if r is not None]
+        self.assertLess(len(built), 20)
+        self.assertTrue(all(r.width_generation == dt.width_generation for r in built))
+
+    def test_render_added_row(self):
+
+        dt = DataTable(
+            [DataTableColumn("a", width=5), DataTableColumn("b", width=5)],
+            data=self.data, index="a"
+        )
+        dt.render((40, 10))
+        dt.add_row(dict(a=-1, b=0))
+        dt.focus_position = dt.index_to_position(-1)
+        canvas = dt.render((40, 10))
+        self.assertIn("-1", b"".join(canvas.text).decode())
+        self.assertFalse(dt[dt.focus_position].details_open)
+
+
+class TestDataTableContentWidth(unittest.TestCase):
+
+    def setUp(self):
+
+        self.data = [
+            dict(a=1, b="foo"),
+            dict(a=2, b="\N{CJK UNIFIED IDEOGRAPH-4E2D}\N{CJK UNIFIED IDEOGRAPH-6587}"),
+            dict(a=3, b="ba")
+        ]
+        self.columns = [
+            DataTableColumn("a"),
+            DataTableColumn("b", pack=True)
+        ]
+
+    def test_contents_width(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        self.assertEqual(dt.content_width(dt.column_named("b")), 4)
+        self.assertEqual(dt.column_named("b").contents_width, 4)
+        self.assertEqual(list(dt.df["_rendered_row"].to_list()), [None]*3)
+
+    def test_contents_width_updates(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        column = dt.column_named("b")
+        self.assertEqual(dt.content_width(column), 4)
+        dt.add_row(dict(a=4, b="quuxquux"))
+        self.assertEqual(dt.content_width(column), 8)
+        dt.delete_rows(4)
+        self.assertEqual(dt.content_width(column), 4)
+
+    def test_sampled_contents_width(self):
+
+        data = [dict(a=i, b="x"*5) for i in range(1000)] + [dict(a=1000, b="x"*50)]
+        dt = DataTable(self.columns, data=data, index="a", pack_sample_size=100)
+        dt.refresh()
+        self.assertEqual(dt.content_width(dt.column_named("b")), 5)
+
+
+class TestDataTableFormatCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.calls = []
+
+        def format_fn(value):
+            self.calls.append(value)
+            return "<%s>" %(value)
+
+        self.data = [dict(a=i, b=i*2) for i in range(10)]
+        self.columns = [
+            DataTableColumn("a"),
+            DataTableColumn("b", format_fn=format_fn)
+        ]
+
+    def test_format_cached(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        for row in dt:
+            pass
+        dt.invalidate()
+        for row in dt:
+            pass
+        self.assertEqual(sorted(self.calls), [i*2 for i in range(10)])
+
+    def test_format_column(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        column = dt.column_named("b")
+        self.assertEqual(dt.format_column(column, [1, 2]), ["<2>", "<4>"])
+        self.assertEqual(dt.format_column(column, [1, 2], width=2), ["<2", "<4"])
+        self.assertEqual(len(self.calls), 4)
+        dt.set_value(1, "b", 5)
+        self.assertEqual(dt.format_column(column, [1, 2]), ["<5>", "<4>"])
+
+    def test_invalidate_formats(self):
+
+        units = ["kb"]
+        self.columns[1].format_fn = lambda v: "%s%s" %(v, units[0])
+        dt = DataTable(self.columns, data=self.data, index="a")
+        dt.refresh()
+        column = dt.column_named("b")
+        self.assertEqual(dt.format_column(column, [1]), ["2kb"])
+        self.assertIn("2kb", dt[1].render((40,)).text[0].decode())
+        units[0] = "mb"
+        self.assertEqual(dt.format_column(column, [1]), ["2kb"])
+        dt.invalidate_formats(["b"])
+        self.assertEqual(dt.format_column(column, [1]), ["2mb"])
+        self.assertIn("2mb", dt[1].render((40,)).text[0].decode())
+
+    def test_value_fn_lru(self):
+
+        columns = [
+            DataTableColumn("a"),
+            DataTableColumn("c", value=lambda t, r: r.a*3, format_cache_size=3)
+        ]
+        dt = DataTable(columns, data=self.data, index="a")
+        dt.refresh()
+        for row in dt:
+            pass
+        self.assertEqual(len(dt.get_format_cache(dt.column_named("c"))), 3)
+
+
+class TestDataTableFastRender(unittest.TestCase):
+
+    def setUp(self):
+
+        self.data = [dict(a=i, b=i*1.5, c="row %d" %(i)) for i in range(10)]
+        self.columns = [
+            DataTableColumn("a", width=4),
+            DataTableColumn("b", width=8, align="right"),
+            DataTableColumn("c", width=5, truncate=True,
+                            decoration_fn=lambda v: ("red", v))
+        ]
+
+    def render(self, dt, position, focus=False):
+        row = dt[position]
+        canvas = row.render((40,), focus)
+        return row, canvas.text, list(canvas.content())
+
+    def test_matches_cell_rendering(self):
+
+        slow = DataTable(self.columns, data=self.data, index="a", row_height=1)
+        fast = DataTable(self.columns, data=self.data, index="a", row_height=1,
+                         fast_render=True)
+        slow.refresh()
+        fast.refresh()
+        for focus in [False, True]:
+            row, text, content = self.render(fast, 3, focus)
+            self.assertIsInstance(row, DataTableTextBodyRow)
+            self.assertEqual(text, self.render(slow, 3, focus)[1])
+            self.assertIn(("red", None, b"row 3"), content[0])
+
+    def test_matches_cell_truncation(self):
+
+        data = [dict(a=0, b=0, c="ab cdef"), dict(a=1, b=0, c="abcdefgh")]
+        for truncate, row_height in [(True, 1), ("~", 1), (False, 2), (True, 2)]:
+            self.columns[2].truncate = truncate
+            slow = DataTable(self.columns, data=data, index="a", row_height=row_height)
+            fast = DataTable(self.columns, data=data, index="a",
+                             row_height=row_height, fast_render=True)
+            slow.refresh()
+            fast.refresh()
+            for position in range(2):
+                self.assertEqual(self.render(fast, position)[1],
+                                 self.render(slow, position)[1])
+        # wrapped at the space, with the ellipsis in the last column
+        self.assertIn("ab  \N{HORIZONTAL ELLIPSIS}",
+                      self.render(fast, 0)[1][0].decode())
+
+    def test_no_cells(self):
+
+        dt = DataTable(self.columns, data=self.data, index="a", row_height=1,
+                       fast_render=True)
+        dt.refresh()
+        row = dt[0]
+        self.assertEqual(row.cells, [])
+        self.assertEqual(row.values["c"], "row 0")
+
+    def test_widget_falls_back(self):
+
+        self.columns[2].decoration_fn = lambda v: urwid.Text(v)
+        dt = DataTable(self.columns, data=self.data, index="a", row_height=1,
+                       fast_render=True)
+        dt.refresh()
+        row = dt[0]
+        self.assertNotIsInstance(row, DataTableTextBodyRow)
+        self.assertEqual(len(row.cells), 5)
+
+
+class TestDataTableCanvasCache(unittest.TestCase):
+
+    def setUp(self):
+
+        painted = self.painted = []
+
+        class CountingDataTable(DataTable):
+
+            def cache_canvas(self, index, key, focus, canvas):
+                painted.append(index)
+                super().cache_canvas(index, key, focus, canvas)
+
+        self.dt = CountingDataTable(
+            [DataTableColumn("a", width=4), DataTableColumn("b", width=8)],
+            data=[dict(a=i, b=i*1.5) for i in range(50)], index="a"
+        )
+        self.dt.refresh()
+        self.size = (30, 10)
+        self.dt.render(self.size, True)
+
+    def test_focus_move_repaints_two_rows(self):
+        del self.painted[:]
+        self.dt.keypress(self.size, "down")
+        self.dt.render(self.size, True)
+        self.assertEqual(sorted(self.painted), [0, 1])
+
+    def test_changed_row_repainted(self):
+        del self.painted[:]
+        self.dt.invalidate_rows([3])
+        self.dt.render(self.size, True)
+        self.assertEqual(self.painted, [3])
+
+    def test_invalidate_repaints_visible_rows(self):
+        del self.painted[:]
+        self.dt.invalidate()
+        self.dt.render(self.size, True)
+        self.assertEqual(sorted(self.painted), list(range(9)))
+
+    def test_canvas_cache_bounded(self):
+        self.dt.canvas_cache_size = 12
+        for i in range(50):
+            self.dt.focus_position = i
+            self.dt.render(self.size, True)
+        self.assertLessEqual(len(self.dt._canvas_cache), 12)
+        self.assertIn(49, self.dt._canvas_cache)
+
+    def test_dirty_row_canvas_dropped(self):
+        self.dt.df.set(3, "_dirty", True)
+        self.dt.get_row(3)
+        self.assertNotIn(3, self.dt._canvas_cache)
+
+
+class TestDataTableCalculatedColumns(unittest.TestCase):
+
+    def setUp(self):
+
+        self.calls = []
+        built = self.built = []
+
+        class CountingDataTable(DataTable):
+
+            def get_dataframe_row_object(self, index):
+                built.append(index)
+                return super().get_dataframe_row_object(index)
+
+        self.table_class = CountingDataTable
+        self.data = [dict(a=i, b=i*2, c=i*3) for i in range(5)]
+
+    def calculated(self, name, fn):
+        def value_fn(table, row):
+            self.calls.append(name)
+            return fn(row)
+        return value_fn
+
+    def make_table(self, columns):
+        dt = self.table_class(
+            [DataTableColumn("a"), DataTableColumn("b"), DataTableColumn("c")] + columns,
+            data=self.data, index="a"
+        )
+        dt.refresh()
+        return dt
+
+    def test_row_object_built_once(self):
+        dt = self.make_table([
+            DataTableColumn("d", value=self.calculated("d", lambda r: r.b + 1),
+                            depends_on=["b"]),
+            DataTableColumn("e", value=self.calculated("e", lambda r: r.c + 1),
+                            depends_on=["c"])
+        ])
+        self.assertEqual(sorted(self.built), list(range(5)))
+        self.assertEqual(dt.df.get(2, "d"), 5)
+        self.assertEqual(dt.df.get(2, "e"), 7)
+
+    def test_only_dependents_rerun(self):
+        dt = self.make_table([
+            DataTableColumn("d", value=self.calculated("d", lambda r: r.b + 1),
+                            depends_on="b"),
+            DataTableColumn("e", value=self.calculated("e", lambda r: r.d * 10),
+                            depends_on=["d"]),
+            DataTableColumn("f", value=self.calculated("f", lambda r: r.c + 1),
+                            depends_on=["c"])
+        ])
+        del self.calls[:]
+        dt.set_value(1, "b", 100)
+        self.assertEqual(self.calls, ["d", "e"])
+        self.assertEqual(dt.df.get(1, "d"), 101)
+        self.assertEqual(dt.df.get(1, "e"), 1010)
+
+    def test_unchanged_rows_not_recomputed(self):
+        dt = self.make_table([
+            DataTableColumn("d", value=self.calculated("d", lambda r: r.b + 1),
+                            depends_on=["b"])
+        ])
+        del self.calls[:]
+        for row in dt:
+            pass
+        self.assertEqual(self.calls, [])
+
+    def test_vectorized(self):
+        batches = []
+
+        def total(table, columns):
+            batches.append(len(columns.a))
+            return [b + c for b, c in zip(columns.b, columns.c)]
+
+        dt = self.make_table([
+            DataTableColumn("d", value=total, depends_on=["a", "b", "c"],
+                            vectorized=True)
+        ])
+        self.assertEqual(batches, [5])
+        self.assertEqual(dt.df.get(3, "d"), 15)
+        self.assertEqual(self.built, [])
+
+    def test_circular_dependency(self):
+        with self.assertRaises(ValueError):
+            self.make_table([
+                DataTableColumn("d", value=lambda t, r: r.e, depends_on=["e"]),
+                DataTableColumn("e", value=lambda t, r: r.d, depends_on=["d"])
+            ])
+
+
+@dataclass
+class DataClassRow:
+    a: int
+    b: int
+
+
+class TestDataTableRowObjects(unittest.TestCase):
+
+    def setUp(self):
+        self.data = [DataClassRow(i, i*2) for i in range(5)]
+
+    def test_dataclass_cached(self):
+        dt = DataTable([DataTableColumn("a"), DataTableColumn("b")],
+                       data=self.data, index="a")
+        dt.refresh()
+        row = dt.get_dataframe_row_object(1)
+        self.assertIsInstance(row, DataClassRow)
+        self.assertIs(dt.get_dataframe_row_object(1), row)
+        self.assertIs(type(dt.get_dataframe_row_object(2)), type(row))
+        dt.set_value(1, "b", 10)
+        row = dt.get_dataframe_row_object(1)
+        self.assertEqual(row.b, 10)
+
+    def test_cache_bounded(self):
+        dt = DataTable([DataTableColumn("a"), DataTableColumn("b")],
+                       data=self.data, index="a", row_object_cache_size=2)
+        dt.refresh()
+        for i in range(5):
+            dt.get_dataframe_row_object(i)
+        self.assertEqual(len(dt._row_objects), 2)
+
+    def test_row_views(self):
+        dt = DataTable([DataTableColumn("a"), DataTableColumn("b")],
+                       data=[dict(a=i, b=i*2) for i in range(5)], index="a",
+                       row_views=True)
+        dt.refresh()
+        row = dt.get_dataframe_row_object(3)
+        self.assertEqual((row.a, row["b"]), (3, 6))
+        dt.set_value(3, "b", 7)
+        self.assertEqual(row.b, 7)
+
+
+@unittest.skipUnless(HAVE_PONY, "pony not installed")
+class TestDataTablePonyEntities(unittest.TestCase):
+
+    def setUp(self):
+        db = pony.orm.Database()
+
+        class Item(db.Entity):
+            id = pony.orm.PrimaryKey(int)
+            name = pony.orm.Required(str)
+
+        db.bind(provider="sqlite", filename=":memory:")
+        db.generate_mapping(create_tables=True)
+        with pony.orm.db_session:
+            for i in range(20):
+                Item(id=i, name="item %d" %(i))
+
+        self.Item = Item
+        self.dt = DataTable(
+            [DataTableColumn("id"), DataTableColumn("name")],
+            data=[dict(id=i, name="item %d" %(i)) for i in range(20)], index="id"
+        )
+        self.dt.refresh()
+        for i in range(20):
+            self.dt.df.set(i, "_cls", Item)
+
+    def test_window_loaded(self):
+        entity = self.dt.get_dataframe_row_object(0)
+        self.assertEqual(entity.name, "item 0")
+        self.assertGreater(len(self.dt.entity_cache()[self.Item]), 1)
+
+    def test_batch_load(self):
+        self.dt.load_entities(self.dt.df.index)
+        entities = self.dt.entity_cache()[self.Item]
+        self.assertEqual(len(entities), 20)
+        self.assertIs(self.dt.get_dataframe_row_object(7), entities[(7,)])
+
+    def test_new_query_generation(self):
+        self.dt.load_entities(self.dt.df.index)
+        self.dt.requery()
+        self.assertEqual(self.dt.entity_cache(), {})
+
+
+class TestDataTableAsyncQuery(unittest.TestCase):
+
+    def make_table(self, query, **kwargs):
+
+        class AsyncTable(DataTable):
+
+            columns = [DataTableColumn("a"), DataTableColumn("b")]
+            index = "a"
+            async_query = True
+
+        AsyncTable.query = query
+        return AsyncTable(**kwargs)
+
+    def run_table(self, dt, *calls):
+        async def run():
+            for call in calls:
+                call()
+                await asyncio.sleep(0)
+            while dt.query_pending:
+                await dt._query_task
+        asyncio.run(run())
+
+    def test_coroutine_query(self):
+
+        async def query(self, **kwargs):
+            await asyncio.sleep(0)
+            return [dict(a=i, b="row %d" %(i)) for i in range(5)]
+
+        dt = self.make_table(query)
+        seen = []
+
+        def reset():
+            dt.reset()
+            seen.append((len(dt), dt._message_showing))
+
+        self.run_table(dt, reset)
+        self.assertEqual(seen, [(0, True)])
+        self.assertEqual(len(dt), 5)
+        self.assertFalse(dt._message_showing)
+
+    def test_thread_query(self):
+
+        def query(self, **kwargs):
+            return [dict(a=i, b="row %d" %(i)) for i in range(3)]
+
+        dt = self.make_table(query)
+        self.run_table(dt, dt.reset)
+        self.assertEqual([r.data.b for r in dt], ["row 0", "row 1", "row 2"])
+
+    def test_async_generator_query(self):
+
+        async def query(self, **kwargs):
+            for i in range(4):
+                yield dict(a=i, b="row %d" %(i))
+
+        dt = self.make_table(query)
+        self.run_table(dt, dt.reset)
+        self.assertEqual(len(dt), 4)
+
+    def test_superseded_query(self):
+
+        calls = []
+
+        async def query(self, sort=None, **kwargs):
+            calls.append(sort)
+            await asyncio.sleep(0.01 if len(calls) == 1 else 0)
+            return [dict(a=i, b=str(len(calls))) for i in range(2)]
+
+        dt = self.make_table(query)
+        tasks = []
+
+        def first():
+            dt.reset()
+            tasks.append(dt._query_task)
+
+        self.run_table(dt, first, dt.reset)
+        self.assertTrue(tasks[0].cancelled())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([r.data.b for r in dt], ["2", "2"])
+
+    def test_render_while_pending(self):
+
+        async def query(self, **kwargs):
+            await asyncio.sleep(0)
+            return [dict(a=i, b="row %d" %(i)) for i in range(5)]
+
+        dt = self.make_table(query)
+        seen = []
+
+        def refresh():
+            dt.focus_position = 3
+            dt.refresh()
+            canvas = dt.render((40, 5), focus=True)
+            seen.append((len(dt), dt._message_showing, canvas.rows()))
+
+        # the first render loads the table
+        self.run_table(dt, lambda: dt.render((40, 5), focus=True))
+        self.run_table(dt, refresh)
+        self.assertEqual(seen, [(0, True, 5)])
+        self.assertEqual(len(dt), 5)
+        self.assertEqual(dt.focus_position, 3)
+        self.assertFalse(dt._message_showing)
+
+
+class TestDataTablePrefetch(unittest.TestCase):
+
+    def make_table(self, count, **kwargs):
+
+        calls = self.calls = []
+
+        class PagedTable(DataTable):
+
+            columns = [DataTableColumn("a"), DataTableColumn("b")]
+            index = "a"
+            async_query = True
+
+            def query(self, offset=None, limit=None, **kwargs):
+                calls.append(offset)
+                offset = offset or 0
+                return [dict(a=i, b="row %d" %(i))
+                        for i in range(offset, min(offset+limit, count))]
+
+            def query_result_count(self):
+                return count
+
+        return PagedTable(**kwargs)
+
+    def render(self, dt, times=1):
+        async def run():
+            for i in range(times):
+                dt.render((40, 5))
+                # let a scheduled prefetch start, then wait for its query
+                await asyncio.sleep(0)
+                while dt.query_pending:
+                    await dt._query_task
+        asyncio.run(run())
+
+    def test_prefetch_pages(self):
+        dt = self.make_table(100, limit=10, prefetch=("pages", 1))
+        self.render(dt)
+        self.assertEqual(len(dt), 10)
+        self.render(dt)
+        self.assertEqual(len(dt), 20)
+        self.assertEqual(dt.focus_position, 0)
+        self.render(dt)
+        self.assertEqual(len(dt), 20)
+        self.assertEqual(self.calls, [0, 10])
+
+    def test_prefetch_rows(self):
+        dt = self.make_table(100, limit=10, prefetch=3)
+        self.render(dt, 2)
+        self.assertEqual(len(dt), 10)
+        dt.focus_position = 7
+        self.render(dt)
+        self.assertEqual(len(dt), 20)
+        self.assertEqual(dt.focus_position, 7)
+
+    def test_exhausted(self):
+        dt = self.make_table(15, limit=10, prefetch=("pages", 1))
+        self.render(dt, 4)
+        self.assertEqual(len(dt), 15)
+        self.assertEqual(self.calls, [0, 10])
+
+    def test_not_from_render(self):
+        dt = self.make_table(100, limit=10, prefetch=("pages", 1))
+        calls = []
+        urwid.connect_signal(dt.listbox, "prefetch", lambda focus: calls.append(focus))
+
+        async def run():
+            dt.render((40, 5))
+            while dt.query_pending:
+                await dt._query_task
+            dt.render((40, 5))
+            # the signal waits for the event loop rather than going out
+            # while the table is being drawn
+            self.assertEqual(calls, [])
+            await asyncio.sleep(0)
+            self.assertEqual(calls, [0])
+        asyncio.run(run())
+
+    def test_blocking_query(self):
+        dt = self.make_table(100, limit=10, prefetch=("pages", 1), async_query=False)
+        for i in range(3):
+            dt.render((40, 5))
+        self.assertEqual(self.calls, [0])
+
+
+class TestDataTableKeysetPagination(unittest.TestCase):
+
+    # ties in "b" so the index has to break them
+    ROWS = [dict(a=i, b=i // 3) for i in range(20)]
+
+    def make_table(self, start=None, **kwargs):
+
+        cursors = self.cursors = []
+        rows = self.ROWS
+
+        class KeysetTable(DataTable):
+
+            columns = [DataTableColumn("a"), DataTableColumn("b")]
+            index = "a"
+            limit = 5
+            query_sort = kwargs.pop("query_sort", True)
+
+            def query(self, sort=None, offset=None, limit=None, cursor=None, **kwargs):
+                cursors.append(cursor)
+                column, reverse = sort
+                column = column or "a"
+                if cursor is None:
+                    ordered = sorted(
+                        rows, key=lambda r: (r[column], r["a"]), reverse=bool(reverse)
+                    )
+                    return ordered[start or 0:][:limit]
+                return cursor.seek(rows, lambda r: (r[cursor.column], r["a"]), limit)
+
+            def query_result_count(self):
+                return len(rows)
+
+        return KeysetTable(sort_by=kwargs.pop("sort_by", "b"), **kwargs)
+
+    def values(self, dt):
+        return [r.data.a for r in dt]
+
+    def test_cursor(self):
+        cursor = DataTableCursor("b", 3, 7)
+        self.assertEqual(cursor.operator, ">")
+        self.assertTrue(cursor.follows(3, 8))
+        self.assertFalse(cursor.follows(3, 7))
+        # empty values sort last, as they do in the table
+        self.assertTrue(cursor.follows(None, 0))
+        backward = DataTableCursor("b", 3, 7, reverse=True, direction="backward")
+        self.assertEqual(backward.operator, ">")
+        self.assertFalse(backward.descending)
+
+    def test_forward_pages(self):
+        dt = self.make_table()
+        dt.reset()
+        dt.load_more(None)
+        dt.load_more(None)
+        self.assertEqual(self.values(dt), list(range(15)))
+        self.assertEqual(self.cursors[-1], DataTableCursor("b", 3, 9))
+        self.assertEqual(dt.pagination_cursor, DataTableCursor("b", 4, 14))
+
+    def test_reverse_pages(self):
+        dt = self.make_table(sort_by=("b", True))
+        dt.reset()
+        dt.load_more(None)
+        self.assertEqual(self.values(dt), list(range(19, 9, -1)))
+        self.assertTrue(dt.pagination_cursor.descending)
+
+    def test_backward_pages(self):
+        dt = self.make_table(start=10)
+        dt.reset()
+        self.assertEqual(self.values(dt), list(range(10, 15)))
+        dt.focus_position = 2
+        dt.load_previous()
+        self.assertEqual(self.cursors[-1].direction, "backward")
+        self.assertEqual(self.values(dt), list(range(5, 15)))
+        self.assertEqual(dt.selection.data.a, 12)
+        self.assertEqual(dt.pagination_start, DataTableCursor("b", 1, 5, direction="backward"))
+        self.assertEqual(dt.pagination_cursor.index, 14)
+
+    def test_cursor_after_unchanged_rows(self):
+        dt = self.make_table()
+        dt.reset()
+        # only the first row of the refetched page changed
+        dt.apply_query([dict(a=0, b=-1)] + self.ROWS[1:5], limit=5)
+        self.assertEqual(dt.pagination_cursor, DataTableCursor("b", 1, 4))
+
+    def test_cursor_without_query_sort(self):
+        dt = self.make_table(sort_by=("b", True), query_sort=False)
+        dt.reset()
+        dt.load_more(None)
+        # pages come back in index order, so the cursor seeks on the index
+        self.assertEqual(self.cursors[-1], DataTableCursor("a", 4, 4))
+        self.assertEqual(dt.pagination_cursor, DataTableCursor("a", 9, 9))
+        self.assertEqual(sorted(self.values(dt)), list(range(10)))
+
+    def test_cursor_hash(self):
+        cursors = {DataTableCursor("b", 3, 7), DataTableCursor("b", 3, 7)}
+        self.assertEqual(len(cursors), 1)
+        self.assertNotIn(DataTableCursor("b", 3, 7, direction="backward"), cursors)
+
+
+class TestDataTableIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.dt = DataTable(
+            [DataTableColumn("a"), DataTableColumn("b")],
+            data=[dict(a=i, b=i*10) for i in range(5)],
+            index="a", sort_by="b"
+        )
+        self.dt.reset(reset_sort=True)
+        self.modified = []
+        urwid.connect_signal(self.dt, "modified", lambda: self.modified.append(True))
+
+    def values(self):
+        return [r.data.b for r in self.dt]
+
+    def test_sorted_insert(self):
+        self.dt.focus_position = 2
+        del self.modified[:]
+        self.dt.ingest_rows([dict(a=10, b=15), dict(a=11, b=-1), dict(a=12, b=45)])
+        self.assertEqual(self.values(), [-1, 0, 10, 15, 20, 30, 40, 45])
+        self.assertEqual(len(self.modified), 1)
+        self.assertEqual(self.dt.selection.data.b, 20)
+
+    def test_sorted_insert_after_edit(self):
+        self.dt.set_value(0, "b", 0)
+        self.dt.ingest_rows([dict(a=10, b=15), dict(a=11, b=-1)])
+        self.assertEqual(self.values(), [-1, 0, 10, 15, 20, 30, 40])
+
+    def test_insert_uses_cached_keys(self):
+        full = []
+        sort_keys = self.dt.sort_keys
+        def counting(column, key=None, indexes=None):
+            if indexes is None:
+                full.append(column)
+            return sort_keys(column, key, indexes)
+        self.dt.sort_keys = counting
+        self.dt.ingest_rows([dict(a=10, b=20), dict(a=11, b=-1)])
+        self.assertEqual(self.values(), [-1, 0, 10, 20, 20, 30, 40])
+        self.assertEqual([r.data.a for r in self.dt][3:5], [2, 10])
+        self.assertEqual(full, [])
+
+    def test_insert_reversed(self):
+        self.dt.sort_by_column(("b", True))
+        self.dt.ingest_rows([dict(a=10, b=20), dict(a=11, b=50), dict(a=12, b=-1)])
+        self.assertEqual(self.values(), [50, 40, 30, 20, 20, 10, 0, -1])
+        self.assertEqual([r.data.a for r in self.dt][3:5], [2, 10])
+
+    def test_empty_message(self):
+        dt = DataTable([DataTableColumn("a")], data=[], index="a")
+        dt.render((20, 5))
+        self.assertTrue(dt._message_showing)
+        dt.ingest_rows([dict(a=1)])
+        self.assertFalse(dt._message_showing)
+        dt.delete_rows([1])
+        dt.add_row(dict(a=2))
+        self.assertFalse(dt._message_showing)
+
+    def test_upsert(self):
+        self.dt.ingest_rows([dict(a=0, b=35), dict(a=10, b=5)])
+        self.assertEqual(self.values(), [5, 10, 20, 30, 35, 40])
+
+    def test_retain_rows(self):
+        self.dt.retain_rows = 3
+        self.dt.ingest_rows([dict(a=10+i, b=i) for i in range(2)])
+        self.dt.ingest_rows([dict(a=20+i, b=100+i) for i in range(2)])
+        # the streamed row with b=0 is the oldest; the loaded one isn't streamed
+        self.assertEqual(self.values(), [0, 1, 10, 20, 30, 40, 100, 101])
+
+    def test_retain_seconds(self):
+        self.dt.retain_seconds = 60
+        self.dt.ingest_rows([dict(a=10, b=1), dict(a=11, b=2)])
+        self.dt._ingested[10] -= 120
+        self.assertEqual(self.dt.expire_rows(), [10])
+        self.assertEqual(self.values(), [0, 2, 10, 20, 30, 40])
+
+    def test_stream(self):
+
+        ingested = []
+        ingest_rows = self.dt.ingest_rows
+        def count(rows):
+            ingested.append(len(rows))
+            return ingest_rows(rows)
+        self.dt.ingest_rows = count
+
+        async def batches():
+            for i in range(3):
+                yield [dict(a=10+i, b=100+i)]
+
+        def sync_batches():
+            yield [dict(a=20, b=-5), dict(a=21, b=-6)]
+
+        async def run():
+            await self.dt.stream_rows(batches())
+            await self.dt.stream_rows(sync_batches())
+
+        asyncio.run(run())
+        self.assertEqual(ingested, [3, 2])
+        self.assertEqual(self.values(), [-6, -5, 0, 10, 20, 30, 40, 100, 101, 102])
+
+
+class TestDataTableCapacity(unittest.TestCase):
+
+    def setUp(self):
+        self.dt = DataTable(
+            [DataTableColumn("a"), DataTableColumn("b", footer_fn="sum")],
+            data=[], index="a", sort_by="a", capacity=5, with_footer=True
+        )
+        self.dt.reset(reset_sort=True)
+
+    def values(self):
+        return [r.data.a for r in self.dt]
+
+    def test_evict(self):
+        self.dt.ingest_rows([dict(a=i, b=1) for i in range(4)])
+        self.dt.focus_position = 3
+        self.dt.ingest_rows([dict(a=i, b=1) for i in range(4, 7)])
+        self.assertEqual(self.values(), [2, 3, 4, 5, 6])
+        self.assertEqual(self.dt.selection.data.a, 3)
+        self.assertEqual(self.dt.index_to_position(6), 4)
+        self.assertEqual(self.dt.get_aggregate(self.dt.column_named("b")).value, 5)
+        self.assertNotIn(0, self.dt._row_versions)
+
+    def test_add_row(self):
+        for i in range(8):
+            self.dt.add_row(dict(a=i, b=i))
+        self.assertEqual(self.values(), [3, 4, 5, 6, 7])
+        self.dt.apply_filters(Field("b") > 4)
+        self.assertEqual(self.values(), [5, 6, 7])
+        self.dt.add_row(dict(a=8, b=8))
+        self.dt.add_row(dict(a=9, b=0))
+        self.assertEqual(self.values(), [5, 6, 7, 8])
+        self.assertEqual(self.dt.index_to_position(8), 3)
+
+    def test_large_batch(self):
+        self.dt.ingest_rows([dict(a=i, b=1) for i in range(3)])
+        self.dt.apply_filters(Field("a") > 0)
+        self.dt.ingest_rows([dict(a=i, b=1) for i in range(3, 43)])
+        self.assertEqual(self.values(), [38, 39, 40, 41, 42])
+        self.assertEqual(self.dt.index_to_position(42), 4)
+
+    def test_dataframe_class(self):
+        self.assertIsInstance(self.dt.df, RingBufferDataFrame)
+        with self.assertRaises(ValueError):
+            DataTable(
+                [DataTableColumn("a")], data=[], index="a",
+                capacity=5, dataframe_class=ColumnarDataFrame
+            )
+
+
+class TestDataTableMapped(unittest.TestCase):
+
+    def setUp(self):
+        self.dt = DataTable(
+            [DataTableColumn("a"), DataTableColumn("b"), DataTableColumn("c")],
+            data=[dict(a=i, b=i % 4, c="row %d" %(i)) for i in range(20)],
+            index="a"
+        )
+        self.dt.reset()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.dt.save(self.path, format="mapped")
+        self.mapped = DataTable(
+            [DataTableColumn("a"), DataTableColumn("b"), DataTableColumn("c")],
+            index="a"
+        )
+        self.mapped.load(self.path)
+
+    def tearDown(self):
+        self.mapped.df.close()
+        os.unlink(self.path)
+
+    def test_load(self):
+        self.assertIsInstance(self.mapped.df, MappedDataFrame)
+        self.assertEqual(len(self.mapped), 20)
+        self.assertEqual(self.mapped[5].data.c, "row 5")
+
+    def test_sort_and_filter(self):
+        self.mapped.sort_by_column(("b", True))
+        self.assertEqual([r.data.b for r in self.mapped][:5], [3] * 5)
+        self.mapped.apply_filters(Field("b") == 0)
+        self.assertEqual([r.data.a for r in self.mapped], [0, 4, 8, 12, 16])
+
+    def test_load_keeps_sort_and_filters(self):
+        self.mapped.sort_by_column(("b", True))
+        self.mapped.apply_filters(Field("b") < 2)
+        self.mapped.load(self.path)
+        self.assertEqual(
+            [r.data.a for r in self.mapped],
+            [1, 5, 9, 13, 17, 0, 4, 8, 12, 16]
+        )
+
+    def test_edit(self):
+        self.mapped.set_value(3, "c", "changed")
+        self.mapped.add_row(dict(a=20, b=0, c="added"))
+        self.assertEqual(self.mapped.df.get(3, "c"), "changed")
+        self.assertEqual(len(self.mapped), 21)
+        self.mapped.save(self.path, format="mapped")
+        self.mapped.load(self.path)
+        self.assertEqual(self.mapped.df.get(3, "c"), "changed")
+        self.assertEqual(self.mapped.df.get(20, "c"), "added")
+
+
+class TestDataTableSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = [DataTableColumn("a"), DataTableColumn("b"), DataTableColumn("c")]
+        self.dt = DataTable(
+            self.columns,
+            data=[dict(a=i, b=i % 4, c="r\u00f6w %d" %(i) if i % 5 else None) for i in range(20)],
+            index="a"
+        )
+        self.dt.reset()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def restored(self, **kwargs):
+        self.dt.save(self.path, format="snapshot", **kwargs)
+        dt = DataTable(
+            [DataTableColumn("a"), DataTableColumn("b"), DataTableColumn("c")],
+            index="a"
+        )
+        dt.load(self.path)
+        return dt
+
+    def test_round_trip(self):
+        for compress in (False, True):
+            dt = self.restored(compress=compress)
+            self.assertEqual(len(dt), 20)
+            self.assertEqual(dt.df.get(7, "c"), "r\u00f6w 7")
+            self.assertEqual(dt.df.get(5, "c"), None)
+            self.assertIsNone(dt.df.get(7, "_details"))
+
+    def test_state(self):
+        self.dt.sort_by_column(("b", True))
+        self.dt.apply_filters(Field("b") >= 2)
+        self.dt.focus_position = self.dt.index_to_position(10)
+        dt = self.restored()
+        self.assertEqual(dt.sort_by, ("b", True))
+        self.assertEqual(dt.filtered_rows, self.dt.filtered_rows)
+        self.assertEqual(dt.selection.data.a, 10)
+        dt.add_row(dict(a=20, b=0))
+        dt.add_row(dict(a=21, b=3))
+        self.assertNotIn(20, dt.filtered_rows)
+        self.assertEqual(dt.filtered_rows[:6], [3, 7, 11, 15, 19, 21])
+
+    def test_callable_filter(self):
+        self.dt.apply_filters(lambda row: row["a"] % 2)
+        with self.assertLogs("panwid.datatable", "WARNING"):
+            dt = self.restored()
+        self.assertEqual(dt.filtered_rows, list(range(1, 20, 2)))
+        # the saved rows stand in for the filter, so later rows don't match
+        dt.add_row(dict(a=20, b=0))
+        dt.add_row(dict(a=21, b=1))
+        self.assertEqual(dt.filtered_rows, list(range(1, 20, 2)))
@@ -0,0 +1,92 @@
+import unittest
+
+from panwid.datatable import *
+
+class TestFilterExpressions(unittest.TestCase):
+
+    dataframe_class = DataTableDataFrame
+
+    def setUp(self):
+
+        self.data = [
+            dict(a=1, b=2.345, c="foo"),
+            dict(a=2, b=None, c="Bar"),
+            dict(a=3, b=-3.19, c=None)
+        ]
+        self.dt = DataTable(
+            [DataTableColumn("a"), DataTableColumn("b"), DataTableColumn("c")],
+            data=self.data, index="a", dataframe_class=self.dataframe_class
+        )
+        self.dt.refresh()
+
+    def assertFilter(self, expr, expected):
+        self.dt.apply_filters(expr)
+        self.assertEqual(self.dt.filtered_rows, expected)
+        self.assertEqual(
+            [row["a"] for row in self.dt.df.iterrows() if expr(row)],
+            expected
+        )
+
+    def test_compare(self):
+        self.assertFilter(Field("b") > 0, [1])
+        self.assertFilter(Field("b") != None, [1, 3])
+        self.assertFilter(Field("c") == "foo", [1])
+
+    def test_in(self):
+        self.assertFilter(Field("a").isin([1, 3]), [1, 3])
+        self.assertFilter(Field("c").isin(["foo", None]), [1, 3])
+
+    def test_contains(self):
+        self.assertFilter(Field("c").contains("bar"), [])
+        self.assertFilter(Field("c").contains("bar", case=False), [2])
+
+    def test_between(self):
+        self.assertFilter(Field("b").between(-5, 0), [3])
+        self.assertFilter(Field("b").between(low=0), [1])
+
+    def test_regex(self):
+        self.assertFilter(Field("c").matches("^[fB]"), [1, 2])
+
+    def test_combinators(self):
+        self.assertFilter((Field("a") > 1) & (Field("b") != None), [3])
+        self.assertFilter((Field("a") == 1) | Field("c").contains("a"), [1, 2])
+        self.assertFilter(~Field("a").isin([1, 3]), [2])
+
+    def test_null_logic(self):
+        # as in SQL, comparing with null is unknown, and so is its negation
+        self.assertFilter(Field("b") != 1, [1, 3])
+        self.assertFilter(~(Field("b") > 0), [3])
+        self.assertFilter(~(Field("b") < None), [])
+        self.assertFilter(~Field("c").contains("o"), [2])
+        self.assertFilter(~((Field("b") > 0) | (Field("a") == 2)), [3])
+        self.assertFilter(~((Field("b") > 0) & (Field("a") == 2)), [1, 3])
+        self.assertFilter(~((Field("b") > 0) & (Field("a") == 1)), [2, 3])
+        self.assertFilter(~~(Field("b") < 0), [3])
+
+    def test_mixed_with_callable(self):
+        self.dt.apply_filters([Field("a") > 1, lambda row: row["c"] is not None])
+        self.assertEqual(self.dt.filtered_rows, [2])
+
+    def test_add_row(self):
+        self.dt.apply_filters(Field("b") > 0)
+        self.dt.add_row(dict(a=4, b=1.0, c="qux"))
+        self.assertEqual(self.dt.filtered_rows, [1, 4])
+
+    def test_to_sql(self):
+        expr = (Field("a") >= 2) & (Field("b").isin([1, None]) | ~Field("c").contains("x"))
+        self.assertEqual(
+            expr.to_sql(),
+            ('("a" >= ? AND (("b" IN (?) OR "b" IS NULL) OR NOT ("c" LIKE ? ESCAPE \'\\\')))',
+             [2, 1, "%x%"])
+        )
+
+    def test_to_dict(self):
+        expr = (Field("a") >= 2) & (Field("c").matches("^B") | ~Field("b").between(0, 1))
+        restored = FilterExpression.from_dict(expr.to_dict())
+        self.assertEqual(restored.to_sql(), expr.to_sql())
+        self.assertFilter(restored, [2, 3])
+
+
+class TestColumnarFilterExpressions(TestFilterExpressions):
+
+    dataframe_class = ColumnarDataFrame
@@ -0,0 +1,98 @@
+import unittest
+
+from panwid.datatable import *
+from panwid.datatable.lookups import *
+
+class TestLookups(unittest.TestCase):
+
+    def fill(self, lookup, values):
+        for i, v in enumerate(values):
+            lookup.set(i, v)
+        return lookup
+
+    def test_hash(self):
+        lookup = self.fill(Lookup(), ["a", "b", "a", None, [1]])
+        self.assertEqual(lookup.get("a"), [0, 2])
+        self.assertEqual(lookup.get(None), [3])
+        self.assertEqual(lookup.get("c"), [])
+        self.assertEqual(lookup.counts(), {"a": 2, "b": 1, None: 1})
+        lookup.set(0, "b")
+        lookup.discard(2)
+        self.assertEqual(lookup.counts(), {"b": 2, None: 1})
+
+    def test_sorted(self):
+        lookup = self.fill(SortedLookup(), [5, 1, 3, None, 3, 8])
+        self.assertEqual(lookup.range(2, 5), [2, 4, 0])
+        self.assertEqual(lookup.range(low=3, low_inclusive=False), [0, 5])
+        self.assertEqual(lookup.range(high=3, high_inclusive=False), [1])
+        lookup.discard(2)
+        lookup.set(4, 9)
+        self.assertEqual(lookup.range(low=3), [0, 5, 4])
+        self.assertEqual(lookup.keys, [1, 5, 8, 9])
+
+    def test_unordered(self):
+        lookup = self.fill(SortedLookup(), [1, "a"])
+        self.assertEqual(lookup.get("a"), [1])
+        with self.assertRaises(TypeError):
+            lookup.range(0)
+
+
+class TestDataTableLookups(unittest.TestCase):
+
+    def setUp(self):
+        self.dt = DataTable(
+            [
+                DataTableColumn("a"),
+                DataTableColumn("host", lookup="hash"),
+                DataTableColumn("load")
+            ],
+            data=[dict(a=i, host="host%d" %(i % 3), load=i * 10) for i in range(10)],
+            index="a"
+        )
+        self.dt.refresh()
+        self.dt.create_lookup("load", "sorted")
+
+    def test_find_rows(self):
+        self.assertEqual(self.dt.find_rows("host", "host1"), [1, 4, 7])
+        self.assertEqual(self.dt.find_rows("load", 30), [3])
+        # columns without a lookup are scanned
+        self.dt.drop_lookup("load")
+        self.assertEqual(self.dt.find_rows("load", 30), [3])
+
+    def test_mutations(self):
+        self.dt.get_lookup("host")
+        self.dt.set_value(0, "host", "host1")
+        self.dt.add_row(dict(a=10, host="host1", load=0))
+        self.dt.delete_rows([4])
+        self.assertEqual(self.dt.find_rows("host", "host1"), [0, 1, 7, 10])
+        self.assertEqual(self.dt.facets("host"), {"host1": 4, "host2": 3, "host0": 3})
+        self.assertEqual(sorted(self.dt.get_lookup("load").range(high=10)), [0, 1, 10])
+
+    def test_filters(self):
+        self.assertEqual(self.dt.lookup_filter(Field("load") > 70), {8, 9})
+        self.assertIsNone(self.dt.lookup_filter(Field("a") < 5))
+        self.dt.apply_filters([Field("host") == "host1", Field("load") >= 40])
+        self.assertEqual(self.dt.filtered_rows, [4, 7])
+        self.dt.apply_filters(Field("host").isin(["host0", "host2"]) & (Field("a") < 5))
+        self.assertEqual(self.dt.filtered_rows, [0, 2, 3])
+        self.dt.apply_filters(Field("load").between(20, 50) | (Field("host") == "host0"))
+        self.assertEqual(self.dt.filtered_rows, [0, 2, 3, 4, 5, 6, 9])
+        self.assertEqual(self.dt.facets("host", filtered=True), {"host0": 4, "host2": 2, "host1": 1})
+
+    def test_find_next(self):
+        self.dt.focus_position = 1
+        self.assertEqual(self.dt.find_next("host", "host1"), 4)
+        self.assertEqual(self.dt.find_next("host", "host1"), 7)
+        self.assertEqual(self.dt.find_next("host", "host1"), 1)
+        self.assertEqual(self.dt.find_next("host", "host1", reverse=True), 7)
+        self.assertIsNone(self.dt.find_next("host", "nope"))
+        self.dt.select_value("host", "host2")
+        self.assertEqual(self.dt.focus_position, 2)
+        with self.assertRaises(ValueError):
+            self.dt.select_value("host", "nope")
+
+    def test_requery(self):
+        self.dt.get_lookup("host")
+        self.dt.data = [dict(a=i, host="x", load=1) for i in range(4)]
+        self.dt.requery()
+        self.assertEqual(self.dt.facets("host"), {"x": 4})